@@ -4,16 +4,73 @@ Mobileアプリのサービス層
 QRコードペアリングのセッション管理とデバイス接続処理を提供する
 """
 
+import asyncio
 import json
 import logging
+import time
+import weakref
 from typing import Optional
 
 import redis
+import redis.asyncio as aioredis
 from django.conf import settings
 
 logger = logging.getLogger(__name__)
 
 
+class ValidatedSessionCache:
+    """
+    検証済みセッションIDのプロセス内キャッシュ
+
+    有効と確認されたセッションIDを短時間だけ保持し、
+    再接続が集中した場合のRedisへの問い合わせを減らす。
+    無効の結果はキャッシュしない（直後に作成されるセッションを拒否しないため）。
+    """
+
+    def __init__(self, ttl: float, max_size: int = 10000):
+        """
+        Args:
+            ttl: キャッシュの有効期限（秒）。0の場合はキャッシュしない
+            max_size: 保持するセッションIDの最大数
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+        self._expires_at = {}
+
+    def __contains__(self, session_id: str) -> bool:
+        expires_at = self._expires_at.get(session_id)
+        if expires_at is None:
+            return False
+        if expires_at < time.monotonic():
+            del self._expires_at[session_id]
+            return False
+        return True
+
+    def add(self, session_id: str):
+        """セッションIDを検証済みとして記録する"""
+        if not self.ttl:
+            return
+        if len(self._expires_at) >= self.max_size:
+            self._evict_expired()
+            if len(self._expires_at) >= self.max_size:
+                # 最も古いエントリを破棄
+                del self._expires_at[next(iter(self._expires_at))]
+        self._expires_at[session_id] = time.monotonic() + self.ttl
+
+    def discard(self, session_id: str):
+        """セッションIDをキャッシュから削除する"""
+        self._expires_at.pop(session_id, None)
+
+    def _evict_expired(self):
+        """期限切れのエントリを削除する"""
+        now = time.monotonic()
+        self._expires_at = {
+            session_id: expires_at
+            for session_id, expires_at in self._expires_at.items()
+            if expires_at >= now
+        }
+
+
 class PairingSessionManager:
     """
     ペアリングセッション管理クラス
@@ -25,13 +82,35 @@ class PairingSessionManager:
     # Redisキーのプレフィックス
     SESSION_KEY_PREFIX = "pairing_session:"
     DEVICE_KEY_PREFIX = "paired_device:"
+    # ユーザーごとのセッションの索引（ソート済みセット、スコアは作成時刻）
+    USER_SESSIONS_KEY_PREFIX = "pairing_user_sessions:"
+    # 最新セッションの取得で一度に読む索引の件数
+    USER_SESSIONS_WINDOW = 5
 
     # セッション有効期限（秒）
     SESSION_EXPIRY = 300  # 5分
 
+    # 検証済みセッションのキャッシュ有効期限（秒）
+    VALIDATION_CACHE_TTL = 10
+
     def __init__(self):
         """Redis接続を初期化する"""
         self.redis_client = redis.from_url(settings.REDIS_URL, decode_responses=True)
+        # 非同期クライアントはイベントループごとに作成する
+        self._async_clients = weakref.WeakKeyDictionary()
+        self.validation_cache = ValidatedSessionCache(
+            getattr(settings, "PAIRING_SESSION_CACHE_TTL", self.VALIDATION_CACHE_TTL)
+        )
+
+    @property
+    def async_redis_client(self):
+        """実行中のイベントループ用の非同期Redisクライアント"""
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = aioredis.from_url(settings.REDIS_URL, decode_responses=True)
+            self._async_clients[loop] = client
+        return client
 
     def create_session(self, user_id: int, session_id: str) -> bool:
         """
@@ -56,8 +135,12 @@ class PairingSessionManager:
                 "created_at": self._get_current_timestamp(),
             }
 
-            # Redisにセッションデータを保存
-            self.redis_client.setex(key, self.SESSION_EXPIRY, json.dumps(session_data))
+            # セッションデータの保存とユーザーごとの索引への登録を
+            # 1回のトランザクションで行う
+            pipe = self.redis_client.pipeline(transaction=True)
+            pipe.setex(key, self.SESSION_EXPIRY, json.dumps(session_data))
+            self._queue_index(pipe, user_id, session_id)
+            pipe.execute()
 
             logger.info(
                 f"ペアリングセッション作成: user_id={user_id}, session_id={session_id}"
@@ -105,6 +188,42 @@ class PairingSessionManager:
             )
             return False
 
+    async def avalidate_session(self, session_id: str) -> bool:
+        """
+        セッションIDを非同期で検証する
+
+        WebSocket接続時に使用する。スレッドプールを経由せずに
+        redis.asyncio で検証し、有効なセッションIDは短時間キャッシュする。
+
+        Args:
+            session_id: 検証するセッションID
+
+        Returns:
+            有効なセッションの場合はTrue、無効な場合はFalse
+        """
+        if session_id in self.validation_cache:
+            return True
+
+        try:
+            key = f"{self.SESSION_KEY_PREFIX}{session_id}"
+            exists = await self.async_redis_client.exists(key)
+
+            if exists:
+                self.validation_cache.add(session_id)
+                logger.debug(f"セッション検証成功: session_id={session_id}")
+            else:
+                logger.warning(f"セッション無効または期限切れ: session_id={session_id}")
+
+            return bool(exists)
+
+        except Exception:
+            logger.error(
+                f"セッション検証エラー: session_id={session_id}",
+                exc_info=True,
+                extra={"session_id": session_id},
+            )
+            return False
+
     def get_session(self, session_id: str) -> Optional[dict]:
         """
         セッション情報を取得する
@@ -237,8 +356,18 @@ class PairingSessionManager:
             session_key = f"{self.SESSION_KEY_PREFIX}{session_id}"
             device_key = f"{self.DEVICE_KEY_PREFIX}{session_id}"
 
-            # セッションとデバイス情報を削除
-            self.redis_client.delete(session_key, device_key)
+            def delete(pipe):
+                # セッションの所有者を読み、索引からの削除も同じトランザクションで行う
+                data = pipe.get(session_key)
+                pipe.multi()
+                pipe.delete(session_key, device_key)
+                if data:
+                    user_id = json.loads(data)["user_id"]
+                    pipe.zrem(f"{self.USER_SESSIONS_KEY_PREFIX}{user_id}", session_id)
+
+            # セッションとデバイス情報を削除（読んだ後にセッションが変わった場合は再試行）
+            self.redis_client.transaction(delete, session_key)
+            self.validation_cache.discard(session_id)
 
             logger.info(f"セッション削除: session_id={session_id}")
             return True
@@ -261,6 +390,10 @@ class PairingSessionManager:
         Returns:
             最新のセッション情報の辞書、存在しない場合はNone
 
+        Note:
+            - ユーザーごとの索引（作成時刻順）から新しい順に USER_SESSIONS_WINDOW 件ずつ
+              取得するため、全セッションは走査しない
+
         Returns例:
             {
                 'session_id': 'uuid-string',
@@ -270,26 +403,44 @@ class PairingSessionManager:
             }
         """
         try:
-            # Redisでセッションキーをスキャン
-            pattern = f"{self.SESSION_KEY_PREFIX}*"
-            latest_session = None
-            latest_timestamp = None
+            index_key = f"{self.USER_SESSIONS_KEY_PREFIX}{user_id}"
 
-            for key in self.redis_client.scan_iter(match=pattern):
-                data = self.redis_client.get(key)
-                if data:
-                    session = json.loads(data)
-                    if session.get("user_id") == user_id:
-                        session_id = key.replace(self.SESSION_KEY_PREFIX, "")
-                        session["session_id"] = session_id
-
-                        # 最新のセッションを探す
-                        if latest_timestamp is None or session.get("created_at", "") > latest_timestamp:
-                            latest_session = session
-                            latest_timestamp = session.get("created_at", "")
+            latest_session = None
+            while latest_session is None:
+                # 期限切れのセッションを索引から除き、新しい順にIDを取得する
+                pipe = self.redis_client.pipeline(transaction=False)
+                pipe.zremrangebyscore(
+                    index_key, "-inf", time.time() - self.SESSION_EXPIRY
+                )
+                pipe.zrevrange(index_key, 0, self.USER_SESSIONS_WINDOW - 1)
+                session_ids = pipe.execute()[1]
+                if not session_ids:
+                    break
+
+                keys = [f"{self.SESSION_KEY_PREFIX}{sid}" for sid in session_ids]
+                values = self.redis_client.mget(keys)
+                # 削除済みのセッションは読み飛ばし、索引からも除く
+                stale = []
+                for session_id, data in zip(session_ids, values):
+                    if data is None:
+                        stale.append(session_id)
+                        continue
+                    latest_session = json.loads(data)
+                    latest_session["session_id"] = session_id
+                    break
+                if stale:
+                    self.redis_client.zrem(index_key, *stale)
+                if (
+                    latest_session is None
+                    and len(session_ids) < self.USER_SESSIONS_WINDOW
+                ):
+                    break
 
             if latest_session:
-                logger.debug(f"最新セッション取得: user_id={user_id}, session_id={latest_session.get('session_id')}")
+                logger.debug(
+                    f"最新セッション取得: user_id={user_id}, "
+                    f"session_id={latest_session['session_id']}"
+                )
             else:
                 logger.debug(f"有効なセッションなし: user_id={user_id}")
 
@@ -303,6 +454,21 @@ class PairingSessionManager:
             )
             return None
 
+    def _queue_index(self, pipe, user_id: int, session_id: str):
+        """
+        セッションをユーザーごとの索引に登録するコマンドをパイプラインに追加する
+
+        索引はセッションの作成時刻をスコアにしたソート済みセットで、
+        期限切れのセッションは登録・取得のたびにスコアで取り除く。
+        索引自体もセッションと同じ有効期限で消える。
+        """
+        index_key = f"{self.USER_SESSIONS_KEY_PREFIX}{user_id}"
+        now = time.time()
+
+        pipe.zadd(index_key, {session_id: now})
+        pipe.zremrangebyscore(index_key, "-inf", now - self.SESSION_EXPIRY)
+        pipe.expire(index_key, self.SESSION_EXPIRY)
+
     def _get_current_timestamp(self) -> str:
         """
         現在のタイムスタンプをISO形式で取得する
@@ -0,0 +1,580 @@
+"""
+モバイルコントローラーのセッション状態
+
+HTTPポーリング（mobile_poll / mobile_command）で共有する状態
+（現在のコード、練習中かどうかなど）をセッションIDごとに保存する。
+
+- RedisSessionStateStore: Redisのハッシュで保存する（本番用、ワーカー間で共有）
+- InMemorySessionStateStore: プロセス内でLRUと有効期限付きで保存する（開発・テスト用）
+
+状態の有効期限はペアリングセッションと同じ（PairingSessionManager.SESSION_EXPIRY）で、
+書き込みのたびに設定し直す。RedisSessionStateStore ではペアリングセッションの
+残り時間を上限にし、ペアリングセッションより長く状態が残らないようにする。
+
+カメラフレームはJSONの状態に含めず、バイナリのまま最新の1枚だけをフレームIDと
+一緒に保存する。フレームの保存では状態のバージョンを変えず、ロングポーリングや
+SSEをフレームごとに起こさない。スマートフォンはフレームIDをETagにして画像を取得する。
+フレームを取得しているスマートフォンがいるセッションは amark_frame_viewer で
+FRAME_VIEWER_TTL 秒の間記録し、GuitarConsumer はその間だけフレームを保存する。
+
+状態には書き込みのたびに増えるバージョンがあり、ロングポーリングでは
+wait_for_change でクライアントの知っているバージョンから変わるまで待つ。
+待機はイベントループ上で行い、ワーカーのスレッドを占有しない。
+
+設定例:
+    MOBILE_STATE_STORE = {
+        "BACKEND": "apps.mobile.state.RedisSessionStateStore",
+        "OPTIONS": {"ttl": 300},
+    }
+"""
+
+import asyncio
+import itertools
+import json
+import logging
+import secrets
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from typing import Optional
+
+import redis
+import redis.asyncio as aioredis
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .services import PairingSessionManager
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STATE_STORE = {"BACKEND": "apps.mobile.state.RedisSessionStateStore"}
+
+# 状態の有効期限（秒、ペアリングセッションと同じ）
+DEFAULT_STATE_TTL = PairingSessionManager.SESSION_EXPIRY
+
+# 変更通知を取りこぼした場合に備えて状態を読み直す間隔（秒）
+RECHECK_INTERVAL = 5.0
+
+# カメラフレームを取得しているスマートフォンを記録しておく時間（秒）
+FRAME_VIEWER_TTL = 10
+
+
+def new_frame_id() -> str:
+    """カメラフレームのID（ETagに使う）を生成する"""
+    return secrets.token_hex(8)
+
+
+class ChangeWaiters:
+    """
+    状態の変更を待つイベントの登録先
+
+    待機側はイベントループ上の asyncio.Event を登録し、書き込み側は
+    任意のスレッドから notify で通知する（同期ビューからの書き込みに対応）。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._events = {}
+
+    def add(self, session_id: str) -> asyncio.Event:
+        event = asyncio.Event()
+        entry = (asyncio.get_running_loop(), event)
+        with self._lock:
+            self._events.setdefault(session_id, set()).add(entry)
+        return event
+
+    def discard(self, session_id: str, event: asyncio.Event):
+        with self._lock:
+            entries = self._events.get(session_id, set())
+            entries.difference_update({entry for entry in entries if entry[1] is event})
+            if not entries:
+                self._events.pop(session_id, None)
+
+    def notify(self, session_id: str):
+        with self._lock:
+            entries = list(self._events.get(session_id, ()))
+        for loop, event in entries:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # イベントループが終了している
+                pass
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(entries) for entries in self._events.values())
+
+
+class SessionStateStore:
+    """セッション状態の保存先の基底クラス"""
+
+    def __init__(self, ttl: float = DEFAULT_STATE_TTL):
+        self.ttl = ttl
+        self.waiters = ChangeWaiters()
+
+    def get(self, session_id: str) -> dict:
+        """セッションの状態を返す（ない場合は空の辞書）"""
+        raise NotImplementedError
+
+    def update(self, session_id: str, fields: dict) -> int:
+        """
+        セッションの状態の項目をまとめて設定し、有効期限を延長する
+
+        Returns:
+            書き込み後のバージョン
+        """
+        raise NotImplementedError
+
+    def delete(self, session_id: str):
+        """セッションの状態を削除する"""
+        raise NotImplementedError
+
+    async def aset_frame(self, session_id: str, data: bytes) -> str:
+        """
+        カメラフレームを保存する（状態のバージョンは変えない）
+
+        Returns:
+            フレームID
+        """
+        raise NotImplementedError
+
+    async def amark_frame_viewer(self, session_id: str):
+        """カメラフレームを取得しているスマートフォンがいることを記録する"""
+        raise NotImplementedError
+
+    async def ahas_frame_viewer(self, session_id: str) -> bool:
+        """FRAME_VIEWER_TTL 秒以内にカメラフレームを取得しようとしたスマートフォンがいるか"""
+        raise NotImplementedError
+
+    async def aget_frame_id(self, session_id: str) -> Optional[str]:
+        """保存されているカメラフレームのIDを返す（ない場合はNone）"""
+        raise NotImplementedError
+
+    async def aget_frame(self, session_id: str) -> Optional[tuple]:
+        """
+        保存されているカメラフレームを返す
+
+        Returns:
+            (フレームID, 画像データ)。ない場合はNone
+        """
+        raise NotImplementedError
+
+    async def aget_versioned(self, session_id: str) -> tuple:
+        """
+        セッションの状態とバージョンを非同期で返す
+
+        Returns:
+            (状態, バージョン)。状態がない場合は ({}, 0)
+        """
+        raise NotImplementedError
+
+    async def listen(self, session_id: str):
+        """
+        他のワーカーからの session_id の変更通知の受信を開始する
+        （受信準備ができるまで待つ）
+        """
+
+    def unlisten(self, session_id: str):
+        """listen で開始した変更通知の受信を終了する"""
+
+    async def wait_for_change(
+        self, session_id: str, version: int, timeout: float
+    ) -> tuple:
+        """
+        セッションの状態のバージョンが version から変わるまで待つ
+
+        Args:
+            session_id: セッションID
+            version: クライアントが知っているバージョン
+            timeout: 最大待機時間（秒）
+
+        Returns:
+            (状態, バージョン)。タイムアウトした場合は変わっていない状態を返す
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        event = self.waiters.add(session_id)
+        try:
+            await self.listen(session_id)
+            while True:
+                # 読み直す前にクリアし、読み直しの間の通知を取りこぼさない
+                event.clear()
+                state, current = await self.aget_versioned(session_id)
+                remaining = deadline - loop.time()
+                if current != version or remaining <= 0:
+                    return state, current
+                try:
+                    await asyncio.wait_for(
+                        event.wait(), min(remaining, RECHECK_INTERVAL)
+                    )
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self.waiters.discard(session_id, event)
+            self.unlisten(session_id)
+
+
+class InMemorySessionStateStore(SessionStateStore):
+    """
+    プロセス内で保存するセッション状態（開発・テスト用）
+
+    max_size を超えると最も長く使われていないセッションから破棄する。
+    ワーカー間では共有されないため、複数ワーカーでは RedisSessionStateStore を使う。
+    バージョンはストア全体で増え続ける番号で、破棄後に作り直した状態でも重複しない。
+    """
+
+    def __init__(self, ttl: float = DEFAULT_STATE_TTL, max_size: int = 1000):
+        super().__init__(ttl)
+        self.max_size = max_size
+        self._states = OrderedDict()
+        self._frames = OrderedDict()
+        self._frame_viewers = {}
+        self._versions = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _get_entry(self, session_id):
+        entry = self._states.get(session_id)
+        if entry is None:
+            return {}, 0
+        state, expires_at, version = entry
+        if expires_at < time.monotonic():
+            del self._states[session_id]
+            return {}, 0
+        self._states.move_to_end(session_id)
+        return dict(state), version
+
+    def get(self, session_id):
+        with self._lock:
+            return self._get_entry(session_id)[0]
+
+    def _update_entry(self, session_id, fields):
+        state, _ = self._get_entry(session_id)
+        state.update(fields)
+        version = next(self._versions)
+        self._states[session_id] = (state, time.monotonic() + self.ttl, version)
+        self._states.move_to_end(session_id)
+        while len(self._states) > self.max_size:
+            self._states.popitem(last=False)
+        return version
+
+    def update(self, session_id, fields):
+        with self._lock:
+            version = self._update_entry(session_id, fields)
+        self.waiters.notify(session_id)
+        return version
+
+    def delete(self, session_id):
+        with self._lock:
+            self._states.pop(session_id, None)
+            self._frames.pop(session_id, None)
+            self._frame_viewers.pop(session_id, None)
+
+    async def aset_frame(self, session_id, data):
+        frame_id = new_frame_id()
+        with self._lock:
+            self._frames[session_id] = (
+                frame_id,
+                bytes(data),
+                time.monotonic() + self.ttl,
+            )
+            self._frames.move_to_end(session_id)
+            while len(self._frames) > self.max_size:
+                self._frames.popitem(last=False)
+        return frame_id
+
+    async def amark_frame_viewer(self, session_id):
+        with self._lock:
+            self._frame_viewers[session_id] = time.monotonic() + FRAME_VIEWER_TTL
+            if len(self._frame_viewers) > self.max_size:
+                now = time.monotonic()
+                for viewer, expires_at in list(self._frame_viewers.items()):
+                    if expires_at < now:
+                        del self._frame_viewers[viewer]
+
+    async def ahas_frame_viewer(self, session_id):
+        with self._lock:
+            expires_at = self._frame_viewers.get(session_id)
+        return expires_at is not None and expires_at >= time.monotonic()
+
+    async def aget_frame_id(self, session_id):
+        frame = await self.aget_frame(session_id)
+        return frame[0] if frame else None
+
+    async def aget_frame(self, session_id):
+        with self._lock:
+            frame = self._frames.get(session_id)
+        if frame is None or frame[2] < time.monotonic():
+            return None
+        return frame[:2]
+
+    async def aget_versioned(self, session_id):
+        with self._lock:
+            return self._get_entry(session_id)
+
+    def __len__(self):
+        return len(self._states)
+
+
+# 状態（とカメラフレーム）の有効期限を、ペアリングセッションの残り時間を上限に設定する
+# （ペアリングセッションが見つからない場合は上限なし）
+# KEYS[1]: ペアリングセッション, KEYS[2..]: 有効期限を設定するキー
+# ARGV[1]: 有効期限（ミリ秒）
+EXPIRE_LUA = """
+local ttl = tonumber(ARGV[1])
+local remaining = redis.call('PTTL', KEYS[1])
+if remaining > 0 and remaining < ttl then
+    ttl = remaining
+end
+for i = 2, #KEYS do
+    redis.call('PEXPIRE', KEYS[i], ttl)
+end
+return ttl
+"""
+
+
+class ChangeListener:
+    """
+    ワーカー（イベントループ）ごとの変更通知の購読
+
+    1つの接続でセッションごとのチャネルを購読し、待機中のリクエストがある
+    セッションだけを購読する（購読数は参照カウントで管理する）。受信した
+    通知は notify でそのワーカーの待機中のリクエストに配る。
+    """
+
+    def __init__(self, pubsub, prefix: str, notify):
+        self.pubsub = pubsub
+        self.prefix = prefix
+        self.notify = notify
+        self.counts = {}
+        self.task = None
+        self.closed = False
+
+    async def subscribe(self, session_id: str):
+        count = self.counts.get(session_id, 0)
+        self.counts[session_id] = count + 1
+        if count == 0:
+            try:
+                await self.pubsub.subscribe(f"{self.prefix}{session_id}")
+            except Exception:
+                self.closed = True
+                await self.pubsub.aclose()
+                raise
+        if self.task is None:
+            self.task = asyncio.ensure_future(self._receive())
+
+    def unsubscribe(self, session_id: str):
+        count = self.counts.get(session_id)
+        if count is None:
+            return
+        if count > 1:
+            self.counts[session_id] = count - 1
+            return
+        del self.counts[session_id]
+        if not self.closed:
+            asyncio.ensure_future(self._unsubscribe(session_id))
+
+    async def _unsubscribe(self, session_id):
+        # 解除までの間に再び待機が始まった場合は購読を続ける
+        if session_id in self.counts or self.closed:
+            return
+        try:
+            await self.pubsub.unsubscribe(f"{self.prefix}{session_id}")
+        except Exception:
+            logger.error("状態の変更通知の購読解除エラー", exc_info=True)
+
+    async def _receive(self):
+        """変更通知を受信し、このワーカーで待機中のリクエストに配る"""
+        try:
+            while True:
+                message = await self.pubsub.get_message(
+                    ignore_subscribe_messages=True, timeout=RECHECK_INTERVAL
+                )
+                if message is not None and message["type"] == "message":
+                    self.notify(message["channel"][len(self.prefix) :])
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # 次の wait_for_change で購読し直す（その間は定期的な読み直しで補う）
+            logger.error("状態の変更通知の受信エラー", exc_info=True)
+        finally:
+            self.closed = True
+            await self.pubsub.aclose()
+
+
+class RedisSessionStateStore(SessionStateStore):
+    """
+    Redisのハッシュで保存するセッション状態
+
+    セッションごとに1つのハッシュ（mobile_state:<セッションID>）を使い、
+    項目の値はJSONで保存する。書き込みはHSET・バージョンのHINCRBY・
+    有効期限の設定（ペアリングセッションの残り時間が上限）・変更通知の
+    PUBLISHを1回のパイプラインで送る。
+
+    変更通知はセッションごとのチャネル（mobile_state_changed:<セッションID>）に
+    送る。ワーカー（イベントループ）ごとに1つの接続で、待機中のリクエストが
+    あるセッションのチャネルだけを購読し、そのワーカーで待機中のリクエストに配る。
+
+    カメラフレームは別のハッシュ（mobile_frame:<セッションID>）にIDと画像データを
+    バイナリのまま保存する。状態のハッシュとバージョンには触れず、変更通知も送らない。
+    フレームを取得しているスマートフォンは mobile_frame_viewers:<セッションID> に
+    有効期限付きで記録する。
+    """
+
+    KEY_PREFIX = "mobile_state:"
+    FRAME_KEY_PREFIX = "mobile_frame:"
+    FRAME_VIEWER_KEY_PREFIX = "mobile_frame_viewers:"
+    VERSION_FIELD = "_version"
+    CHANGE_CHANNEL_PREFIX = "mobile_state_changed:"
+
+    def __init__(self, ttl: float = DEFAULT_STATE_TTL, url: Optional[str] = None):
+        super().__init__(ttl)
+        self.url = url or settings.REDIS_URL
+        self._client = None
+        self._async_clients = weakref.WeakKeyDictionary()
+        self._async_binary_clients = weakref.WeakKeyDictionary()
+        self._listeners = weakref.WeakKeyDictionary()
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = redis.from_url(self.url, decode_responses=True)
+        return self._client
+
+    def _loop_client(self, clients, **options):
+        loop = asyncio.get_running_loop()
+        client = clients.get(loop)
+        if client is None:
+            client = aioredis.from_url(self.url, **options)
+            clients[loop] = client
+        return client
+
+    @property
+    def async_client(self):
+        """実行中のイベントループ用の非同期Redisクライアント"""
+        return self._loop_client(self._async_clients, decode_responses=True)
+
+    @property
+    def async_binary_client(self):
+        """実行中のイベントループ用のカメラフレーム用非同期Redisクライアント"""
+        return self._loop_client(self._async_binary_clients)
+
+    def _key(self, session_id):
+        return f"{self.KEY_PREFIX}{session_id}"
+
+    def _frame_key(self, session_id):
+        return f"{self.FRAME_KEY_PREFIX}{session_id}"
+
+    def _frame_viewer_key(self, session_id):
+        return f"{self.FRAME_VIEWER_KEY_PREFIX}{session_id}"
+
+    def _decode(self, values):
+        version = int(values.pop(self.VERSION_FIELD, 0))
+        state = {field: json.loads(value) for field, value in values.items()}
+        return state, version
+
+    def get(self, session_id):
+        return self._decode(self.client.hgetall(self._key(session_id)))[0]
+
+    def _queue_expire(self, pipe, session_id, key):
+        pipe.eval(
+            EXPIRE_LUA,
+            2,
+            f"{PairingSessionManager.SESSION_KEY_PREFIX}{session_id}",
+            key,
+            int(self.ttl * 1000),
+        )
+
+    def _queue_update(self, pipe, session_id, fields):
+        key = self._key(session_id)
+        pipe.hset(
+            key, mapping={field: json.dumps(value) for field, value in fields.items()}
+        )
+        pipe.hincrby(key, self.VERSION_FIELD, 1)
+        self._queue_expire(pipe, session_id, key)
+        pipe.publish(f"{self.CHANGE_CHANNEL_PREFIX}{session_id}", session_id)
+
+    def update(self, session_id, fields):
+        if not fields:
+            return None
+        pipe = self.client.pipeline(transaction=False)
+        self._queue_update(pipe, session_id, fields)
+        # 結果の2番目がHINCRBY後のバージョン
+        return pipe.execute()[1]
+
+    def delete(self, session_id):
+        self.client.delete(
+            self._key(session_id),
+            self._frame_key(session_id),
+            self._frame_viewer_key(session_id),
+        )
+
+    async def aset_frame(self, session_id, data):
+        frame_id = new_frame_id()
+        key = self._frame_key(session_id)
+        pipe = self.async_binary_client.pipeline(transaction=True)
+        pipe.hset(key, mapping={"id": frame_id, "data": bytes(data)})
+        self._queue_expire(pipe, session_id, key)
+        await pipe.execute()
+        return frame_id
+
+    async def amark_frame_viewer(self, session_id):
+        await self.async_client.set(
+            self._frame_viewer_key(session_id), 1, ex=FRAME_VIEWER_TTL
+        )
+
+    async def ahas_frame_viewer(self, session_id):
+        return bool(await self.async_client.exists(self._frame_viewer_key(session_id)))
+
+    async def aget_frame_id(self, session_id):
+        frame_id = await self.async_binary_client.hget(
+            self._frame_key(session_id), "id"
+        )
+        return frame_id.decode() if frame_id else None
+
+    async def aget_frame(self, session_id):
+        frame_id, data = await self.async_binary_client.hmget(
+            self._frame_key(session_id), ["id", "data"]
+        )
+        if frame_id is None or data is None:
+            return None
+        return frame_id.decode(), data
+
+    async def aget_versioned(self, session_id):
+        return self._decode(await self.async_client.hgetall(self._key(session_id)))
+
+    async def listen(self, session_id):
+        loop = asyncio.get_running_loop()
+        listener = self._listeners.get(loop)
+        if listener is None or listener.closed:
+            listener = ChangeListener(
+                self.async_client.pubsub(),
+                self.CHANGE_CHANNEL_PREFIX,
+                self.waiters.notify,
+            )
+            self._listeners[loop] = listener
+        await listener.subscribe(session_id)
+
+    def unlisten(self, session_id):
+        listener = self._listeners.get(asyncio.get_running_loop())
+        if listener is not None:
+            listener.unsubscribe(session_id)
+
+
+_state_store = None
+
+
+def get_session_state_store() -> SessionStateStore:
+    """設定（MOBILE_STATE_STORE）に従ってセッション状態の保存先を返す"""
+    global _state_store
+    if _state_store is None:
+        config = getattr(settings, "MOBILE_STATE_STORE", DEFAULT_STATE_STORE)
+        store_class = import_string(config["BACKEND"])
+        _state_store = store_class(**config.get("OPTIONS", {}))
+    return _state_store
+
+
+def set_session_state_store(store: Optional[SessionStateStore]):
+    """セッション状態の保存先を差し替える（Noneで設定から再作成）"""
+    global _state_store
+    _state_store = store
@@ -1,18 +1,30 @@
 """
 Mobileアプリのテスト
 
-QRコード生成、ペアリングセッション管理、モバイルコントローラーのテスト
+QRコード生成、ペアリングセッション管理、セッション状態、モバイルコントローラーのテスト
 """
 
+import asyncio
 import json
+import time
 import uuid
-from unittest.mock import Mock, patch
+from unittest.mock import AsyncMock, Mock, patch
 
-from django.test import Client, TestCase
+from asgiref.sync import async_to_sync
+
+from django.test import AsyncClient, Client, TestCase
 from django.urls import reverse
 
 from apps.users.models import User
 from .services import PairingSessionManager
+from apps.mobile.state import (
+    EXPIRE_LUA,
+    FRAME_VIEWER_TTL,
+    ChangeListener,
+    InMemorySessionStateStore,
+    RedisSessionStateStore,
+    set_session_state_store,
+)
 
 
 class PairingSessionManagerTest(TestCase):
@@ -37,18 +49,19 @@ class PairingSessionManagerTest(TestCase):
 
     def test_create_session(self):
         """セッション作成のテスト"""
-        # Redisのモックを設定
-        self.mock_redis_client.setex.return_value = True
+        pipe = self.mock_redis_client.pipeline.return_value
 
         # セッションを作成
         result = self.manager.create_session(self.user_id, self.session_id)
 
-        # 検証
+        # 検証（保存と索引への登録が1回のトランザクションで送られる）
         self.assertTrue(result)
-        self.mock_redis_client.setex.assert_called_once()
+        self.mock_redis_client.pipeline.assert_called_once_with(transaction=True)
+        pipe.setex.assert_called_once()
+        pipe.execute.assert_called_once()
 
         # 呼び出し引数を確認
-        call_args = self.mock_redis_client.setex.call_args
+        call_args = pipe.setex.call_args
         key = call_args[0][0]
         self.assertIn(self.session_id, key)
         self.assertEqual(call_args[0][1], 300)  # SESSION_EXPIRY
@@ -145,15 +158,154 @@ class PairingSessionManagerTest(TestCase):
 
     def test_delete_session(self):
         """セッション削除のテスト"""
-        # Redisのモックを設定
-        self.mock_redis_client.delete.return_value = 2  # 削除されたキーの数
+        # Redisのモックを設定（transaction は渡された関数をパイプラインで実行する）
+        pipe = Mock()
+        pipe.get.return_value = json.dumps({"user_id": self.user_id})
+        self.mock_redis_client.transaction.side_effect = lambda func, *keys: func(pipe)
 
         # 削除
         result = self.manager.delete_session(self.session_id)
 
-        # 検証
+        # 検証（所有者の索引からの削除も同じトランザクションで行う）
         self.assertTrue(result)
-        self.mock_redis_client.delete.assert_called_once()
+        session_key = f"pairing_session:{self.session_id}"
+        self.mock_redis_client.transaction.assert_called_once()
+        self.assertEqual(
+            self.mock_redis_client.transaction.call_args.args[1], session_key
+        )
+        pipe.get.assert_called_once_with(session_key)
+        pipe.multi.assert_called_once()
+        pipe.delete.assert_called_once_with(
+            session_key, f"paired_device:{self.session_id}"
+        )
+        pipe.zrem.assert_called_once_with("pairing_user_sessions:1", self.session_id)
+
+    def test_create_session_indexes_user(self):
+        """セッション作成時にユーザーごとの索引に登録されるテスト"""
+        pipe = self.mock_redis_client.pipeline.return_value
+
+        with patch("apps.mobile.services.time.time", return_value=1000.0):
+            self.manager.create_session(self.user_id, self.session_id)
+
+        pipe.zadd.assert_called_once_with(
+            "pairing_user_sessions:1", {self.session_id: 1000.0}
+        )
+        pipe.zremrangebyscore.assert_called_once_with(
+            "pairing_user_sessions:1", "-inf", 700.0
+        )
+        pipe.expire.assert_called_once_with("pairing_user_sessions:1", 300)
+
+    def test_get_user_latest_session_uses_index(self):
+        """最新セッションが索引から取得され、全キーを走査しないテスト"""
+        pipe = self.mock_redis_client.pipeline.return_value
+        pipe.execute.return_value = [0, ["newest", "older"]]
+        self.mock_redis_client.mget.return_value = [
+            json.dumps({"user_id": 1, "status": "waiting"}),
+            json.dumps({"user_id": 1, "status": "paired"}),
+        ]
+
+        session = self.manager.get_user_latest_session(self.user_id)
+
+        self.assertEqual(
+            session, {"user_id": 1, "status": "waiting", "session_id": "newest"}
+        )
+        pipe.zrevrange.assert_called_once_with("pairing_user_sessions:1", 0, 4)
+        self.mock_redis_client.mget.assert_called_once_with(
+            ["pairing_session:newest", "pairing_session:older"]
+        )
+        self.mock_redis_client.scan_iter.assert_not_called()
+        self.mock_redis_client.zrem.assert_not_called()
+
+    def test_get_user_latest_session_skips_deleted(self):
+        """削除済みのセッションが読み飛ばされ、索引から除かれるテスト"""
+        pipe = self.mock_redis_client.pipeline.return_value
+        pipe.execute.return_value = [0, ["deleted", "live"]]
+        self.mock_redis_client.mget.return_value = [
+            None,
+            json.dumps({"user_id": 1, "status": "waiting"}),
+        ]
+
+        session = self.manager.get_user_latest_session(self.user_id)
+
+        self.assertEqual(session["session_id"], "live")
+        self.mock_redis_client.zrem.assert_called_once_with(
+            "pairing_user_sessions:1", "deleted"
+        )
+
+    def test_get_user_latest_session_reads_next_window(self):
+        """読んだ範囲がすべて削除済みの場合に次の範囲を読むテスト"""
+        pipe = self.mock_redis_client.pipeline.return_value
+        deleted = [f"deleted-{i}" for i in range(5)]
+        pipe.execute.side_effect = [[0, deleted], [0, ["live"]]]
+        self.mock_redis_client.mget.side_effect = [
+            [None] * 5,
+            [json.dumps({"user_id": 1, "status": "waiting"})],
+        ]
+
+        session = self.manager.get_user_latest_session(self.user_id)
+
+        self.assertEqual(session["session_id"], "live")
+        self.mock_redis_client.zrem.assert_called_once_with(
+            "pairing_user_sessions:1", *deleted
+        )
+        self.assertEqual(self.mock_redis_client.mget.call_count, 2)
+
+    def test_get_user_latest_session_without_sessions(self):
+        """セッションがない場合にNoneが返されるテスト"""
+        pipe = self.mock_redis_client.pipeline.return_value
+        pipe.execute.return_value = [0, []]
+
+        self.assertIsNone(self.manager.get_user_latest_session(self.user_id))
+        self.mock_redis_client.mget.assert_not_called()
+
+
+class AsyncSessionValidationTest(TestCase):
+    """非同期セッション検証とキャッシュのテスト"""
+
+    def setUp(self):
+        """テストセットアップ"""
+        self.session_id = str(uuid.uuid4())
+
+        self.redis_patcher = patch("apps.mobile.services.redis.from_url")
+        self.redis_patcher.start()
+
+        # 非同期Redisクライアントをモック
+        self.aioredis_patcher = patch("apps.mobile.services.aioredis.from_url")
+        self.mock_aioredis_from_url = self.aioredis_patcher.start()
+        self.mock_async_client = Mock()
+        self.mock_async_client.exists = AsyncMock(return_value=1)
+        self.mock_aioredis_from_url.return_value = self.mock_async_client
+
+        self.manager = PairingSessionManager()
+
+    def tearDown(self):
+        """テスト終了処理"""
+        self.redis_patcher.stop()
+        self.aioredis_patcher.stop()
+
+    async def test_valid_session_is_cached(self):
+        """有効なセッションが2回目以降キャッシュから返されるテスト"""
+        self.assertTrue(await self.manager.avalidate_session(self.session_id))
+        self.assertTrue(await self.manager.avalidate_session(self.session_id))
+
+        self.mock_async_client.exists.assert_awaited_once()
+
+    async def test_invalid_session_is_not_cached(self):
+        """無効なセッションはキャッシュされないテスト"""
+        self.mock_async_client.exists.return_value = 0
+
+        self.assertFalse(await self.manager.avalidate_session(self.session_id))
+        self.assertFalse(await self.manager.avalidate_session(self.session_id))
+
+        self.assertEqual(self.mock_async_client.exists.await_count, 2)
+
+    async def test_delete_session_clears_cache(self):
+        """セッション削除でキャッシュが破棄されるテスト"""
+        await self.manager.avalidate_session(self.session_id)
+        self.manager.delete_session(self.session_id)
+
+        self.mock_async_client.exists.return_value = 0
+        self.assertFalse(await self.manager.avalidate_session(self.session_id))
 
 
 class QRCodeViewTest(TestCase):
@@ -379,3 +531,557 @@ class MobileControllerWebSocketTest(TestCase):
         # 検証
         self.assertContains(response, "viewport")
         self.assertContains(response, "user-scalable=no")
+
+
+# テスト用のJPEG（先頭のマジックナンバーのみ）
+JPEG = b"\xff\xd8\xff\xe0frame"
+
+
+class InMemorySessionStateStoreTest(TestCase):
+    """InMemorySessionStateStoreのテスト"""
+
+    def test_update_merges_fields(self):
+        """項目が既存の状態に統合されるテスト"""
+        store = InMemorySessionStateStore()
+
+        store.update("session", {"current_chord": "C", "is_practice": False})
+        store.update("session", {"is_practice": True})
+
+        self.assertEqual(
+            store.get("session"), {"current_chord": "C", "is_practice": True}
+        )
+
+    def test_least_recently_used_session_is_evicted(self):
+        """上限を超えると最も長く使われていないセッションが破棄されるテスト"""
+        store = InMemorySessionStateStore(max_size=2)
+
+        store.update("a", {"current_chord": "C"})
+        store.update("b", {"current_chord": "G"})
+        store.get("a")
+        store.update("c", {"current_chord": "Am"})
+
+        self.assertEqual(len(store), 2)
+        self.assertEqual(store.get("b"), {})
+        self.assertEqual(store.get("a"), {"current_chord": "C"})
+
+    def test_expired_state_is_removed(self):
+        """有効期限を過ぎた状態が削除されるテスト"""
+        store = InMemorySessionStateStore(ttl=300)
+
+        with patch("apps.mobile.state.time.monotonic", return_value=0.0):
+            store.update("session", {"current_chord": "C"})
+        with patch("apps.mobile.state.time.monotonic", return_value=301.0):
+            self.assertEqual(store.get("session"), {})
+
+        self.assertEqual(len(store), 0)
+
+    def test_update_increments_version(self):
+        """書き込みのたびにバージョンが増えるテスト"""
+        store = InMemorySessionStateStore()
+
+        first = store.update("a", {"current_chord": "C"})
+        second = store.update("b", {"current_chord": "G"})
+        third = store.update("a", {"is_practice": True})
+
+        self.assertLess(first, second)
+        self.assertLess(second, third)
+
+    async def test_wait_returns_immediately_when_version_differs(self):
+        """クライアントのバージョンが古い場合はすぐに返るテスト"""
+        store = InMemorySessionStateStore()
+        version = store.update("session", {"current_chord": "C"})
+
+        state, current = await store.wait_for_change("session", 0, timeout=5)
+
+        self.assertEqual(state, {"current_chord": "C"})
+        self.assertEqual(current, version)
+        self.assertEqual(len(store.waiters), 0)
+
+    async def test_wait_is_woken_by_update_from_another_thread(self):
+        """別スレッドからの書き込みで待機中のリクエストが起きるテスト"""
+        store = InMemorySessionStateStore()
+        version = store.update("session", {"current_chord": "C"})
+
+        waiter = asyncio.ensure_future(
+            store.wait_for_change("session", version, timeout=5)
+        )
+        await asyncio.sleep(0.01)
+        self.assertFalse(waiter.done())
+
+        await asyncio.to_thread(store.update, "session", {"current_chord": "G"})
+        state, current = await asyncio.wait_for(waiter, 1)
+
+        self.assertEqual(state, {"current_chord": "G"})
+        self.assertGreater(current, version)
+
+    async def test_wait_times_out_with_unchanged_state(self):
+        """変更がない場合はタイムアウトで同じバージョンを返すテスト"""
+        store = InMemorySessionStateStore()
+        version = store.update("session", {"current_chord": "C"})
+
+        state, current = await store.wait_for_change("session", version, timeout=0.05)
+
+        self.assertEqual(state, {"current_chord": "C"})
+        self.assertEqual(current, version)
+        self.assertEqual(len(store.waiters), 0)
+
+    async def test_frame_is_stored_without_changing_state(self):
+        """カメラフレームが保存され、状態とバージョンは変わらないテスト"""
+        store = InMemorySessionStateStore()
+        version = store.update("session", {"current_chord": "C"})
+
+        frame_id = await store.aset_frame("session", JPEG)
+        state, current = await store.aget_versioned("session")
+
+        self.assertEqual(state, {"current_chord": "C"})
+        self.assertEqual(current, version)
+        self.assertEqual(await store.aget_frame("session"), (frame_id, JPEG))
+        self.assertEqual(await store.aget_frame_id("session"), frame_id)
+
+        store.delete("session")
+        self.assertIsNone(await store.aget_frame("session"))
+
+    async def test_frame_viewer_expires(self):
+        """フレームの取得者の記録が FRAME_VIEWER_TTL 秒で消えるテスト"""
+        store = InMemorySessionStateStore()
+        self.assertFalse(await store.ahas_frame_viewer("session"))
+
+        await store.amark_frame_viewer("session")
+        self.assertTrue(await store.ahas_frame_viewer("session"))
+
+        with patch(
+            "apps.mobile.state.time.monotonic",
+            return_value=time.monotonic() + FRAME_VIEWER_TTL + 1,
+        ):
+            self.assertFalse(await store.ahas_frame_viewer("session"))
+
+
+class RedisSessionStateStoreTest(TestCase):
+    """RedisSessionStateStoreのテスト"""
+
+    def setUp(self):
+        """テストセットアップ"""
+        self.redis_patcher = patch("apps.mobile.state.redis.from_url")
+        self.mock_redis_client = self.redis_patcher.start().return_value
+        self.store = RedisSessionStateStore(ttl=300)
+
+    def tearDown(self):
+        """テスト終了処理"""
+        self.redis_patcher.stop()
+
+    def test_update_is_pipelined_with_ttl(self):
+        """HSETと有効期限の設定が1回のパイプラインで送られるテスト"""
+        pipe = self.mock_redis_client.pipeline.return_value
+
+        self.store.update("session", {"current_chord": "C", "is_practice": True})
+
+        pipe.hset.assert_called_once_with(
+            "mobile_state:session",
+            mapping={"current_chord": '"C"', "is_practice": "true"},
+        )
+        # 有効期限はペアリングセッションの残り時間を上限に設定する
+        pipe.eval.assert_called_once_with(
+            EXPIRE_LUA,
+            2,
+            "pairing_session:session",
+            "mobile_state:session",
+            300000,
+        )
+        pipe.expire.assert_not_called()
+        pipe.execute.assert_called_once()
+
+    def test_update_increments_version_and_publishes(self):
+        """書き込みでバージョンが増え、変更が通知されるテスト"""
+        pipe = self.mock_redis_client.pipeline.return_value
+        pipe.execute.return_value = [1, 7, True, 1]
+
+        version = self.store.update("session", {"current_chord": "C"})
+
+        self.assertEqual(version, 7)
+        pipe.hincrby.assert_called_once_with("mobile_state:session", "_version", 1)
+        pipe.publish.assert_called_once_with("mobile_state_changed:session", "session")
+
+    async def test_aset_frame_leaves_state_version(self):
+        """カメラフレームが状態のバージョンと変更通知に触れずに書き込まれるテスト"""
+        with patch("apps.mobile.state.aioredis.from_url") as from_url:
+            pipe = from_url.return_value.pipeline.return_value
+            pipe.execute = AsyncMock()
+
+            frame_id = await self.store.aset_frame("session", JPEG)
+
+        from_url.return_value.pipeline.assert_called_once_with(transaction=True)
+        pipe.hset.assert_called_once_with(
+            "mobile_frame:session", mapping={"id": frame_id, "data": JPEG}
+        )
+        pipe.eval.assert_called_once_with(
+            EXPIRE_LUA,
+            2,
+            "pairing_session:session",
+            "mobile_frame:session",
+            300000,
+        )
+        pipe.hincrby.assert_not_called()
+        pipe.publish.assert_not_called()
+        pipe.execute.assert_awaited_once()
+
+    async def test_frame_viewer_is_set_with_ttl(self):
+        """フレームの取得者が有効期限付きのキーで記録されるテスト"""
+        with patch("apps.mobile.state.aioredis.from_url") as from_url:
+            client = from_url.return_value
+            client.set = AsyncMock()
+            client.exists = AsyncMock(return_value=1)
+
+            await self.store.amark_frame_viewer("session")
+            self.assertTrue(await self.store.ahas_frame_viewer("session"))
+
+        client.set.assert_awaited_once_with(
+            "mobile_frame_viewers:session", 1, ex=FRAME_VIEWER_TTL
+        )
+        client.exists.assert_awaited_once_with("mobile_frame_viewers:session")
+
+    def test_get_decodes_fields(self):
+        """HGETALLの値がデコードされるテスト"""
+        self.mock_redis_client.hgetall.return_value = {
+            "current_chord": "null",
+            "is_practice": "false",
+            "timestamp": "1700000000",
+        }
+
+        self.assertEqual(
+            self.store.get("session"),
+            {"current_chord": None, "is_practice": False, "timestamp": 1700000000},
+        )
+        self.mock_redis_client.hgetall.assert_called_once_with("mobile_state:session")
+
+    def test_version_is_not_part_of_state(self):
+        """バージョンの項目が状態に含まれないテスト"""
+        self.mock_redis_client.hgetall.return_value = {
+            "current_chord": '"C"',
+            "_version": "3",
+        }
+
+        self.assertEqual(self.store.get("session"), {"current_chord": "C"})
+
+
+class ChangeListenerTest(TestCase):
+    """変更通知の購読のテスト"""
+
+    def _listener(self, messages=()):
+        pubsub = Mock()
+        pubsub.subscribe = AsyncMock()
+        pubsub.unsubscribe = AsyncMock()
+        pubsub.aclose = AsyncMock()
+        pending = list(messages)
+
+        async def get_message(**kwargs):
+            if pending:
+                return pending.pop(0)
+            await asyncio.sleep(0.01)
+
+        pubsub.get_message = get_message
+        notified = []
+        listener = ChangeListener(pubsub, "mobile_state_changed:", notified.append)
+        return listener, pubsub, notified
+
+    async def test_only_waited_sessions_are_subscribed(self):
+        """待機中のセッションのチャネルだけが購読されるテスト"""
+        listener, pubsub, _ = self._listener()
+
+        await listener.subscribe("a")
+        await listener.subscribe("a")
+        await listener.subscribe("b")
+        pubsub.subscribe.assert_any_await("mobile_state_changed:a")
+        pubsub.subscribe.assert_any_await("mobile_state_changed:b")
+        self.assertEqual(pubsub.subscribe.await_count, 2)
+
+        listener.unsubscribe("a")
+        listener.unsubscribe("b")
+        await asyncio.sleep(0)
+        pubsub.unsubscribe.assert_awaited_once_with("mobile_state_changed:b")
+
+        listener.unsubscribe("a")
+        await asyncio.sleep(0)
+        pubsub.unsubscribe.assert_awaited_with("mobile_state_changed:a")
+
+        listener.task.cancel()
+
+    async def test_message_notifies_session(self):
+        """セッションのチャネルの通知が待機中のリクエストに配られるテスト"""
+        listener, _, notified = self._listener(
+            [{"type": "message", "channel": "mobile_state_changed:a", "data": "a"}]
+        )
+
+        await listener.subscribe("a")
+        await asyncio.sleep(0.02)
+
+        self.assertEqual(notified, ["a"])
+        listener.task.cancel()
+
+
+class MobilePollingViewTest(TestCase):
+    """HTTPポーリングAPIのテスト"""
+
+    def setUp(self):
+        """テストセットアップ"""
+        self.client = Client()
+        self.session_id = str(uuid.uuid4())
+        set_session_state_store(InMemorySessionStateStore())
+
+        self.manager_patcher = patch("apps.mobile.views.pairing_manager")
+        self.mock_manager = self.manager_patcher.start()
+        self.mock_manager.validate_session.return_value = True
+        self.mock_manager.avalidate_session = AsyncMock(return_value=True)
+
+    def tearDown(self):
+        """テスト終了処理"""
+        self.manager_patcher.stop()
+        set_session_state_store(None)
+
+    def _post(self, name, payload, **headers):
+        return self.client.post(
+            reverse(name),
+            data=json.dumps(payload),
+            content_type="application/json",
+            **headers,
+        )
+
+    def test_command_is_visible_to_poll(self):
+        """コマンドで設定した状態がポーリングで取得できるテスト"""
+        response = self._post(
+            "mobile:mobile_command",
+            {
+                "session_id": self.session_id,
+                "command": "chord_change",
+                "params": {"chord": "Am"},
+            },
+            HTTP_X_TIMESTAMP="1700000000",
+        )
+        self.assertEqual(response.status_code, 200)
+
+        response = self._post("mobile:mobile_poll", {"session_id": self.session_id})
+
+        self.assertEqual(
+            response.json(),
+            {
+                "current_chord": "Am",
+                "is_practice": False,
+                "timestamp": 1700000000,
+                "version": 1,
+            },
+        )
+
+    def _command(self, chord):
+        return self._post(
+            "mobile:mobile_command",
+            {
+                "session_id": self.session_id,
+                "command": "chord_change",
+                "params": {"chord": chord},
+            },
+        )
+
+    async def test_long_poll_returns_on_change(self):
+        """ロングポーリングが状態の変更で応答するテスト"""
+        client = AsyncClient()
+        await asyncio.to_thread(self._command, "C")
+
+        poll = asyncio.ensure_future(
+            client.post(
+                reverse("mobile:mobile_poll"),
+                data=json.dumps(
+                    {"session_id": self.session_id, "version": 1, "wait": 5}
+                ),
+                content_type="application/json",
+            )
+        )
+        await asyncio.sleep(0.05)
+        self.assertFalse(poll.done())
+
+        await asyncio.to_thread(self._command, "G")
+        response = await asyncio.wait_for(poll, 2)
+
+        self.assertEqual(response.json()["current_chord"], "G")
+        self.assertEqual(response.json()["version"], 2)
+
+    def test_long_poll_times_out_with_same_version(self):
+        """変更がない場合は待機時間の経過後に同じバージョンを返すテスト"""
+        self._command("C")
+
+        with self.settings(MOBILE_POLL_MAX_WAIT=0.05):
+            response = self._post(
+                "mobile:mobile_poll",
+                {"session_id": self.session_id, "version": 1, "wait": 30},
+            )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["version"], 1)
+
+    def test_invalid_version_is_rejected(self):
+        """バージョンが整数でない場合にエラーになるテスト"""
+        response = self._post(
+            "mobile:mobile_poll",
+            {"session_id": self.session_id, "version": "1", "wait": 5},
+        )
+
+        self.assertEqual(response.status_code, 400)
+
+
+class MobileStreamViewTest(TestCase):
+    """Server-Sent Events APIのテスト"""
+
+    def setUp(self):
+        """テストセットアップ"""
+        self.session_id = str(uuid.uuid4())
+        self.store = InMemorySessionStateStore()
+        set_session_state_store(self.store)
+
+        self.manager_patcher = patch("apps.mobile.views.pairing_manager")
+        self.mock_manager = self.manager_patcher.start()
+        self.mock_manager.avalidate_session = AsyncMock(return_value=True)
+
+    def tearDown(self):
+        """テスト終了処理"""
+        self.manager_patcher.stop()
+        set_session_state_store(None)
+
+    async def _open(self, headers=None):
+        response = await AsyncClient().get(
+            reverse("mobile:mobile_stream"),
+            {"session_id": self.session_id},
+            headers=headers,
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        events = aiter(response.streaming_content)
+        self.assertEqual(await anext(events), b"retry: 3000\n\n")
+        return events
+
+    async def _next_event(self, events):
+        return (await asyncio.wait_for(anext(events), 2)).decode()
+
+    async def test_state_changes_are_streamed(self):
+        """現在の状態と、その後の変更がイベントとして届くテスト"""
+        version = self.store.update(self.session_id, {"current_chord": "C"})
+        events = await self._open()
+
+        event = await self._next_event(events)
+        self.assertTrue(event.startswith(f"id: {version}\nevent: state\ndata: "))
+        self.assertEqual(json.loads(event.split("data: ")[1])["current_chord"], "C")
+
+        await asyncio.to_thread(
+            self.store.update, self.session_id, {"current_chord": "G"}
+        )
+        event = await self._next_event(events)
+        self.assertEqual(json.loads(event.split("data: ")[1])["current_chord"], "G")
+
+        await events.aclose()
+
+    async def test_resume_from_last_event_id(self):
+        """Last-Event-ID が最新の場合は状態を送り直さないテスト"""
+        version = self.store.update(self.session_id, {"current_chord": "C"})
+
+        with self.settings(MOBILE_SSE_HEARTBEAT=0.05):
+            events = await self._open({"Last-Event-ID": str(version)})
+            self.assertEqual(await self._next_event(events), ": heartbeat\n\n")
+
+        await events.aclose()
+
+    async def test_expired_state_ends_stream(self):
+        """状態が期限切れになると expired を送って終了するテスト"""
+        self.store.update(self.session_id, {"current_chord": "C"})
+        events = await self._open()
+        await self._next_event(events)
+
+        await asyncio.to_thread(self.store.delete, self.session_id)
+        await asyncio.to_thread(self.store.waiters.notify, self.session_id)
+
+        self.assertEqual(await self._next_event(events), "event: expired\ndata: {}\n\n")
+        with self.assertRaises(StopAsyncIteration):
+            await anext(events)
+
+    async def test_invalid_session_is_rejected(self):
+        """無効なセッションIDの場合にエラーになるテスト"""
+        self.mock_manager.avalidate_session.return_value = False
+
+        response = await AsyncClient().get(
+            reverse("mobile:mobile_stream"), {"session_id": self.session_id}
+        )
+
+        self.assertEqual(response.status_code, 400)
+
+
+class CameraFrameViewTest(TestCase):
+    """カメラフレームの取得APIのテスト"""
+
+    def setUp(self):
+        """テストセットアップ"""
+        self.session_id = str(uuid.uuid4())
+        self.store = InMemorySessionStateStore()
+        set_session_state_store(self.store)
+
+        self.manager_patcher = patch("apps.mobile.views.pairing_manager")
+        self.mock_manager = self.manager_patcher.start()
+        self.mock_manager.validate_session.return_value = True
+        self.mock_manager.avalidate_session = AsyncMock(return_value=True)
+
+    def tearDown(self):
+        """テスト終了処理"""
+        self.manager_patcher.stop()
+        set_session_state_store(None)
+
+    def _get(self, **headers):
+        return Client().get(
+            reverse("mobile:mobile_camera_frame"),
+            {"session_id": self.session_id},
+            headers=headers,
+        )
+
+    def _set_frame(self, data):
+        return async_to_sync(self.store.aset_frame)(self.session_id, data)
+
+    def test_stored_frame_is_served_with_etag(self):
+        """保存されたフレームがETag付きのJPEGで返されるテスト"""
+        frame_id = self._set_frame(JPEG)
+
+        response = self._get()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "image/jpeg")
+        self.assertEqual(response["ETag"], f'"{frame_id}"')
+        self.assertEqual(response.content, JPEG)
+
+    def test_unchanged_frame_returns_304(self):
+        """If-None-Match が一致する場合に304が返されるテスト"""
+        frame_id = self._set_frame(JPEG)
+
+        response = self._get(**{"If-None-Match": f'"{frame_id}"'})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+
+        self._set_frame(JPEG + b"next")
+        response = self._get(**{"If-None-Match": f'"{frame_id}"'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_poll_does_not_carry_frame(self):
+        """ポーリングの応答にフレームが入らず、取得者として記録されるテスト"""
+        self._set_frame(JPEG)
+
+        response = Client().post(
+            reverse("mobile:mobile_poll"),
+            data=json.dumps({"session_id": self.session_id}),
+            content_type="application/json",
+        )
+
+        self.assertNotIn("camera_frame", response.json())
+        self.assertEqual(response.json()["version"], 0)
+        self.assertTrue(async_to_sync(self.store.ahas_frame_viewer)(self.session_id))
+
+    def test_frame_request_marks_viewer(self):
+        """フレームの取得でスマートフォンが取得者として記録されるテスト"""
+        self._get()
+
+        self.assertTrue(async_to_sync(self.store.ahas_frame_viewer)(self.session_id))
+
+    def test_missing_frame_returns_404(self):
+        """フレームがない場合に404が返されるテスト"""
+        self.assertEqual(self._get().status_code, 404)
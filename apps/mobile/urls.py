@@ -21,6 +21,10 @@ urlpatterns = [
     path("controller/", views.controller_entry, name="controller_entry"),
     # HTTPポーリングAPI
     path("api/poll/", views.mobile_poll, name="mobile_poll"),
+    # Server-Sent Events API（ポーリングの代替）
+    path("api/stream/", views.mobile_stream, name="mobile_stream"),
+    # カメラフレーム取得API（スマートフォン、ETagで変更がなければ304）
+    path("api/camera/", views.mobile_camera_frame, name="mobile_camera_frame"),
     # モバイルからのコマンド受信API
     path("api/command/", views.mobile_command, name="mobile_command"),
 ]
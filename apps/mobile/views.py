@@ -9,33 +9,47 @@ import io
 import json
 import logging
 import uuid
+from typing import Optional
 
 import qrcode
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.http import HttpRequest, HttpResponse, JsonResponse
+from django.http import (
+    HttpRequest,
+    HttpResponse,
+    HttpResponseNotModified,
+    JsonResponse,
+    StreamingHttpResponse,
+)
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags
 from django.shortcuts import render
 from django.views.decorators.csrf import csrf_exempt
 
 from .services import pairing_manager
+from .state import get_session_state_store
 
 logger = logging.getLogger(__name__)
 
 
-# インメモリストレージ（開発環境用）
-# 本番環境ではRedisを使用
-_state_storage = {}
-
-
 def get_state(session_id: str) -> dict:
     """セッションの状態を取得"""
-    return _state_storage.get(session_id, {})
+    return get_session_state_store().get(session_id)
+
 
+def set_state(session_id: str, **fields):
+    """セッションの状態を設定（複数の項目を1回で書き込む）"""
+    get_session_state_store().update(session_id, fields)
 
-def set_state(session_id: str, key: str, value: any):
-    """セッションの状態を設定"""
-    if session_id not in _state_storage:
-        _state_storage[session_id] = {}
-    _state_storage[session_id][key] = value
+
+def state_payload(state: dict, version: int) -> dict:
+    """ポーリング・SSEでスマートフォンに返す状態"""
+    return {
+        "current_chord": state.get("current_chord"),
+        "is_practice": state.get("is_practice", False),
+        "timestamp": state.get("timestamp", 0),
+        "version": version,
+    }
 
 
 @login_required
@@ -59,10 +73,12 @@ def generate_qr_code(request: HttpRequest) -> HttpResponse:
         pairing_manager.create_session(request.user.id, session_id)
 
         # 状態ストレージを初期化
-        set_state(session_id, 'user_id', request.user.id)
-        set_state(session_id, 'current_chord', None)
-        set_state(session_id, 'is_practice', False)
-        set_state(session_id, 'camera_frame', None)
+        set_state(
+            session_id,
+            user_id=request.user.id,
+            current_chord=None,
+            is_practice=False,
+        )
 
         # セッションIDをログに記録
         logger.info(f"QRコード生成: user_id={request.user.id}, session_id={session_id}")
@@ -221,23 +237,28 @@ def get_current_session(request: HttpRequest) -> JsonResponse:
 
 
 @csrf_exempt
-def mobile_poll(request: HttpRequest) -> JsonResponse:
+async def mobile_poll(request: HttpRequest) -> JsonResponse:
     """
     モバイルコントローラー用ポーリングAPI
 
-    スマートフォンが定期的にこのエンドポイントを呼び出して、
+    スマートフォンがこのエンドポイントを呼び出して、
     PCの状態（現在のコード、練習状態など）を取得する。
 
+    version と wait を指定するとロングポーリングになり、状態のバージョンが
+    version から変わるか wait 秒（最大 MOBILE_POLL_MAX_WAIT 秒）が経過するまで
+    応答を保留する。保留中はイベントループ上で待つため、ワーカーのスレッドを占有しない。
+
     Args:
         request: HTTPリクエストオブジェクト
+            {"session_id": "...", "version": 12, "wait": 25}
 
     Returns:
         JSONレスポンス
         {
             "current_chord": "C" | null,
             "is_practice": true | false,
-            "camera_frame": "base64..." | null,
-            "timestamp": 1234567890
+            "timestamp": 1234567890,
+            "version": 13
         }
     """
     if request.method != "POST":
@@ -246,25 +267,36 @@ def mobile_poll(request: HttpRequest) -> JsonResponse:
     try:
         data = json.loads(request.body)
         session_id = data.get('session_id')
+        version = data.get('version')
+        wait = data.get('wait')
 
         if not session_id:
             return JsonResponse({"error": "セッションIDが必要です"}, status=400)
 
+        if version is not None and (
+            not isinstance(version, int) or isinstance(version, bool)
+        ):
+            return JsonResponse({"error": "無効なバージョン"}, status=400)
+        if wait is not None and (
+            not isinstance(wait, (int, float)) or isinstance(wait, bool) or wait < 0
+        ):
+            return JsonResponse({"error": "無効な待機時間"}, status=400)
+
         # セッションを検証
-        if not pairing_manager.validate_session(session_id):
+        if not await pairing_manager.avalidate_session(session_id):
             return JsonResponse({"error": "無効なセッションID"}, status=400)
 
-        # 現在の状態を取得
-        state = get_state(session_id)
-
-        response = {
-            "current_chord": state.get('current_chord'),
-            "is_practice": state.get('is_practice', False),
-            "camera_frame": state.get('camera_frame'),
-            "timestamp": state.get('timestamp', 0),
-        }
+        store = get_session_state_store()
+        await store.amark_frame_viewer(session_id)
+        if version is not None and wait:
+            # 状態が変わるまで待つ
+            state, current = await store.wait_for_change(
+                session_id, version, min(wait, settings.MOBILE_POLL_MAX_WAIT)
+            )
+        else:
+            state, current = await store.aget_versioned(session_id)
 
-        return JsonResponse(response)
+        return JsonResponse(state_payload(state, current))
 
     except json.JSONDecodeError:
         return JsonResponse({"error": "無効なJSON形式"}, status=400)
@@ -273,6 +305,142 @@ def mobile_poll(request: HttpRequest) -> JsonResponse:
         return JsonResponse({"error": "サーバーエラー"}, status=500)
 
 
+# SSEの再接続までの待ち時間（ミリ秒、EventSourceの retry）
+SSE_RETRY_MS = 3000
+
+
+async def _state_events(
+    session_id: str, last_event_id: Optional[int], heartbeat: float
+):
+    """
+    セッションの状態が変わるたびにSSEのイベントを生成する
+
+    イベントIDは状態のバージョンで、再接続時の Last-Event-ID と同じなら
+    変わっていない状態は送り直さない。heartbeat 秒ごとに変更がなければ
+    コメント行を送り、プロキシに接続を切られないようにする。
+    """
+    store = get_session_state_store()
+    version = last_event_id
+    yield f"retry: {SSE_RETRY_MS}\n\n"
+
+    while True:
+        # 初回（Last-Event-IDなし）は現在の状態をすぐに送る
+        state, current = await store.wait_for_change(
+            session_id, -1 if version is None else version, heartbeat
+        )
+        if current == version:
+            yield ": heartbeat\n\n"
+            continue
+
+        if not state and version:
+            # 状態が期限切れになった（セッション終了）
+            yield "event: expired\ndata: {}\n\n"
+            return
+
+        version = current
+        data = json.dumps(state_payload(state, current), ensure_ascii=False)
+        yield f"id: {current}\nevent: state\ndata: {data}\n\n"
+
+
+async def mobile_stream(request: HttpRequest) -> HttpResponse:
+    """
+    モバイルコントローラー用Server-Sent Events API
+
+    WebSocketを使えないスマートフォン向けに、ポーリングの代わりに
+    PCの状態（現在のコード、練習状態など）の変更を1本の応答で配信する。
+    セッションの検証は接続時の1回だけ行う。
+
+    EventSourceが再接続時に送る Last-Event-ID（状態のバージョン）から再開し、
+    その間に変更がなければ状態を送り直さない。
+
+    Args:
+        request: HTTPリクエストオブジェクト（?session_id=...）
+
+    Returns:
+        text/event-stream のレスポンス
+        event: state, data: mobile_poll と同じJSON
+        event: expired（セッションの状態が期限切れになった場合、配信を終了する）
+    """
+    if request.method != "GET":
+        return JsonResponse({"error": "GETメソッドのみ許可されています"}, status=405)
+
+    session_id = request.GET.get("session_id")
+    if not session_id:
+        return JsonResponse({"error": "セッションIDが必要です"}, status=400)
+
+    last_event_id = request.headers.get("Last-Event-ID") or request.GET.get(
+        "last_event_id"
+    )
+    if last_event_id is not None:
+        try:
+            last_event_id = int(last_event_id)
+        except ValueError:
+            return JsonResponse({"error": "無効なLast-Event-ID"}, status=400)
+
+    # セッションを検証
+    if not await pairing_manager.avalidate_session(session_id):
+        return JsonResponse({"error": "無効なセッションID"}, status=400)
+    await get_session_state_store().amark_frame_viewer(session_id)
+
+    response = StreamingHttpResponse(
+        _state_events(session_id, last_event_id, settings.MOBILE_SSE_HEARTBEAT),
+        content_type="text/event-stream",
+    )
+    response["Cache-Control"] = "no-cache"
+    # nginxのバッファリングを無効にしてイベントをすぐに届ける
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+async def mobile_camera_frame(request: HttpRequest) -> HttpResponse:
+    """
+    モバイルコントローラー用カメラフレーム取得API
+
+    PCがWebSocketで送ったカメラフレームのうち最新のもの（GuitarConsumer が
+    保存する）を image/jpeg のまま返す。フレームIDをETagにし、
+    If-None-Match が一致する場合は画像を読まずに304を返す。
+    スマートフォンは一定間隔でこのAPIを呼び、呼ぶたびにフレームの取得者として
+    記録される（GuitarConsumer は取得者がいる間だけフレームを保存する）。
+
+    Args:
+        request: HTTPリクエストオブジェクト（?session_id=...）
+
+    Returns:
+        JPEG画像、304（変更なし）、404（フレームなし）
+    """
+    if request.method != "GET":
+        return JsonResponse({"error": "GETメソッドのみ許可されています"}, status=405)
+
+    session_id = request.GET.get("session_id")
+    if not session_id:
+        return JsonResponse({"error": "セッションIDが必要です"}, status=400)
+
+    # セッションを検証
+    if not await pairing_manager.avalidate_session(session_id):
+        return JsonResponse({"error": "無効なセッションID"}, status=400)
+
+    store = get_session_state_store()
+    await store.amark_frame_viewer(session_id)
+    etags = parse_etags(request.headers.get("If-None-Match", ""))
+    if etags:
+        frame_id = await store.aget_frame_id(session_id)
+        if frame_id is not None and f'"{frame_id}"' in etags:
+            response = HttpResponseNotModified()
+            response["ETag"] = f'"{frame_id}"'
+            return response
+
+    frame = await store.aget_frame(session_id)
+    if frame is None:
+        return JsonResponse({"error": "カメラフレームがありません"}, status=404)
+
+    frame_id, data = frame
+    response = HttpResponse(data, content_type="image/jpeg")
+    response["ETag"] = f'"{frame_id}"'
+    # キャッシュは使うが、毎回 If-None-Match で確認させる
+    patch_cache_control(response, no_cache=True, private=True)
+    return response
+
+
 @csrf_exempt
 def mobile_command(request: HttpRequest) -> JsonResponse:
     """
@@ -308,18 +476,27 @@ def mobile_command(request: HttpRequest) -> JsonResponse:
         if command == 'chord_change':
             chord = params.get('chord')
             if chord:
-                set_state(session_id, 'current_chord', chord)
-                set_state(session_id, 'timestamp', int(request.headers.get('X-Timestamp', 0)))
+                set_state(
+                    session_id,
+                    current_chord=chord,
+                    timestamp=int(request.headers.get("X-Timestamp", 0)),
+                )
                 logger.info(f"コード変更: session_id={session_id}, chord={chord}")
 
         elif command == 'practice_start':
-            set_state(session_id, 'is_practice', True)
-            set_state(session_id, 'timestamp', int(request.headers.get('X-Timestamp', 0)))
+            set_state(
+                session_id,
+                is_practice=True,
+                timestamp=int(request.headers.get("X-Timestamp", 0)),
+            )
             logger.info(f"練習開始: session_id={session_id}")
 
         elif command == 'practice_end':
-            set_state(session_id, 'is_practice', False)
-            set_state(session_id, 'timestamp', int(request.headers.get('X-Timestamp', 0)))
+            set_state(
+                session_id,
+                is_practice=False,
+                timestamp=int(request.headers.get("X-Timestamp", 0)),
+            )
             logger.info(f"練習終了: session_id={session_id}")
 
         else:
@@ -0,0 +1,104 @@
+"""
+WebSocketメッセージのバッチ送信
+
+高頻度のイベント（game_update / judgement）を短い時間窓でまとめ、
+1つのフレームとして送信する。
+"""
+
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# バッチメッセージのタイプ
+BATCH_MESSAGE_TYPE = "batch"
+
+# 1回の受信で受け付けるバッチ内メッセージの最大数
+MAX_INBOUND_BATCH_SIZE = 100
+
+
+class OutboundBatcher:
+    """
+    接続ごとの送信バッチャー
+
+    時間窓内に追加されたメッセージをまとめて送信する。
+    メッセージが1つだけの場合は通常のメッセージとして送信し、
+    複数の場合は {"type": "batch", "messages": [...]} として送信する。
+    """
+
+    def __init__(self, send, window: float, max_size: int = 50):
+        """
+        Args:
+            send: メッセージ（辞書）を送信するコルーチン関数
+            window: バッチの時間窓（秒）
+            max_size: この数に達したら時間窓を待たずに送信する
+        """
+        self._send = send
+        self.window = window
+        self.max_size = max_size
+        self._pending = []
+        self._timer = None
+        self._flushes = set()
+
+        # 統計情報
+        self.flushed_frames = 0
+        self.batched_messages = 0
+
+    @property
+    def pending(self) -> int:
+        """送信待ちのメッセージ数"""
+        return len(self._pending)
+
+    def add(self, message: dict):
+        """
+        メッセージをバッチに追加する
+
+        Args:
+            message: クライアントに送信するメッセージ
+        """
+        self._pending.append(message)
+
+        if len(self._pending) >= self.max_size:
+            self._cancel_timer()
+            task = asyncio.ensure_future(self.flush())
+            self._flushes.add(task)
+            task.add_done_callback(self._flushes.discard)
+        elif self._timer is None:
+            self._timer = asyncio.ensure_future(self._flush_later())
+
+    async def _flush_later(self):
+        """時間窓の経過後に送信する"""
+        await asyncio.sleep(self.window)
+        self._timer = None
+        await self.flush()
+
+    async def flush(self):
+        """溜まっているメッセージを送信する"""
+        messages, self._pending = self._pending, []
+        if not messages:
+            return
+
+        if len(messages) == 1:
+            frame = messages[0]
+        else:
+            frame = {"type": BATCH_MESSAGE_TYPE, "messages": messages}
+
+        try:
+            await self._send(frame)
+            self.flushed_frames += 1
+            self.batched_messages += len(messages)
+        except Exception:
+            logger.error("バッチ送信エラー", exc_info=True)
+
+    def _cancel_timer(self):
+        """送信待ちのタイマーを取り消す"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    async def close(self):
+        """送信タスクを停止し、未送信のメッセージを破棄する"""
+        self._cancel_timer()
+        for task in list(self._flushes):
+            task.cancel()
+        self._pending = []
@@ -0,0 +1,114 @@
+"""
+メッセージコーデックのマイクロベンチマーク
+
+メッセージタイプごとに、各コーデックのエンコード/デコード時間と
+エンコード後のサイズを計測する。
+
+使い方:
+    python -m apps.websocket.benchmarks.codec_benchmark
+    python -m apps.websocket.benchmarks.codec_benchmark --number 20000 --output out.json
+"""
+
+import argparse
+import base64
+import json
+import os
+import timeit
+
+from apps.websocket.protocol import CODECS
+
+# 計測対象のメッセージ（クライアントとの間で実際にやり取りされる形式）
+SAMPLE_MESSAGES = {
+    "chord_change": {"type": "chord_change", "data": {"chord": "Am"}},
+    "practice_update": {
+        "type": "practice_update",
+        "data": {"status": "started", "timestamp": "2026-01-27T12:00:00Z"},
+    },
+    "game_update": {
+        "type": "game_update",
+        "data": {
+            "score": 12840,
+            "combo": 42,
+            "maxCombo": 57,
+            "stats": {"perfect": 120, "great": 31, "good": 8, "miss": 2},
+        },
+    },
+    "judgement": {
+        "type": "judgement",
+        "data": {"result": "perfect", "timing": -12, "lane": 3, "noteId": 418},
+    },
+    "ping": {"type": "ping", "data": {"timestamp": 1769515200000}},
+    "batch": {
+        "type": "batch",
+        "messages": [
+            {"type": "judgement", "data": {"result": "great", "noteId": i}}
+            for i in range(8)
+        ],
+    },
+    # 320x240 JPEG相当（約15KB）のbase64データ
+    "camera_frame": {
+        "type": "camera_frame",
+        "data": {
+            "data": base64.b64encode(os.urandom(15000)).decode(),
+            "width": 320,
+            "height": 240,
+        },
+    },
+}
+
+
+def run(number: int) -> list:
+    """
+    ベンチマークを実行する
+
+    Args:
+        number: メッセージごとの繰り返し回数
+
+    Returns:
+        計測結果のリスト
+    """
+    results = []
+    for message_type, message in SAMPLE_MESSAGES.items():
+        for codec in CODECS.values():
+            encoded = codec.encode(message)
+            encode_time = timeit.timeit(lambda: codec.encode(message), number=number)
+            decode_time = timeit.timeit(lambda: codec.decode(encoded), number=number)
+            results.append(
+                {
+                    "message_type": message_type,
+                    "codec": codec.name,
+                    "size_bytes": len(
+                        encoded if codec.binary else encoded.encode("utf-8")
+                    ),
+                    "encode_us": encode_time / number * 1e6,
+                    "decode_us": decode_time / number * 1e6,
+                }
+            )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="メッセージコーデックのベンチマーク")
+    parser.add_argument("--number", type=int, default=10000, help="繰り返し回数")
+    parser.add_argument("--output", help="結果を書き出すJSONファイル")
+    args = parser.parse_args()
+
+    results = run(args.number)
+
+    print(
+        f"{'message_type':<16}{'codec':<10}{'bytes':>8}"
+        f"{'encode(us)':>12}{'decode(us)':>12}"
+    )
+    for r in results:
+        print(
+            f"{r['message_type']:<16}{r['codec']:<10}{r['size_bytes']:>8}"
+            f"{r['encode_us']:>12.2f}{r['decode_us']:>12.2f}"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
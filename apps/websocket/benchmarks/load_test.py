@@ -0,0 +1,344 @@
+"""
+GuitarConsumer の負荷試験
+
+N個のルーム（PCとスマホのペア）をASGIアプリケーションに直接接続し、
+chord_change / judgement / camera_frame を混ぜたメッセージを送信して
+中継レイテンシ、スループット、接続あたりのメモリを計測する。
+
+クライアントとサーバーは同じイベントループで動作するため、レイテンシには
+クライアント側の処理時間も含まれる。バージョン間の比較に使うこと。
+
+使い方:
+    python -m apps.websocket.benchmarks.load_test --rooms 50 --duration 10
+    python -m apps.websocket.benchmarks.load_test --layer redis --output out.json
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+django.setup()
+
+from channels.testing import WebsocketCommunicator  # noqa: E402
+from django.conf import settings  # noqa: E402
+
+from apps.mobile.services import pairing_manager  # noqa: E402
+
+# メッセージタイプごとの送信比率
+DEFAULT_MIX = {"judgement": 0.6, "chord_change": 0.25, "camera_frame": 0.15}
+
+CHORDS = ["C", "D", "E", "F", "G", "A", "Am", "Em"]
+
+# 送信終了を知らせるキー（chord_change は間引かれないため終端に使う）
+END_KEY = "end"
+
+
+class LoadStats:
+    """計測結果の集計"""
+
+    def __init__(self):
+        self.latencies = {}
+        self.sent = {}
+        self.received = {}
+
+    def record_sent(self, message_type: str):
+        self.sent[message_type] = self.sent.get(message_type, 0) + 1
+
+    def record_received(self, message_type: str, latency: float):
+        self.received[message_type] = self.received.get(message_type, 0) + 1
+        self.latencies.setdefault(message_type, []).append(latency)
+
+    def summary(self, elapsed: float) -> dict:
+        """集計結果を辞書で返す"""
+        all_latencies = [v for values in self.latencies.values() for v in values]
+        by_type = {
+            message_type: {
+                "sent": self.sent.get(message_type, 0),
+                "received": self.received.get(message_type, 0),
+                **percentiles(self.latencies.get(message_type, [])),
+            }
+            for message_type in sorted(self.sent)
+        }
+        total_received = sum(self.received.values())
+        return {
+            "elapsed_s": elapsed,
+            "sent": sum(self.sent.values()),
+            "received": total_received,
+            "messages_per_sec": total_received / elapsed if elapsed else 0.0,
+            "latency_ms": percentiles(all_latencies),
+            "by_type": by_type,
+        }
+
+
+def percentiles(values: list) -> dict:
+    """p50 / p95 / p99（ミリ秒）を計算する"""
+    if len(values) < 2:
+        value = values[0] * 1000 if values else None
+        return {"p50": value, "p95": value, "p99": value}
+
+    cuts = statistics.quantiles(values, n=100, method="inclusive")
+    return {
+        "p50": cuts[49] * 1000,
+        "p95": cuts[94] * 1000,
+        "p99": cuts[98] * 1000,
+    }
+
+
+def build_message(message_type: str, key: str, camera_payload: str) -> dict:
+    """
+    計測用のメッセージを作成する
+
+    中継後もメッセージを特定できるように、キーをメッセージに埋め込む。
+    """
+    if message_type == "chord_change":
+        return {
+            "type": "chord_change",
+            "data": {"chord": f"{random.choice(CHORDS)}#{key}"},
+        }
+    if message_type == "camera_frame":
+        return {
+            "type": "camera_frame",
+            "data": {"id": key, "data": camera_payload, "width": 320, "height": 240},
+        }
+    return {
+        "type": "judgement",
+        "data": {"id": key, "result": random.choice(["perfect", "great", "good"])},
+    }
+
+
+def message_key(message: dict):
+    """受信したメッセージから送信時のキーを取り出す"""
+    data = message.get("data") or {}
+    if message.get("type") == "chord_change":
+        return data.get("chord", "").rpartition("#")[2]
+    return data.get("id")
+
+
+async def connect(application, path: str) -> WebsocketCommunicator:
+    """接続し、接続通知を消費する"""
+    communicator = WebsocketCommunicator(application, path)
+    connected, _ = await communicator.connect(timeout=10)
+    if not connected:
+        raise RuntimeError(f"接続に失敗しました: {path}")
+    await communicator.receive_from(timeout=10)
+    return communicator
+
+
+async def open_room(application, session_id: str):
+    """PCとスマホのペアを接続する"""
+    path = f"/ws/guitar/{session_id}/"
+    pc = await connect(application, f"{path}?role=pc")
+    mobile = await connect(application, f"{path}?role=mobile")
+    # スマホの接続通知をPC側で消費
+    await pc.receive_from(timeout=10)
+    return pc, mobile
+
+
+async def drive_room(pc, mobile, args, stats: LoadStats, room_index: int):
+    """1つのルームでメッセージを送信し、スマホ側で受信を計測する"""
+    pending = {}
+    camera_payload = base64.b64encode(os.urandom(args.camera_bytes)).decode()
+    types = list(args.mix)
+    weights = [args.mix[t] for t in types]
+    interval = 1.0 / args.rate
+    deadline = time.perf_counter() + args.duration
+
+    async def send_loop():
+        seq = 0
+        while time.perf_counter() < deadline:
+            message_type = random.choices(types, weights)[0]
+            key = f"{room_index}-{seq}"
+            seq += 1
+            pending[key] = time.perf_counter()
+            stats.record_sent(message_type)
+            await pc.send_to(
+                text_data=json.dumps(build_message(message_type, key, camera_payload))
+            )
+            await asyncio.sleep(interval)
+
+        await pc.send_to(
+            text_data=json.dumps(build_message("chord_change", END_KEY, ""))
+        )
+
+    async def receive_loop():
+        # タイムアウトするとアプリケーションが停止するため、終端メッセージまで受信する
+        while True:
+            response = await mobile.receive_from(timeout=args.timeout)
+            received_at = time.perf_counter()
+            message = json.loads(response)
+            key = message_key(message)
+            if key == END_KEY:
+                return
+            sent_at = pending.pop(key, None)
+            if sent_at is not None:
+                stats.record_received(message["type"], received_at - sent_at)
+
+    await asyncio.gather(send_loop(), receive_loop())
+
+
+async def run(args) -> dict:
+    """負荷試験を実行し、結果を返す"""
+    from config.asgi import application
+
+    session_ids = [f"loadtest-{os.getpid()}-{i}" for i in range(args.rooms)]
+    for session_id in session_ids:
+        if args.layer == "redis":
+            pairing_manager.create_session(user_id=0, session_id=session_id)
+        else:
+            # Redisなしで接続できるように検証済みキャッシュに登録する
+            pairing_manager.validation_cache.add(session_id)
+
+    tracemalloc.start()
+    memory_before = tracemalloc.get_traced_memory()[0]
+    rooms = [await open_room(application, session_id) for session_id in session_ids]
+    memory_after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    stats = LoadStats()
+    started = time.perf_counter()
+    await asyncio.gather(
+        *(
+            drive_room(pc, mobile, args, stats, i)
+            for i, (pc, mobile) in enumerate(rooms)
+        )
+    )
+    elapsed = time.perf_counter() - started
+
+    for pc, mobile in rooms:
+        await pc.disconnect()
+        await mobile.disconnect()
+    if args.layer == "redis":
+        for session_id in session_ids:
+            pairing_manager.delete_session(session_id)
+
+    connections = len(rooms) * 2
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "layer": settings.CHANNEL_LAYERS["default"]["BACKEND"],
+        },
+        "params": {
+            "rooms": args.rooms,
+            "duration_s": args.duration,
+            "rate_per_room": args.rate,
+            "mix": args.mix,
+            "camera_bytes": args.camera_bytes,
+            "seed": args.seed,
+        },
+        "results": {
+            **stats.summary(elapsed),
+            "connections": connections,
+            "memory_per_connection_bytes": (memory_after - memory_before) / connections,
+        },
+    }
+
+
+def git_revision():
+    """現在のコミットを返す（取得できない場合はNone）"""
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            stderr=subprocess.DEVNULL,
+            text=True,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_mix(value: str) -> dict:
+    """'judgement=0.6,chord_change=0.4' 形式の送信比率を解析する"""
+    mix = {}
+    for item in value.split(","):
+        name, _, weight = item.partition("=")
+        if name not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"未対応のメッセージタイプ: {name}")
+        mix[name] = float(weight)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GuitarConsumer の負荷試験")
+    parser.add_argument("--rooms", type=int, default=20, help="ルーム数")
+    parser.add_argument("--duration", type=float, default=5.0, help="送信時間（秒）")
+    parser.add_argument(
+        "--rate", type=float, default=50.0, help="ルームあたりの送信数（件/秒）"
+    )
+    parser.add_argument(
+        "--mix", type=parse_mix, default=DEFAULT_MIX, help="送信比率（type=weight,...）"
+    )
+    parser.add_argument(
+        "--camera-bytes", type=int, default=8000, help="カメラフレームのサイズ"
+    )
+    parser.add_argument(
+        "--layer",
+        choices=["memory", "redis"],
+        default="memory",
+        help="memory: InMemoryChannelLayer, redis: settings のチャネルレイヤー",
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=10.0, help="受信のタイムアウト（秒）"
+    )
+    parser.add_argument("--seed", type=int, default=0, help="乱数シード")
+    parser.add_argument("--output", help="結果を書き出すJSONファイル")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    if args.layer == "memory":
+        settings.CHANNEL_LAYERS = {
+            "default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}
+        }
+        settings.GUITAR_WS_PRESENCE = {
+            "BACKEND": "apps.websocket.presence.InMemoryPresence"
+        }
+        settings.GUITAR_WS_REPLAY = {
+            "BACKEND": "apps.websocket.replay.InMemoryReplayBuffer"
+        }
+        settings.GUITAR_WS_GAME_STATE = {
+            "BACKEND": "apps.websocket.gamestate.InMemoryGameStateStore"
+        }
+
+    report = asyncio.run(run(args))
+    results = report["results"]
+    latency = results["latency_ms"]
+
+    print(
+        f"rooms={args.rooms} connections={results['connections']} "
+        f"elapsed={results['elapsed_s']:.2f}s layer={report['meta']['layer']}"
+    )
+    print(
+        f"sent={results['sent']} received={results['received']} "
+        f"msgs/sec={results['messages_per_sec']:.1f}"
+    )
+    print(f"memory/connection={results['memory_per_connection_bytes'] / 1024:.1f}KiB")
+    print(f"{'type':<14}{'sent':>8}{'recv':>8}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for message_type, row in [("all", latency), *results["by_type"].items()]:
+        print(
+            f"{message_type:<14}{row.get('sent', results['sent']):>8}"
+            f"{row.get('received', results['received']):>8}"
+            + "".join(
+                f"{row[p]:>9.2f}" if row[p] is not None else f"{'-':>9}"
+                for p in ("p50", "p95", "p99")
+            )
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
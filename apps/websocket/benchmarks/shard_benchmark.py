@@ -0,0 +1,306 @@
+"""
+チャネルレイヤーのシャーディングのベンチマーク
+
+ローカルで起動した複数の redis-server をシャードとして ShardedChannelLayer を作り、
+シャード数ごとに group_send のスループット（受信側に届いた件数/秒）を計測する。
+PCとスマホが別のワーカーにいる状況を再現するため、送信側と受信側は
+別プロセスで動かし、すべての配送がRedisを経由するようにする。
+
+あわせて、ルームのシャードへの偏りと、シャードを1台追加したときに担当が
+変わるルームの割合を、コンシステントハッシュと channels_redis 標準の
+ハッシュ（CRC32の範囲分割）で比較する（こちらはRedisなしで計算できる）。
+
+使い方:
+    python -m apps.websocket.benchmarks.shard_benchmark --shards 1,2,4
+    python -m apps.websocket.benchmarks.shard_benchmark --ring-only
+    python -m apps.websocket.benchmarks.shard_benchmark --output out.json
+
+redis-server が PATH にない場合や起動できない場合は、スループットの計測を
+スキップしてハッシュの計算結果だけを出力する。
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+import redis
+from channels_redis.utils import _consistent_hash
+
+from apps.websocket.benchmarks.load_test import git_revision
+from apps.websocket.layers import ConsistentHashRing, ShardedChannelLayer
+
+# ハッシュの偏りと移動量の計算に使うルーム数
+RING_SAMPLE_ROOMS = 100000
+
+
+def ring_report(shard_counts, rooms=RING_SAMPLE_ROOMS) -> list:
+    """
+    シャード数ごとのルームの偏りと、1台追加したときの移動割合を計算する
+
+    Returns:
+        [{"shards": 4, "max_over_mean": 1.04, "moved_on_add": 0.2,
+          "default_moved_on_add": 0.5}, ...]
+    """
+    groups = [f"guitar_bench-{i}" for i in range(rooms)]
+    report = []
+    for count in shard_counts:
+        nodes = [f"redis://shard-{i}:6379/0" for i in range(count + 1)]
+        ring = ConsistentHashRing(nodes[:count])
+        grown = ConsistentHashRing(nodes)
+
+        loads = [0] * count
+        moved = default_moved = 0
+        for group in groups:
+            index = ring.get(group)
+            loads[index] += 1
+            moved += index != grown.get(group)
+            default_moved += _consistent_hash(group, count) != _consistent_hash(
+                group, count + 1
+            )
+
+        report.append(
+            {
+                "shards": count,
+                "max_over_mean": max(loads) / (rooms / count),
+                "moved_on_add": moved / rooms,
+                "default_moved_on_add": default_moved / rooms,
+            }
+        )
+    return report
+
+
+def free_port() -> int:
+    """空いているTCPポートを返す"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_redis(count: int) -> tuple:
+    """
+    永続化を無効にした redis-server を起動する
+
+    Returns:
+        (プロセスのリスト, URLのリスト)
+    """
+    processes, urls = [], []
+    for _ in range(count):
+        port = free_port()
+        processes.append(
+            subprocess.Popen(
+                [
+                    "redis-server",
+                    "--port",
+                    str(port),
+                    "--save",
+                    "",
+                    "--appendonly",
+                    "no",
+                ],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+        )
+        urls.append(f"redis://127.0.0.1:{port}/0")
+
+    for url in urls:
+        client = redis.Redis.from_url(url)
+        for _ in range(100):
+            try:
+                client.ping()
+                break
+            except redis.ConnectionError:
+                time.sleep(0.05)
+        else:
+            stop_redis(processes)
+            raise RuntimeError(f"redis-server が起動しません: {url}")
+    return processes, urls
+
+
+def stop_redis(processes):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        process.wait()
+
+
+def group_names(worker: int, rooms: int) -> list:
+    return [f"guitar_bench-{worker}-{i}" for i in range(rooms)]
+
+
+async def receive_rooms(hosts, worker, rooms, ready, deadline) -> int:
+    """各ルームのメンバー（スマホ側）として受信し、受信件数を返す"""
+    layer = ShardedChannelLayer(hosts=hosts, capacity=1000)
+    channels = []
+    for group in group_names(worker, rooms):
+        channel = await layer.new_channel()
+        await layer.group_add(group, channel)
+        channels.append(channel)
+    ready.set()
+
+    received = 0
+
+    async def receive_loop(channel):
+        nonlocal received
+        while True:
+            await layer.receive(channel)
+            received += 1
+
+    tasks = [asyncio.ensure_future(receive_loop(channel)) for channel in channels]
+    await asyncio.sleep(max(0.0, deadline.value - time.time()) + 0.5)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await layer.flush()
+    return received
+
+
+async def send_rooms(hosts, worker, rooms, deadline) -> int:
+    """各ルームに judgement 相当のイベントを送り続け、送信件数を返す"""
+    layer = ShardedChannelLayer(hosts=hosts, capacity=1000)
+    sent = 0
+    message = {"type": "judgement", "message": {"type": "judgement", "data": {}}}
+
+    async def send_loop(group):
+        nonlocal sent
+        while time.time() < deadline.value:
+            await layer.group_send(group, message)
+            sent += 1
+
+    await asyncio.gather(*(send_loop(group) for group in group_names(worker, rooms)))
+    return sent
+
+
+def _receiver(hosts, worker, rooms, ready, start, deadline, results):
+    results.put(
+        ("received", asyncio.run(receive_rooms(hosts, worker, rooms, ready, deadline)))
+    )
+
+
+def _sender(hosts, worker, rooms, ready, start, deadline, results):
+    start.wait()
+    results.put(("sent", asyncio.run(send_rooms(hosts, worker, rooms, deadline))))
+
+
+def measure(hosts, workers: int, rooms: int, duration: float) -> dict:
+    """送信側・受信側のプロセスを workers 組起動してスループットを計測する"""
+    results = multiprocessing.Queue()
+    deadline = multiprocessing.Value("d", float("inf"))
+    start = multiprocessing.Event()
+    readies = [multiprocessing.Event() for _ in range(workers)]
+
+    processes = []
+    for worker in range(workers):
+        args = (hosts, worker, rooms, readies[worker], start, deadline, results)
+        processes.append(multiprocessing.Process(target=_receiver, args=args))
+        processes.append(multiprocessing.Process(target=_sender, args=args))
+    for process in processes:
+        process.start()
+
+    for ready in readies:
+        ready.wait()
+    # 全ルームの受信準備ができてから送信を始める
+    deadline.value = time.time() + duration
+    start.set()
+
+    totals = {"sent": 0, "received": 0}
+    for _ in processes:
+        key, value = results.get()
+        totals[key] += value
+    for process in processes:
+        process.join()
+
+    return {
+        "shards": len(hosts),
+        **totals,
+        "throughput_per_s": totals["received"] / duration,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="チャネルレイヤーのシャーディングのベンチマーク"
+    )
+    parser.add_argument(
+        "--shards", default="1,2,4", help="計測するシャード数（カンマ区切り）"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=4, help="送信側・受信側のプロセスの組数"
+    )
+    parser.add_argument(
+        "--rooms", type=int, default=50, help="プロセスの組あたりのルーム数"
+    )
+    parser.add_argument("--duration", type=float, default=5.0, help="送信時間（秒）")
+    parser.add_argument(
+        "--ring-only",
+        action="store_true",
+        help="Redisを起動せず、ハッシュの偏りと移動量だけを計算する",
+    )
+    parser.add_argument("--output", help="結果を書き出すJSONファイル")
+    args = parser.parse_args()
+
+    shard_counts = [int(count) for count in args.shards.split(",")]
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+        },
+        "params": {
+            "shards": shard_counts,
+            "workers": args.workers,
+            "rooms_per_worker": args.rooms,
+            "duration_s": args.duration,
+        },
+        "ring": ring_report(shard_counts),
+        "throughput": [],
+    }
+
+    print("shards  max/mean  moved(ring)  moved(default)")
+    for row in report["ring"]:
+        print(
+            f"{row['shards']:>6}  {row['max_over_mean']:>8.3f}  "
+            f"{row['moved_on_add']:>11.1%}  {row['default_moved_on_add']:>14.1%}"
+        )
+
+    if not args.ring_only and shutil.which("redis-server") is None:
+        print(
+            "\nredis-server が見つからないため、スループットの計測をスキップします",
+            file=sys.stderr,
+        )
+    elif not args.ring_only:
+        print("\nshards  sent  received  throughput/s")
+        for count in shard_counts:
+            try:
+                processes, hosts = start_redis(count)
+            except (OSError, RuntimeError) as error:
+                print(
+                    f"Redisに接続できないため、スループットの計測をスキップします: {error}",
+                    file=sys.stderr,
+                )
+                break
+            try:
+                result = measure(hosts, args.workers, args.rooms, args.duration)
+            finally:
+                stop_redis(processes)
+            report["throughput"].append(result)
+            print(
+                f"{count:>6}  {result['sent']:>4}  {result['received']:>8}  "
+                f"{result['throughput_per_s']:>12.0f}"
+            )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
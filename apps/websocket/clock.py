@@ -0,0 +1,124 @@
+"""
+NTP方式の時刻同期
+
+サーバーがクライアントにプローブを送り、クライアントの応答から
+往復遅延（RTT）と時計のずれ（offset）を推定する。
+
+    t0: サーバーがプローブを送信した時刻（サーバーの時計）
+    t1: クライアントがプローブを受信した時刻（クライアントの時計）
+    t2: クライアントが応答を送信した時刻（クライアントの時計）
+    t3: サーバーが応答を受信した時刻（サーバーの時計）
+
+    rtt = (t3 - t0) - (t2 - t1)
+    offset = ((t1 - t0) + (t2 - t3)) / 2   （クライアントの時計 - サーバーの時計）
+
+時刻はすべてミリ秒（JavaScriptの Date.now() と同じ単位）。
+"""
+
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Optional
+
+# 1回の同期で送るプローブ数（デフォルト）
+DEFAULT_PROBE_COUNT = 5
+
+# 1回の同期で送るプローブ数の上限
+MAX_PROBE_COUNT = 16
+
+# プローブの送信間隔（秒）
+PROBE_INTERVAL = 0.1
+
+# 推定に使うサンプル数
+MAX_SAMPLES = 8
+
+# 応答を待つプローブ数の上限（古いものから破棄する）
+MAX_OUTSTANDING_PROBES = 32
+
+
+def now_ms() -> float:
+    """サーバーの現在時刻（ミリ秒）"""
+    return time.time() * 1000
+
+
+@dataclass(frozen=True)
+class ClockSample:
+    """1回のプローブから得られた測定値（ミリ秒）"""
+
+    rtt: float
+    offset: float
+
+
+class ClockSync:
+    """
+    接続ごとの時刻同期の状態
+
+    直近のサンプルのうちRTTが最小のものを推定値として使う
+    （RTTが小さいほど経路の非対称性による誤差が小さいため）。
+    """
+
+    def __init__(self, max_samples: int = MAX_SAMPLES):
+        self.samples = deque(maxlen=max_samples)
+        self._outstanding = {}
+        self._next_id = 0
+
+    def create_probe(self) -> dict:
+        """
+        プローブを作成する
+
+        Returns:
+            クライアントに送信する {"id": ..., "t0": ...}
+        """
+        self._next_id += 1
+        probe = {"id": self._next_id, "t0": now_ms()}
+        self._outstanding[probe["id"]] = probe["t0"]
+
+        while len(self._outstanding) > MAX_OUTSTANDING_PROBES:
+            self._outstanding.pop(next(iter(self._outstanding)))
+        return probe
+
+    def complete_probe(
+        self, probe_id, t1: float, t2: float, t3: Optional[float] = None
+    ) -> Optional[ClockSample]:
+        """
+        クライアントの応答からサンプルを記録する
+
+        Args:
+            probe_id: プローブID
+            t1: クライアントがプローブを受信した時刻
+            t2: クライアントが応答を送信した時刻
+            t3: サーバーが応答を受信した時刻（省略時は現在時刻）
+
+        Returns:
+            記録したサンプル。未知のプローブIDや不正な値の場合はNone
+        """
+        t0 = self._outstanding.pop(probe_id, None)
+        if t0 is None:
+            return None
+
+        t3 = now_ms() if t3 is None else t3
+        rtt = (t3 - t0) - (t2 - t1)
+        if rtt < 0:
+            return None
+
+        sample = ClockSample(rtt=rtt, offset=((t1 - t0) + (t2 - t3)) / 2)
+        self.samples.append(sample)
+        return sample
+
+    @property
+    def estimate(self) -> Optional[ClockSample]:
+        """現在の推定値（サンプルがない場合はNone）"""
+        if not self.samples:
+            return None
+        return min(self.samples, key=lambda sample: sample.rtt)
+
+    def as_dict(self) -> Optional[dict]:
+        """クライアントに送信する形式の推定値"""
+        estimate = self.estimate
+        if estimate is None:
+            return None
+        return {
+            "rtt": round(estimate.rtt, 2),
+            "offset": round(estimate.offset, 2),
+            "samples": len(self.samples),
+        }
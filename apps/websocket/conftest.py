@@ -6,9 +6,15 @@ WebSocketテスト用のPytest設定とフィクスチャ
 
 import pytest
 import asyncio
+from unittest.mock import patch
+from channels.routing import URLRouter
 from channels.testing import WebsocketCommunicator
 from django.contrib.auth import get_user_model
 from apps.progress.models import PracticeSession
+from apps.websocket import metrics
+from apps.websocket.metrics import InMemoryExporter
+from apps.websocket.presence import InMemoryPresence, set_presence
+from apps.websocket.routing import websocket_urlpatterns
 from config.asgi import application
 
 User = get_user_model()
@@ -83,6 +89,87 @@ def chord_list():
     return ["C", "D", "E", "F", "G", "A", "B", "Am", "Dm", "Em"]
 
 
+@pytest.fixture
+def valid_session():
+    """
+    セッション検証スタブフィクスチャ
+
+    pairing_managerによるセッションの検証を常に成功させる
+    """
+    with patch(
+        "apps.websocket.consumers.pairing_manager.avalidate_session",
+        return_value=True,
+    ):
+        yield
+
+
+@pytest.fixture
+def presence():
+    """
+    プレゼンス管理フィクスチャ
+
+    テストごとに新しいInMemoryPresenceを使い、テスト後に既定に戻す
+    """
+    presence = InMemoryPresence(ttl=60)
+    set_presence(presence)
+    yield presence
+    set_presence(None)
+
+
+@pytest.fixture
+def exporter():
+    """
+    メトリクスエクスポーターフィクスチャ
+
+    InMemoryExporterに差し替え、テスト後に既定に戻す
+    """
+    exporter = InMemoryExporter()
+    metrics.set_exporter(exporter)
+    yield exporter
+    metrics.set_exporter(None)
+
+
+async def _join_room(path, *existing, subprotocols=None, user=None):
+    """
+    ルームに参加し、自分と既存メンバーへの接続通知を消費する
+
+    Args:
+        path: 接続先のパス
+        *existing: 接続通知を受け取る既存メンバーのコミュニケーター
+        subprotocols: 要求するサブプロトコル
+        user: 指定した場合はログインユーザーとして接続する
+
+    Returns:
+        WebsocketCommunicator: 接続済みのコミュニケーター
+    """
+    if user is None:
+        communicator = WebsocketCommunicator(
+            application, path, subprotocols=subprotocols
+        )
+    else:
+        communicator = WebsocketCommunicator(
+            URLRouter(websocket_urlpatterns), path, subprotocols=subprotocols
+        )
+        communicator.scope["user"] = user
+    connected, _ = await communicator.connect()
+    assert connected is True
+    await communicator.receive_from()
+    for member in existing:
+        await member.receive_from()
+    return communicator
+
+
+@pytest.fixture
+def join_room():
+    """
+    ルーム参加ヘルパーフィクスチャ
+
+    Returns:
+        callable: ``await join_room(path, *existing)`` で接続するコルーチン関数
+    """
+    return _join_room
+
+
 # テスト用のカスタムマーカー
 def pytest_configure(config):
     """
@@ -4,15 +4,185 @@ WebSocket consumers for VirtuTune
 スマホとPCのリアルタイム通信のためのコンシューマー
 """
 
-import json
+import asyncio
 import logging
+import random
+import re
+import time
+import uuid
+from urllib.parse import parse_qs
 from channels.generic.websocket import AsyncWebsocketConsumer
-from channels.db import database_sync_to_async
+from django.conf import settings
 from apps.progress.models import PracticeSession
 from apps.mobile.services import pairing_manager
+from apps.mobile.state import get_session_state_store
+from .batching import MAX_INBOUND_BATCH_SIZE, OutboundBatcher
+from .clock import (
+    DEFAULT_PROBE_COUNT,
+    MAX_PROBE_COUNT,
+    PROBE_INTERVAL,
+    ClockSync,
+)
+from .drain import drain_coordinator
+from .frames import CODEC_JPEG, HEADER_SIZE, FrameHeaderError, parse_header
+from .gamestate import compose, get_game_state_store
+from .mailbox import LatestFrameMailbox
+from .metrics import get_exporter, timed
+from .practice import PracticeRecorder
+from .presence import ROLE_UNKNOWN, ROLES, get_presence, summarize
+from .protocol import CODECS, MessageDecodeError, negotiate_codec
+from .ratelimit import OVERFLOW_COALESCE, resolve_rate_limit, room_buckets
+from .replay import get_replay_buffer, issue_resume_token, load_resume_token
+from .transcode import AdaptiveQuality, get_frame_transcoder
+from .writes import WriteQueueFull, get_write_queue
+from .registry import (
+    DELIVER_BATCHED,
+    DELIVER_LATEST,
+    ROUTE_BROADCAST,
+    ROUTE_REPLY,
+    MessageRegistry,
+)
 
 logger = logging.getLogger(__name__)
 
+# カメラフレーム転送の最大FPS（デフォルト）
+DEFAULT_CAMERA_MAX_FPS = 10
+
+# HTTPポーリングのスマートフォン用にカメラフレームを保存する最大FPS（デフォルト）
+DEFAULT_STORED_FRAME_MAX_FPS = 5
+
+# バッチ送信の時間窓（ミリ秒、デフォルト）
+DEFAULT_BATCH_WINDOW_MS = 15
+
+# ルームの定員（デフォルト、PCとスマホの2台）
+DEFAULT_ROOM_CAPACITY = 2
+
+# プレゼンスの最終確認時刻を更新する間隔（秒）
+PRESENCE_REFRESH_INTERVAL = 15
+
+# ドレイン時の切断コード（1012: Service Restart）
+DRAIN_CLOSE_CODE = 1012
+
+# 再接続要求で指定する待ち時間の上限（ミリ秒、デフォルト）
+DEFAULT_RECONNECT_JITTER_MS = 2000
+
+# サーバーからハートビートを送る間隔（秒、デフォルト。0で無効）
+DEFAULT_HEARTBEAT_INTERVAL = 20
+
+# 受信が途絶えた接続を切断するまでの時間（秒、デフォルト）
+DEFAULT_HEARTBEAT_TIMEOUT = 60
+
+# ハートビートの応答がない接続の切断コード
+HEARTBEAT_TIMEOUT_CLOSE_CODE = 4008
+
+# 同じクライアントの新しい接続などで置き換えられた接続の切断コード
+REPLACED_CLOSE_CODE = 4009
+
+# クライアントID（?client_id=...）として受け付ける文字列
+CLIENT_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+# バイナリフレームで受信したカメラフレームの登録名
+BINARY_CAMERA_FRAME = "camera_frame_binary"
+
+# /ws/guitar/ で扱うメッセージタイプの登録表
+registry = MessageRegistry()
+
+
+def camera_max_fps():
+    """カメラフレーム転送の最大FPS（0で無制限）"""
+    return getattr(settings, "GUITAR_WS_CAMERA_MAX_FPS", DEFAULT_CAMERA_MAX_FPS)
+
+
+def stored_frame_max_fps():
+    """HTTPポーリングのスマートフォン用にカメラフレームを保存する最大FPS（0で無制限）"""
+    return getattr(
+        settings, "MOBILE_CAMERA_FRAME_MAX_FPS", DEFAULT_STORED_FRAME_MAX_FPS
+    )
+
+
+def heartbeat_settings():
+    """ハートビートの送信間隔とタイムアウト（秒）"""
+    return (
+        getattr(settings, "GUITAR_WS_HEARTBEAT_INTERVAL", DEFAULT_HEARTBEAT_INTERVAL),
+        getattr(settings, "GUITAR_WS_HEARTBEAT_TIMEOUT", DEFAULT_HEARTBEAT_TIMEOUT),
+    )
+
+
+def _log_task_error(task):
+    """投げっぱなしのタスクで発生した例外をログに記録する"""
+    if task.cancelled():
+        return
+    error = task.exception()
+    if error is not None:
+        logger.error(
+            f"バックグラウンドタスクのエラー: {task.get_coro().__qualname__}",
+            exc_info=error,
+        )
+
+
+def _validate_chord(data):
+    if not data.get("data", {}).get("chord"):
+        return "Chord is required"
+
+
+def _validate_game_update(data):
+    if not isinstance(data.get("data", {}), dict):
+        return "Invalid game update"
+
+
+def _merge_game_updates(previous, data):
+    """レート制限でまとめる game_update の差分を1つにする"""
+    return {
+        **data,
+        "data": compose(previous.get("data", {}), data.get("data", {})),
+    }
+
+
+def _validate_practice_end(data):
+    practice = data.get("data", {})
+    chords = practice.get("chords", [])
+    if not isinstance(chords, list) or not all(isinstance(c, str) for c in chords):
+        return "Invalid chords"
+    session_id = practice.get("session_id")
+    if session_id is not None and (
+        not isinstance(session_id, int) or isinstance(session_id, bool)
+    ):
+        return "Invalid session_id"
+
+
+def _validate_idle(data):
+    if not isinstance(data.get("data", {}).get("idle"), bool):
+        return "Invalid idle state"
+
+
+def _validate_frame_ack(data):
+    seq = data.get("data", {}).get("seq")
+    if not isinstance(seq, int) or isinstance(seq, bool):
+        return "Invalid frame ack"
+
+
+def _validate_batch(data):
+    messages = data.get("messages")
+    if not isinstance(messages, list) or len(messages) > MAX_INBOUND_BATCH_SIZE:
+        return "Invalid batch"
+
+
+def _validate_clock_probe(data):
+    probe = data.get("data", {})
+    if not all(
+        isinstance(probe.get(key), (int, float)) and not isinstance(probe[key], bool)
+        for key in ("id", "t1", "t2")
+    ):
+        return "Invalid clock probe"
+
+
+def _validate_frame_header(frame):
+    try:
+        parse_header(frame)
+    except FrameHeaderError as e:
+        logger.warning(f"不正なバイナリフレーム: error={e}")
+        return "Invalid binary frame"
+
 
 class GuitarConsumer(AsyncWebsocketConsumer):
     """
@@ -24,43 +194,153 @@ class GuitarConsumer(AsyncWebsocketConsumer):
     - 接続管理
     """
 
+    # このプロセスで接続中のコンシューマー数
+    active_connections = 0
+
     async def connect(self):
         """接続確立時の処理"""
         self.session_id = self.scope["url_route"]["kwargs"]["session_id"]
         self.room_group_name = f"guitar_{self.session_id}"
         self.user = self.scope["user"].is_authenticated and self.scope["user"] or None
 
-        # セッションの存在確認
-        if not await self._validate_session():
+        self.accepted = False
+        # プレゼンスとチャネルグループに参加済みか（拒否した接続は退出処理をしない）
+        self.joined = False
+        self.left = False
+
+        # 最後にクライアントから受信した時刻とハートビートのタスク
+        self.last_seen = time.monotonic()
+        self.heartbeat_task = None
+
+        # バックグラウンドに入った（idle）状態。idle の間はカメラフレームを送らない
+        self.is_idle = False
+        self.idle_peers = set()
+
+        # 同じルームにいる他の接続のチャネル名とコーデック名
+        self.peers = {}
+
+        # メッセージのエンコード形式（サブプロトコルまたは ?codec= で選択）
+        self.codec, self.subprotocol = negotiate_codec(self.scope)
+
+        # カメラフレームの流量制御と、受信側に合わせた縮小（有効な場合）
+        max_fps = camera_max_fps()
+        self.transcoder = get_frame_transcoder()
+        self.frame_quality = None
+        if self.transcoder is not None:
+            self.frame_quality = AdaptiveQuality(max_fps or DEFAULT_CAMERA_MAX_FPS)
+        self.camera_mailbox = LatestFrameMailbox(
+            self._send_camera_frame if self.transcoder else self.send,
+            min_interval=1.0 / max_fps if max_fps else 0.0,
+        )
+
+        # HTTPポーリングのスマートフォン用のカメラフレームの保存（保存中は次を破棄）
+        self.frame_store_task = None
+        self.frame_stored_at = None
+
+        # 時刻同期（clock_sync で開始）
+        self.clock = ClockSync()
+        self.clock_task = None
+
+        # 練習セッションの保存（未ログインの場合はペアリングセッションの所有者）と
+        # 完了通知のタスク
+        self.practice = PracticeRecorder(self.user, self.session_id)
+        self.write_tasks = set()
+
+        # レート制限（トークンバケット）の状態と制限した件数
+        self.rate_limits = {}
+        self.throttled = {}
+        self.coalesced = {}
+        self.coalesce_tasks = {}
+
+        query = parse_qs(self.scope.get("query_string", b"").decode())
+
+        # 再開トークン（?resume=...&last_seq=...、ドレイン後の再接続）
+        self.resume = load_resume_token(query.get("resume", [None])[0], self.session_id)
+
+        self.client_id = self._client_id(query)
+
+        # デバイスの役割（?role=pc / ?role=mobile）
+        role = query.get("role", [None])[0] or (self.resume or {}).get("role")
+        self.role = role if role in ROLES else ROLE_UNKNOWN
+        self.presence_seen_at = None
+
+        # バッチ送信（?batch=1 で有効化）
+        self.batcher = None
+        if query.get("batch", ["0"])[0] == "1":
+            window_ms = getattr(
+                settings, "GUITAR_WS_BATCH_WINDOW_MS", DEFAULT_BATCH_WINDOW_MS
+            )
+            self.batcher = OutboundBatcher(self._send_message, window=window_ms / 1000)
+
+        # ドレイン中のワーカーは新しい接続を受け付けない
+        if drain_coordinator.draining:
+            get_exporter().increment("ws_connections_rejected_total", reason="draining")
+            await self.close(code=DRAIN_CLOSE_CODE)
+            return
+
+        # セッションの存在確認（有効な再開トークンがあれば省略）
+        if self.resume is None and not await self._validate_session():
             logger.warning(f"無効なセッションID: {self.session_id}")
+            get_exporter().increment(
+                "ws_connections_rejected_total", reason="invalid_session"
+            )
             await self.close(code=4000)
             return
 
+        # 定員を超える接続（3台目のデバイスなど）を拒否
+        if not await self._join_presence():
+            logger.warning(f"ルームが満員です: session_id={self.session_id}")
+            get_exporter().increment(
+                "ws_connections_rejected_total", reason="room_full"
+            )
+            await self.close(code=4003)
+            return
+
         # チャネルグループに参加
         await self.channel_layer.group_add(self.room_group_name, self.channel_name)
+        self.joined = True
 
         # 接続を通知
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                "type": "connection_update",
-                "status": "connected",
-                "user_id": self.user.id if self.user else None,
-            },
-        )
+        await self._group_send(self._connection_event("connected"))
 
-        await self.accept()
+        await self.accept(subprotocol=self.subprotocol)
+
+        self.accepted = True
+        drain_coordinator.register(self)
+        GuitarConsumer.active_connections += 1
+        metrics = get_exporter()
+        metrics.increment("ws_connections_total", codec=self.codec.name)
+        metrics.gauge("ws_active_connections", GuitarConsumer.active_connections)
+
+        interval, timeout = heartbeat_settings()
+        if interval:
+            self.heartbeat_task = asyncio.ensure_future(
+                self._heartbeat(interval, timeout)
+            )
 
         logger.info(
             f"WebSocket接続確立: session_id={self.session_id}, "
-            f"user_id={self.user.id if self.user else None}"
+            f"user_id={self.user.id if self.user else None}, "
+            f"codec={self.codec.name}, resumed={self.resume is not None}"
         )
 
-    async def receive(self, text_data):
+        # 再送で取りこぼしを埋められない場合はゲーム状態の全体を送る
+        complete = False
+        if self.resume is not None:
+            complete = await self._replay(query.get("last_seq", ["0"])[0])
+        if not complete:
+            await self._send_game_state()
+
+    async def receive(self, text_data=None, bytes_data=None):
         """
         メッセージ受信時の処理
 
-        サポートされるメッセージタイプ:
+        バイナリフレーム（bytes_data）はカメラフレームとして扱い、
+        テキストフレームは接続時に選択したコーデックでデコードして処理する。
+        MessagePackコーデックでは、MessagePackのマップで始まるバイナリフレームを
+        メッセージとして扱う。
+
+        サポートされるメッセージタイプは registry に登録されたもの:
         - chord_change: コード変更
         - practice_start: 練習開始
         - practice_end: 練習終了
@@ -68,261 +348,1037 @@ class GuitarConsumer(AsyncWebsocketConsumer):
         - game_update: ゲーム状態更新
         - judgement: 判定結果
         - ping: 接続確認
+        - heartbeat: サーバーからのハートビートへの応答
+        - idle: バックグラウンド状態の切り替え
+        - frame_ack: 表示したカメラフレームの応答
         - camera_frame: カメラフレーム送信（PCからモバイルへ）
+        - batch: 複数メッセージの一括送信
         """
+        # どのメッセージもハートビートの応答として扱う
+        self.last_seen = time.monotonic()
+
+        if bytes_data is not None and not self.codec.is_message(bytes_data):
+            await self._handle(registry.get(BINARY_CAMERA_FRAME), bytes_data)
+            return
+
         try:
-            text_data_json = json.loads(text_data)
-            message_type = text_data_json.get("type")
-
-            if message_type == "chord_change":
-                await self._handle_chord_change(text_data_json)
-            elif message_type == "practice_start":
-                await self._handle_practice_start(text_data_json)
-            elif message_type == "practice_end":
-                await self._handle_practice_end(text_data_json)
-            elif message_type == "game_mode":
-                await self._handle_game_mode(text_data_json)
-            elif message_type == "game_update":
-                await self._handle_game_update(text_data_json)
-            elif message_type == "judgement":
-                await self._handle_judgement(text_data_json)
-            elif message_type == "ping":
-                await self._handle_ping(text_data_json)
-            elif message_type == "camera_frame":
-                await self._handle_camera_frame(text_data_json)
-            else:
-                logger.warning(f"不明なメッセージタイプ: {message_type}")
-                await self._send_error(f"Unknown message type: {message_type}")
+            with timed("ws_decode_duration_seconds", codec=self.codec.name):
+                message = self.codec.decode(
+                    text_data if bytes_data is None else bytes_data
+                )
+            await self._dispatch(message)
 
-        except json.JSONDecodeError as e:
-            logger.error(f"JSONデコードエラー: {e}")
+        except MessageDecodeError as e:
+            logger.error(f"メッセージデコードエラー: {e}")
             await self._send_error("Invalid JSON format")
         except Exception as e:
             logger.error(f"メッセージ処理エラー: {e}", exc_info=True)
             await self._send_error("Internal server error")
 
-    async def _handle_chord_change(self, data):
-        """コード変更イベントの処理"""
-        chord = data.get("data", {}).get("chord")
+    async def _dispatch(self, data):
+        """メッセージタイプに応じたハンドラーを呼び出す"""
+        message_type = data.get("type")
+        spec = registry.get(message_type)
+
+        if spec is None:
+            get_exporter().increment("ws_messages_total", type="unknown")
+            logger.warning(f"不明なメッセージタイプ: {message_type}")
+            await self._send_error(f"Unknown message type: {message_type}")
+            return
+
+        await self._handle(spec, data)
+
+    async def _handle(self, spec, data):
+        """
+        登録表の定義に従ってメッセージを処理する
+
+        検証、レート制限、ハンドラーの呼び出し、ルーティングの順に行う。
+        """
+        get_exporter().increment("ws_messages_total", type=spec.type)
+
+        with timed("ws_handler_duration_seconds", type=spec.type):
+            await self._touch_presence()
+            await self._process(spec, data)
 
-        if not chord:
-            await self._send_error("Chord is required")
+    async def _process(self, spec, data):
+        """検証、レート制限、ハンドラーの呼び出し、ルーティングを行う"""
+        if not await self._admit(spec, data):
             return
 
-        # チャネルグループにコード変更イベントを送信
-        await self.channel_layer.group_send(
-            self.room_group_name,
+        message = await spec.handler(self, data)
+        if message is not None:
+            await self._route(spec, message)
+
+    async def _admit(self, spec, data):
+        """
+        検証とレート制限を行う
+
+        Returns:
+            bool: ハンドラーを呼び出してよい場合はTrue
+        """
+        if spec.validator is not None:
+            error = spec.validator(data)
+            if error:
+                await self._send_error(error)
+                return False
+
+        if not self._within_rate_limit(spec):
+            if self._rate_limit(spec)[0].overflow == OVERFLOW_COALESCE:
+                self._coalesce(spec, data)
+            return False
+
+        return True
+
+    def _rate_limit(self, spec):
+        """メッセージタイプのレート制限と接続ごとのバケットを返す"""
+        entry = self.rate_limits.get(spec.limit_key)
+        if entry is None:
+            limit = resolve_rate_limit(spec)
+            entry = self.rate_limits[spec.limit_key] = (
+                limit,
+                limit.connection_bucket(),
+            )
+        return entry
+
+    def _within_rate_limit(self, spec):
+        """
+        接続ごと・ルームごとのトークンバケットでメッセージを制限する
+
+        Returns:
+            bool: 処理してよい場合はTrue
+        """
+        limit, bucket = self._rate_limit(spec)
+
+        if bucket is not None and not bucket.consume():
+            self._count_throttled(spec, "connection")
+            return False
+
+        if limit.room_limited:
+            room = room_buckets.get(self.room_group_name, spec.limit_key, limit)
+            if not room.consume():
+                self._count_throttled(spec, "room")
+                return False
+
+        return True
+
+    def _count_throttled(self, spec, scope):
+        """制限したメッセージを記録する"""
+        self.throttled[spec.type] = self.throttled.get(spec.type, 0) + 1
+        get_exporter().increment(
+            "ws_messages_throttled_total", type=spec.type, scope=scope
+        )
+
+    def _coalesce(self, spec, data):
+        """
+        制限されたメッセージのうち最新のものだけを残し、トークンが溜まったら処理する
+
+        途中のメッセージは破棄されるが、登録表に merge がある場合は
+        前のメッセージと統合する（game_update の差分など）。
+        """
+        key = spec.limit_key
+        previous = self.coalesced.get(key)
+        if previous is not None and spec.merge is not None:
+            data = spec.merge(previous[1], data)
+        self.coalesced[key] = (spec, data)
+        if key in self.coalesce_tasks:
+            return
+
+        limit, bucket = self._rate_limit(spec)
+        delay = bucket.wait_time() if bucket is not None else 0.0
+        if limit.room_limited:
+            room = room_buckets.get(self.room_group_name, key, limit)
+            delay = max(delay, room.wait_time())
+
+        task = asyncio.ensure_future(self._flush_coalesced(key, delay))
+        task.add_done_callback(_log_task_error)
+        self.coalesce_tasks[key] = task
+
+    async def _flush_coalesced(self, key, delay):
+        """まとめたメッセージを処理する"""
+        await asyncio.sleep(delay)
+        del self.coalesce_tasks[key]
+        spec, data = self.coalesced.pop(key)
+        await self._process(spec, data)
+
+    async def _route(self, spec, message):
+        """ルーティング方針に従ってメッセージを送信する"""
+        if spec.routing == ROUTE_REPLY:
+            await self._send_message(message)
+            return
+
+        if spec.routing == ROUTE_BROADCAST:
+            await self._group_send(
+                {"type": spec.event_type, **self._prepare(message, include_self=True)}
+            )
+            return
+
+        if spec.replay:
+            await self._sequence(message)
+
+        event = {"type": spec.event_type, "sender_id": self.channel_name}
+        if isinstance(message, bytes):
+            # バイナリフレームはエンコードせずにそのまま転送する
+            event["frame"] = message
+        else:
+            event.update(self._prepare(message))
+
+        if spec.delivery == DELIVER_LATEST and self.idle_peers:
+            await self._send_to_active_peers(event)
+        else:
+            await self._relay(event)
+
+    async def _send_to_active_peers(self, event):
+        """
+        idle 状態でないピアにだけ直接送信する（カメラフレーム）
+
+        全員が idle の場合はチャネルレイヤーに送らずに破棄する。
+        """
+        peers = [peer for peer in self.peers if peer not in self.idle_peers]
+        if not peers:
+            get_exporter().increment("ws_camera_frames_dropped_total", reason="idle")
+            return
+        for peer in peers:
+            await self.channel_layer.send(peer, event)
+
+    @registry.message(
+        "batch",
+        validator=_validate_batch,
+        routing=ROUTE_REPLY,
+    )
+    async def _handle_batch(self, data):
+        """
+        一括送信されたメッセージの処理
+
+        game_update と judgement は1つのイベントにまとめて転送し、
+        それ以外のメッセージは個別に処理する。game_update の差分は1つに
+        まとめてゲーム状態に1回で適用し、最後の game_update の位置で転送する。
+        リプレイバッファへの記録もまとめて1回で行う。
+        """
+        batched = []
+        game_update = None
+        for message in data["messages"]:
+            if not isinstance(message, dict) or message.get("type") == "batch":
+                continue
+            if message.get("type") in ("game_update", "judgement"):
+                spec = registry.get(message["type"])
+                if not await self._admit(spec, message):
+                    continue
+                if spec.type == "game_update":
+                    if game_update is not None:
+                        batched.remove(game_update)
+                        message = _merge_game_updates(game_update, message)
+                    game_update = message
+                batched.append(message)
+            else:
+                await self._dispatch(message)
+
+        events = []
+        for message in batched:
+            event = await registry.get(message["type"]).handler(self, message)
+            if event is not None:
+                events.append(event)
+        if not events:
+            return
+
+        await self._sequence(*events)
+        await self._relay(
             {
-                "type": "chord_change",
-                "chord": chord,
+                "type": "event_batch",
+                "events": [self._prepare(event) for event in events],
                 "sender_id": self.channel_name,
-            },
+            }
         )
 
+    @registry.message("chord_change", validator=_validate_chord, replay=True)
+    async def _handle_chord_change(self, data):
+        """コード変更イベントの処理"""
+        chord = data["data"]["chord"]
+
         logger.info(f"コード変更: session_id={self.session_id}, chord={chord}")
 
+        return self._with_clock({"type": "chord_change", "data": {"chord": chord}})
+
+    @registry.message(
+        "practice_start", routing=ROUTE_BROADCAST, event="practice_update"
+    )
     async def _handle_practice_start(self, data):
-        """練習開始イベントの処理"""
-        # グループに通知
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                "type": "practice_update",
+        """
+        練習開始イベントの処理
+
+        練習セッションを作成し、保存後に送信者に practice_saved を送る。
+        送信者が未ログインの場合はペアリングセッションの所有者の練習として記録する。
+        """
+        logger.info(f"練習開始: session_id={self.session_id}")
+
+        await self._record_practice("started", self.practice.start)
+
+        return {
+            "type": "practice_update",
+            "data": {
                 "status": "started",
                 "timestamp": data.get("data", {}).get("timestamp"),
             },
-        )
-
-        logger.info(f"練習開始: session_id={self.session_id}")
+        }
 
+    @registry.message(
+        "practice_end",
+        validator=_validate_practice_end,
+        routing=ROUTE_BROADCAST,
+        event="practice_update",
+    )
     async def _handle_practice_end(self, data):
-        """練習終了イベントの処理"""
-        # グループに通知
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                "type": "practice_update",
+        """
+        練習終了イベントの処理
+
+        練習したコード（data.chords）とともに練習セッションを終了し、
+        保存後に送信者に practice_saved を送る。
+        """
+        logger.info(f"練習終了: session_id={self.session_id}")
+
+        practice = data.get("data", {})
+        await self._record_practice(
+            "ended",
+            self.practice.end,
+            practice.get("chords", []),
+            practice.get("session_id"),
+        )
+
+        return {
+            "type": "practice_update",
+            "data": {
                 "status": "ended",
                 "timestamp": data.get("data", {}).get("timestamp"),
             },
-        )
-
-        logger.info(f"練習終了: session_id={self.session_id}")
+        }
 
+    @registry.message("ping", routing=ROUTE_REPLY)
     async def _handle_ping(self, data):
         """Pingメッセージの処理"""
-        await self.send(
-            text_data=json.dumps(
-                {
-                    "type": "pong",
-                    "data": {"timestamp": data.get("data", {}).get("timestamp")},
-                }
-            )
-        )
+        return {
+            "type": "pong",
+            "data": {"timestamp": data.get("data", {}).get("timestamp")},
+        }
+
+    @registry.message("heartbeat", routing=ROUTE_REPLY)
+    async def _handle_heartbeat(self, data):
+        """ハートビートへの応答の処理（受信時刻の更新のみ）"""
+        return None
+
+    @registry.message("idle", validator=_validate_idle)
+    async def _handle_idle(self, data):
+        """
+        バックグラウンド状態の切り替え
+
+        スマホがバックグラウンドに入ったら idle=true、戻ったら idle=false を送る。
+        ピアは idle のメンバーへのカメラフレームの送信を止める。
+        """
+        self.is_idle = data["data"]["idle"]
+
+        logger.info(f"idle状態変更: session_id={self.session_id}, idle={self.is_idle}")
 
+        return {"type": "idle", "data": {"idle": self.is_idle, "role": self.role}}
+
+    @registry.message("presence", routing=ROUTE_REPLY, rate_limit=2)
+    async def _handle_presence(self, data):
+        """ルームのメンバー（役割と最終確認時刻）を返す"""
+        members = await get_presence().members(self.room_group_name)
+
+        return {
+            "type": "presence",
+            "data": {
+                "count": len(members),
+                "roles": summarize(members),
+                "members": list(members.values()),
+            },
+        }
+
+    @registry.message(
+        "camera_frame",
+        delivery=DELIVER_LATEST,
+        rate_limit=camera_max_fps,
+    )
     async def _handle_camera_frame(self, data):
         """
         カメラフレームの処理
 
         PCから送信されたカメラフレームをモバイルコントローラーに転送する
         """
-        frame_data = data.get("data", {})
+        logger.debug(f"カメラフレーム転送: session_id={self.session_id}")
 
-        # チャネルグループにカメラフレームを送信（送信者以外）
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                "type": "camera_frame",
-                "data": frame_data,
-                "sender_id": self.channel_name,
-            },
+        return {"type": "camera_frame", "data": data.get("data", {})}
+
+    @registry.message(
+        BINARY_CAMERA_FRAME,
+        validator=_validate_frame_header,
+        delivery=DELIVER_LATEST,
+        rate_limit=camera_max_fps,
+        rate_key="camera_frame",
+    )
+    async def _handle_binary_camera_frame(self, frame):
+        """
+        バイナリカメラフレームの処理
+
+        ヘッダーのみを検証し、画像データはデコードせずにそのまま転送する。
+        JSON（base64）形式の camera_frame はフォールバックとして引き続き利用できる。
+        """
+        logger.debug(
+            f"バイナリカメラフレーム転送: session_id={self.session_id}, "
+            f"size={len(frame)}"
         )
 
-        logger.debug(f"カメラフレーム転送: session_id={self.session_id}")
+        self._store_camera_frame(frame)
+        return frame
 
+    def _store_camera_frame(self, frame):
+        """
+        HTTPポーリング（mobile_camera_frame）のスマートフォン用にフレームを保存する
+
+        保存はバックグラウンドで行い、前のフレームを保存中の場合と、前の保存から
+        1 / MOBILE_CAMERA_FRAME_MAX_FPS 秒経っていない場合は破棄する
+        （ルームでフレームを送るのはPCの1台なので、ルームあたりの上限になる）。
+        JPEG以外のフレームは保存しない。
+        """
+        if self.frame_store_task is not None and not self.frame_store_task.done():
+            return
+        now = time.monotonic()
+        max_fps = stored_frame_max_fps()
+        if (
+            max_fps
+            and self.frame_stored_at is not None
+            and now - self.frame_stored_at < 1.0 / max_fps
+        ):
+            return
+        if parse_header(frame).codec != CODEC_JPEG:
+            return
+        self.frame_stored_at = now
+        self.frame_store_task = asyncio.ensure_future(
+            self._save_camera_frame(frame[HEADER_SIZE:])
+        )
+
+    async def _save_camera_frame(self, payload):
+        """
+        フレームを取得しているスマートフォンがいる場合だけ保存する
+
+        保存は状態のバージョンを変えないため、ロングポーリング・SSEは起こさない。
+        """
+        store = get_session_state_store()
+        try:
+            if await store.ahas_frame_viewer(self.session_id):
+                await store.aset_frame(self.session_id, payload)
+        except Exception:
+            logger.error(
+                f"カメラフレーム保存エラー: session_id={self.session_id}", exc_info=True
+            )
+
+    @registry.message("frame_ack", validator=_validate_frame_ack, routing=ROUTE_REPLY)
+    async def _handle_frame_ack(self, data):
+        """
+        表示したカメラフレームの応答の処理
+
+        応答までの時間から受信側のスループットを推定し、配信品質の段階を選ぶ。
+        """
+        if self.frame_quality is not None:
+            self.frame_quality.acked(data["data"]["seq"])
+        return None
+
+    @registry.message("game_mode")
     async def _handle_game_mode(self, data):
         """ゲームモード設定の処理"""
         mode = data.get("mode")
 
-        # グループにゲームモード変更を通知
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                "type": "game_mode",
-                "mode": mode,
-                "sender_id": self.channel_name,
-            },
-        )
-
         logger.info(f"ゲームモード変更: session_id={self.session_id}, mode={mode}")
 
+        return {"type": "game_mode", "mode": mode}
+
+    @registry.message(
+        "game_update",
+        validator=_validate_game_update,
+        delivery=DELIVER_BATCHED,
+        replay=True,
+        merge=_merge_game_updates,
+    )
     async def _handle_game_update(self, data):
-        """ゲーム状態更新の処理"""
-        update_data = data.get("data", {})
+        """
+        ゲーム状態の差分の処理
 
-        # グループにゲーム状態更新を通知
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                "type": "game_update",
-                "data": update_data,
-                "sender_id": self.channel_name,
-            },
-        )
+        ルームのゲーム状態に差分を適用し、実際に変化した部分だけを
+        バージョン（version）と適用前のバージョン（base）付きで転送する。
+        受信側は base が自分のバージョンと異なれば game_sync で全体を要求する。
+        """
+        delta = data.get("data", {})
+        try:
+            update = await get_game_state_store().apply(self.room_group_name, delta)
+        except Exception:
+            logger.error(
+                f"ゲーム状態更新エラー: session_id={self.session_id}", exc_info=True
+            )
+            return {"type": "game_update", "data": delta}
+
+        if not update.delta:
+            return None
+
+        return {
+            "type": "game_update",
+            "data": update.delta,
+            "version": update.version,
+            "base": update.base,
+        }
 
+    @registry.message("game_sync", routing=ROUTE_REPLY, rate_limit=2)
+    async def _handle_game_sync(self, data):
+        """ゲーム状態の全体（スナップショット）を返す"""
+        version, state = await get_game_state_store().snapshot(self.room_group_name)
+
+        return {"type": "game_state", "data": state, "version": version}
+
+    @registry.message("judgement", delivery=DELIVER_BATCHED, replay=True)
     async def _handle_judgement(self, data):
         """判定結果の処理"""
-        judgement_data = data.get("data", {})
+        return self._with_clock({"type": "judgement", "data": data.get("data", {})})
 
-        # グループに判定結果を通知
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                "type": "judgement",
-                "data": judgement_data,
-                "sender_id": self.channel_name,
-            },
-        )
+    @registry.message("clock_sync", routing=ROUTE_REPLY, rate_limit=1)
+    async def _handle_clock_sync(self, data):
+        """
+        時刻同期の開始要求の処理
 
-    async def chord_change(self, event):
-        """コード変更イベントの送信"""
-        # 送信者以外に送信
-        if event.get("sender_id") != self.channel_name:
-            await self.send(
-                text_data=json.dumps(
-                    {"type": "chord_change", "data": {"chord": event["chord"]}}
-                )
-            )
+        指定された数のプローブ（clock_probe）を一定間隔で送信する。
+        クライアントは各プローブに受信時刻と送信時刻を付けて応答する。
+        """
+        count = data.get("data", {}).get("samples", DEFAULT_PROBE_COUNT)
+        if not isinstance(count, int) or isinstance(count, bool):
+            count = DEFAULT_PROBE_COUNT
+        count = max(1, min(count, MAX_PROBE_COUNT))
 
-    async def practice_update(self, event):
-        """練習状態更新イベントの送信"""
-        await self.send(
-            text_data=json.dumps(
-                {
-                    "type": "practice_update",
-                    "data": {
-                        "status": event["status"],
-                        "timestamp": event.get("timestamp"),
-                    },
-                }
+        if self.clock_task is not None:
+            self.clock_task.cancel()
+        self.clock_task = asyncio.ensure_future(self._send_clock_probes(count))
+        self.clock_task.add_done_callback(_log_task_error)
+
+    async def _send_clock_probes(self, count):
+        """時刻同期のプローブを送信する"""
+        for i in range(count):
+            if i:
+                await asyncio.sleep(PROBE_INTERVAL)
+            await self._send_message(
+                {"type": "clock_probe", "data": self.clock.create_probe()}
             )
-        )
+
+    @registry.message(
+        "clock_probe", validator=_validate_clock_probe, routing=ROUTE_REPLY
+    )
+    async def _handle_clock_probe(self, data):
+        """
+        プローブへの応答の処理
+
+        RTTと時計のずれのサンプルを記録し、現在の推定値を返す。
+        """
+        probe = data["data"]
+        sample = self.clock.complete_probe(probe["id"], probe["t1"], probe["t2"])
+        if sample is None:
+            return None
+
+        metrics = get_exporter()
+        metrics.observe("ws_clock_rtt_seconds", sample.rtt / 1000)
+        metrics.observe("ws_clock_offset_abs_seconds", abs(sample.offset) / 1000)
+
+        return {"type": "clock_sync", "data": self.clock.as_dict()}
+
+    def _with_clock(self, message):
+        """
+        送信者のRTTと時計のずれの推定値をメッセージに付ける
+
+        受信側はこの値と自分の推定値を使って、送信者のタイムスタンプを
+        自分の時計に換算できる。推定値がない場合はそのまま返す。
+        """
+        clock = self.clock.as_dict()
+        if clock is not None:
+            message["clock"] = clock
+        return message
+
+    async def _deliver(self, spec, message):
+        """
+        登録表にあるイベントを配送方法に従って送信する
+
+        送信者自身には送り返さない。イベントタイプごとのハンドラーメソッド
+        （chord_change など）はクラス定義の後に登録表から生成する。
+        """
+        if message.get("sender_id") == self.channel_name:
+            return
+
+        if spec.delivery == DELIVER_BATCHED:
+            await self._send_event(message)
+        elif spec.delivery == DELIVER_LATEST:
+            if self.is_idle:
+                # グループ送信で届いたフレームは idle の間は破棄する
+                get_exporter().increment(
+                    "ws_camera_frames_dropped_total", reason="idle"
+                )
+                return
+            # 未送信のフレームは最新のもので置き換える
+            self.camera_mailbox.put(**self._payload(message))
+        else:
+            await self._forward(message)
 
     async def connection_update(self, event):
         """接続状態更新イベントの送信"""
-        await self.send(
-            text_data=json.dumps(
+        await self._track_peer(event)
+
+        await self._forward(event)
+
+    async def idle(self, event):
+        """ピアの idle 状態を記録して送信する"""
+        sender_id = event.get("sender_id")
+        if sender_id == self.channel_name:
+            return
+
+        if event["message"]["data"]["idle"]:
+            self.idle_peers.add(sender_id)
+        else:
+            self.idle_peers.discard(sender_id)
+
+        await self._forward(event)
+
+    async def presence_replaced(self, event):
+        """同じクライアントの新しい接続などで置き換えられた接続を切断する"""
+        get_exporter().increment("ws_connections_replaced_total")
+        await self._leave_room()
+        await self.close(code=REPLACED_CLOSE_CODE)
+
+    async def peer_ack(self, event):
+        """既存メンバーからの応答を受け取り、ピアとして登録する"""
+        self.peers[event["channel_name"]] = event.get("codec")
+
+    async def event_batch(self, event):
+        """まとめて転送されたゲームイベントの送信"""
+        if event.get("sender_id") != self.channel_name:
+            for prepared in event["events"]:
+                await self._send_event(prepared)
+
+    async def _track_peer(self, event):
+        """
+        接続状態更新からピアのチャネル名とコーデックを記録する
+
+        新しく参加した接続には自分のチャネル名を直接返し、
+        双方が相手のチャネル名を知っている状態にする。
+        """
+        channel_name = event.get("channel_name")
+        if not channel_name or channel_name == self.channel_name:
+            return
+
+        if event["status"] == "connected":
+            self.peers[channel_name] = event.get("codec")
+            await self.channel_layer.send(
+                channel_name,
+                {
+                    "type": "peer_ack",
+                    "channel_name": self.channel_name,
+                    "codec": self.codec.name,
+                },
+            )
+        else:
+            self.peers.pop(channel_name, None)
+            self.idle_peers.discard(channel_name)
+
+    def _connection_event(self, status):
+        """接続状態更新イベントを作成する"""
+        return {
+            "type": "connection_update",
+            "status": status,
+            "channel_name": self.channel_name,
+            "codec": self.codec.name,
+            **self._prepare(
                 {
                     "type": "connection_update",
                     "data": {
-                        "status": event["status"],
-                        "user_id": event.get("user_id"),
+                        "status": status,
+                        "user_id": self.user.id if self.user else None,
+                        "role": self.role,
                     },
-                }
+                },
+                include_self=True,
+            ),
+        }
+
+    async def _send_camera_frame(self, bytes_data=None, text_data=None):
+        """
+        カメラフレームを受信側の配信品質の段階に縮小して送信する
+
+        JSON（base64）形式のフレームは縮小せずに送信する。
+        変換プールが混雑している場合は、大きいフレームを送らずに破棄する。
+        """
+        if bytes_data is None:
+            await self.send(text_data=text_data)
+            return
+
+        tier = self.frame_quality.tier
+        frame = bytes_data
+        if not tier.is_original:
+            try:
+                frame = await self.transcoder.transcode(bytes_data, tier)
+            except Exception:
+                logger.error(
+                    f"カメラフレーム変換エラー: session_id={self.session_id}",
+                    exc_info=True,
+                )
+                frame = None
+            if frame is None:
+                get_exporter().increment(
+                    "ws_camera_frames_dropped_total", reason="transcode"
+                )
+                return
+
+        await self.send(bytes_data=frame)
+        self.frame_quality.sent(
+            parse_header(bytes_data), len(frame), tier, original_size=len(bytes_data)
+        )
+
+    async def _relay(self, event):
+        """
+        イベントをルームの他のメンバーに転送する
+
+        ピアが1つだけの場合（PCとスマホの2人ルーム）は相手のチャネルに
+        直接送信し、グループ送信と自分へのエコーを省く。
+        それ以外の場合はグループ送信にフォールバックする。
+        """
+        if len(self.peers) == 1:
+            (peer,) = self.peers
+            with timed("ws_relay_duration_seconds", type=event["type"], mode="peer"):
+                await self.channel_layer.send(peer, event)
+        else:
+            await self._group_send(event)
+
+    async def _group_send(self, event):
+        """ルーム全体にイベントを送信し、所要時間を記録する"""
+        with timed("ws_relay_duration_seconds", type=event["type"], mode="group"):
+            await self.channel_layer.group_send(self.room_group_name, event)
+
+    def _prepare(self, message, include_self=False):
+        """
+        クライアントに送るメッセージを送信側で一度だけエンコードする
+
+        受信側はイベントに含まれるエンコード済みのペイロードをそのまま送信するため、
+        ブロードキャストのエンコードはメッセージごとに1回で済む。
+        ペイロードは既知のピアが使うコーデックごとに作成し、
+        該当するペイロードがない受信側は message から自分でエンコードする。
+
+        Args:
+            message: クライアントに送信するメッセージ
+            include_self: 自分自身も受信する場合はTrue
+
+        Returns:
+            イベントに追加する {"message": ..., "payloads": {コーデック名: データ}}
+        """
+        names = set(self.peers.values())
+        if include_self:
+            names.add(self.codec.name)
+
+        return {
+            "message": message,
+            "payloads": {
+                name: CODECS[name].encode(message) for name in names if name in CODECS
+            },
+        }
+
+    def _payload(self, event):
+        """イベントのペイロードから send に渡す引数を返す"""
+        if "frame" in event:
+            return {"bytes_data": event["frame"]}
+        data = event["payloads"].get(self.codec.name)
+        if data is None:
+            return self._encode(event["message"])
+        return {"bytes_data": data} if self.codec.binary else {"text_data": data}
+
+    async def _forward(self, event):
+        """エンコード済みのペイロードをクライアントに送信する"""
+        await self.send(**self._payload(event))
+
+    async def _send_event(self, event):
+        """
+        高頻度イベントを送信する
+
+        バッチ送信が有効な接続では時間窓内のイベントをまとめて送信する。
+        """
+        if self.batcher is not None:
+            self.batcher.add(event["message"])
+            get_exporter().observe(
+                "ws_outbound_queue_depth", self.batcher.pending, queue="batch"
             )
+        else:
+            await self._forward(event)
+
+    def _encode(self, message):
+        """メッセージをコーデックでエンコードし、send に渡す引数を返す"""
+        data = self.codec.encode(message)
+        return {"bytes_data": data} if self.codec.binary else {"text_data": data}
+
+    async def _send_message(self, message):
+        """メッセージをコーデックでエンコードして送信する"""
+        await self.send(**self._encode(message))
+
+    async def _send_error(self, message):
+        """エラーメッセージを送信"""
+        await self._send_message({"type": "error", "data": {"message": message}})
+
+    async def _sequence(self, *messages):
+        """
+        メッセージをリプレイバッファに記録し、ルーム内の連番（seq）を付ける
+
+        複数のメッセージは1回でまとめて記録する。
+        バッファの障害時は連番を付けずにそのまま転送する。
+        """
+        try:
+            seqs = await get_replay_buffer().append_many(
+                self.room_group_name, self.client_id, list(messages)
+            )
+            for message, seq in zip(messages, seqs):
+                message["seq"] = seq
+        except Exception:
+            logger.error(
+                f"リプレイバッファ記録エラー: session_id={self.session_id}",
+                exc_info=True,
+            )
+
+    async def _replay(self, last_seq):
+        """
+        再接続したクライアントに、最後に受信した連番より後のイベントを再送する
+
+        自分が送信したイベントは再送しない。古いイベントがバッファから
+        消えている場合は complete=False を通知し、ゲーム状態は全体を送り直す。
+
+        Returns:
+            bool: 取りこぼしをすべて再送できた場合はTrue
+        """
+        try:
+            last_seq = int(last_seq)
+        except ValueError:
+            last_seq = 0
+
+        try:
+            entries, complete = await get_replay_buffer().since(
+                self.room_group_name, last_seq
+            )
+        except Exception:
+            logger.error(
+                f"リプレイバッファ取得エラー: session_id={self.session_id}",
+                exc_info=True,
+            )
+            entries, complete = [], False
+        replayed = 0
+        for seq, origin, message in entries:
+            if origin == self.client_id:
+                continue
+            await self._send_message({**message, "seq": seq})
+            replayed += 1
+
+        get_exporter().increment("ws_resumes_total", complete=complete)
+        await self._send_message(
+            {"type": "resumed", "data": {"replayed": replayed, "complete": complete}}
         )
+        return complete
 
-    async def game_mode(self, event):
-        """ゲームモード変更イベントの送信"""
-        # 送信者以外に送信
-        if event.get("sender_id") != self.channel_name:
-            await self.send(
-                text_data=json.dumps(
-                    {
-                        "type": "game_mode",
-                        "mode": event["mode"],
-                    }
-                )
+    async def _send_game_state(self):
+        """参加時にルームのゲーム状態（あれば）を送る"""
+        try:
+            message = await self._handle_game_sync({})
+        except Exception:
+            logger.error(
+                f"ゲーム状態取得エラー: session_id={self.session_id}", exc_info=True
             )
+            return
 
-    async def game_update(self, event):
-        """ゲーム状態更新イベントの送信"""
-        # 送信者以外に送信
-        if event.get("sender_id") != self.channel_name:
-            await self.send(
-                text_data=json.dumps(
-                    {
-                        "type": "game_update",
-                        "data": event["data"],
-                    }
-                )
+        if message["version"]:
+            await self._send_message(message)
+
+    async def drain(self):
+        """
+        再開トークン付きの再接続要求を送って切断する（ワーカーのドレイン時）
+
+        クライアントは retry_after_ms だけ待ってから、トークンと最後に受信した
+        連番を付けて再接続する。待ち時間は再接続が集中しないようばらつかせる。
+        """
+        jitter = getattr(
+            settings, "GUITAR_WS_RECONNECT_JITTER_MS", DEFAULT_RECONNECT_JITTER_MS
+        )
+        await self._send_message(
+            {
+                "type": "reconnect",
+                "data": {
+                    "resume_token": issue_resume_token(
+                        self.session_id, self.client_id, self.role
+                    ),
+                    "retry_after_ms": random.randint(0, jitter),
+                },
+            }
+        )
+        await self.close(code=DRAIN_CLOSE_CODE)
+
+    async def _record_practice(self, status, func, *args):
+        """
+        練習セッションの保存を書き込みキューに入れる
+
+        保存の完了は待たずに戻り、完了したら送信者に通知する。
+        """
+        try:
+            future = get_write_queue().submit(func, *args)
+        except WriteQueueFull:
+            logger.warning(f"書き込みキューが満杯です: session_id={self.session_id}")
+            await self._send_error("Practice session could not be saved")
+            return
+
+        task = asyncio.ensure_future(self._notify_practice_saved(status, future))
+        self.write_tasks.add(task)
+        task.add_done_callback(self.write_tasks.discard)
+
+    async def _notify_practice_saved(self, status, future):
+        """保存した練習セッションを送信者に通知する"""
+        try:
+            session = await future
+        except Exception:
+            await self._send_error("Practice session could not be saved")
+            return
+
+        if session is None:
+            return
+
+        data = {"status": status, "session_id": session.id}
+        if status == "started":
+            data["started_at"] = session.started_at.isoformat()
+        else:
+            data["duration_minutes"] = session.duration_minutes
+            data["goal_achieved"] = session.goal_achieved
+        await self._send_message({"type": "practice_saved", "data": data})
+
+    def _client_id(self, query):
+        """
+        接続のクライアントIDを決める
+
+        再開トークンがあればその値を、なければクライアントがタブごとに保持する
+        ?client_id=... を使う。同じクライアントの再接続は、切断されずに残った
+        古い接続をプレゼンスで置き換える。
+        """
+        if self.resume:
+            return self.resume["client_id"]
+        client_id = query.get("client_id", [""])[0]
+        if CLIENT_ID_PATTERN.fullmatch(client_id):
+            return client_id
+        return uuid.uuid4().hex
+
+    async def _join_presence(self):
+        """
+        プレゼンスに参加する
+
+        Returns:
+            bool: 定員内で参加できた場合はTrue（プレゼンスの障害時も接続は許可する）
+        """
+        capacity = getattr(settings, "GUITAR_WS_ROOM_CAPACITY", DEFAULT_ROOM_CAPACITY)
+        try:
+            result = await get_presence().join(
+                self.room_group_name,
+                self.channel_name,
+                self.role,
+                user_id=self.user.id if self.user else None,
+                capacity=capacity,
+                client_id=self.client_id,
             )
+        except Exception:
+            logger.error(
+                f"プレゼンス登録エラー: session_id={self.session_id}", exc_info=True
+            )
+            return True
 
-    async def judgement(self, event):
-        """判定結果イベントの送信"""
-        # 送信者以外に送信
-        if event.get("sender_id") != self.channel_name:
-            await self.send(
-                text_data=json.dumps(
-                    {
-                        "type": "judgement",
-                        "data": event["data"],
-                    }
-                )
+        self.presence_seen_at = time.monotonic()
+        for channel_name in result.replaced:
+            await self._displace(channel_name)
+        return result.joined
+
+    async def _displace(self, channel_name):
+        """
+        プレゼンスで置き換えた接続をチャネルグループから外し、切断を要求する
+
+        古い接続のワーカーが残っていれば presence_replaced を受けて切断し、
+        ルームに切断を通知する。
+        """
+        logger.info(
+            f"古い接続を置き換え: session_id={self.session_id}, "
+            f"channel={channel_name}"
+        )
+        await self.channel_layer.group_discard(self.room_group_name, channel_name)
+        await self.channel_layer.send(channel_name, {"type": "presence_replaced"})
+
+    async def _touch_presence(self):
+        """一定間隔ごとにプレゼンスの最終確認時刻を更新する（ハートビート）"""
+        if self.presence_seen_at is None:
+            return
+        now = time.monotonic()
+        if now - self.presence_seen_at < PRESENCE_REFRESH_INTERVAL:
+            return
+
+        self.presence_seen_at = now
+        try:
+            await get_presence().heartbeat(self.room_group_name, self.channel_name)
+        except Exception:
+            logger.error(
+                f"プレゼンス更新エラー: session_id={self.session_id}", exc_info=True
             )
 
-    async def camera_frame(self, event):
+    async def _heartbeat(self, interval, timeout):
         """
-        カメラフレームイベントの送信
+        受信が途絶えた接続にハートビートを送り、タイムアウトしたら切断する
 
-        PCから送信されたカメラフレームをモバイルコントローラーに転送する
+        interval 秒以上受信がない場合に heartbeat を送る。クライアントは
+        heartbeat（または任意のメッセージ）で応答する。timeout 秒以上受信が
+        ない接続（スリープしたスマホなど）はルームから外して切断する。
         """
-        # 送信者以外に送信（PCが自分の送信したフレームを受け取らないように）
-        if event.get("sender_id") != self.channel_name:
-            await self.send(
-                text_data=json.dumps(
+        while True:
+            silent = time.monotonic() - self.last_seen
+            if silent >= timeout:
+                # 切断処理の途中で disconnect からキャンセルされないようにする
+                self.heartbeat_task = None
+                await self._reap(silent)
+                return
+            if silent >= interval:
+                await self._send_message(
                     {
-                        "type": "camera_frame",
-                        "data": event.get("data", {}),
+                        "type": "heartbeat",
+                        "data": {"timestamp": int(time.time() * 1000)},
                     }
                 )
-            )
+            await asyncio.sleep(min(interval, timeout - silent))
 
-    async def _send_error(self, message):
-        """エラーメッセージを送信"""
-        await self.send(
-            text_data=json.dumps({"type": "error", "data": {"message": message}})
+    async def _reap(self, silent):
+        """ハートビートの応答がない接続をルームから外して切断する"""
+        logger.info(
+            f"ハートビートタイムアウト: session_id={self.session_id}, "
+            f"silent={silent:.1f}s"
         )
+        get_exporter().increment("ws_connections_reaped_total")
+        try:
+            await self._leave_room()
+        except Exception:
+            logger.error(
+                f"ルーム退出エラー: session_id={self.session_id}", exc_info=True
+            )
+        await self.close(code=HEARTBEAT_TIMEOUT_CLOSE_CODE)
+
+    async def _leave_room(self):
+        """
+        プレゼンスとチャネルグループから退出し、切断を通知する
+
+        ハートビートのタイムアウト時と切断時の両方から呼ばれるため、
+        2回目以降は何もしない。参加前に拒否した接続（無効なセッション、
+        ドレイン中、満員）も何もしない。
+        """
+        if self.left or not self.joined:
+            return
+        self.left = True
+
+        await get_presence().leave(self.room_group_name, self.channel_name)
+
+        # チャネルグループから退出
+        await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
+
+        # 切断を通知
+        await self._group_send(self._connection_event("disconnected"))
 
     async def _validate_session(self):
         """
@@ -333,13 +1389,12 @@ class GuitarConsumer(AsyncWebsocketConsumer):
 
         Note:
             QRコードペアリングのセッションIDはRedisで管理されているため、
-            pairing_managerで検証する
+            pairing_managerで検証する。検証は非同期で行い、
+            検証済みのセッションIDはプロセス内で短時間キャッシュされる
         """
         try:
             # Redisのペアリングセッションで検証
-            is_valid = await database_sync_to_async(pairing_manager.validate_session)(
-                self.session_id
-            )
+            is_valid = await pairing_manager.avalidate_session(self.session_id)
 
             if is_valid:
                 logger.info(f"セッション検証成功: session_id={self.session_id}")
@@ -358,26 +1413,73 @@ class GuitarConsumer(AsyncWebsocketConsumer):
     async def disconnect(self, close_code):
         """切断時の処理"""
         try:
-            # チャネルグループから退出
-            await self.channel_layer.group_discard(
-                self.room_group_name, self.channel_name
-            )
+            # 時刻同期を停止し、未送信のカメラフレームとバッチを破棄
+            if self.clock_task is not None:
+                self.clock_task.cancel()
+            if self.heartbeat_task is not None:
+                self.heartbeat_task.cancel()
+            for task in self.coalesce_tasks.values():
+                task.cancel()
+            # 保存自体は書き込みキューで続行し、完了通知だけを止める
+            for task in list(self.write_tasks):
+                task.cancel()
+            await self.camera_mailbox.close()
+            if self.batcher is not None:
+                await self.batcher.close()
 
-            # 切断を通知
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    "type": "connection_update",
-                    "status": "disconnected",
-                    "user_id": self.user.id if self.user else None,
-                },
-            )
+            if self.accepted:
+                drain_coordinator.unregister(self)
+                self._record_disconnect(close_code)
+
+            await self._leave_room()
 
             logger.info(
                 f"WebSocket切断: session_id={self.session_id}, "
                 f"user_id={self.user.id if self.user else None}, "
-                f"code={close_code}"
+                f"code={close_code}, "
+                f"camera_delivered={self.camera_mailbox.delivered}, "
+                f"camera_dropped={self.camera_mailbox.dropped}, "
+                f"camera_throttled={self._camera_frames_throttled()}"
             )
 
         except Exception as e:
             logger.error(f"切断処理エラー: {e}", exc_info=True)
+
+    def _record_disconnect(self, close_code):
+        """切断時のメトリクスを記録する"""
+        GuitarConsumer.active_connections -= 1
+        metrics = get_exporter()
+        metrics.increment("ws_disconnections_total", code=close_code)
+        metrics.gauge("ws_active_connections", GuitarConsumer.active_connections)
+        metrics.increment(
+            "ws_camera_frames_dropped_total",
+            self.camera_mailbox.dropped,
+            reason="superseded",
+        )
+        metrics.increment(
+            "ws_camera_frames_dropped_total",
+            self._camera_frames_throttled(),
+            reason="throttled",
+        )
+
+    def _camera_frames_throttled(self):
+        """最大FPSを超えて破棄したカメラフレーム数"""
+        return self.throttled.get("camera_frame", 0) + self.throttled.get(
+            BINARY_CAMERA_FRAME, 0
+        )
+
+
+def _event_handler(spec):
+    """登録表のイベントタイプに対応するハンドラーメソッドを作成する"""
+
+    async def handler(self, event):
+        await self._deliver(spec, event)
+
+    handler.__name__ = spec.event_type
+    handler.__doc__ = f"{spec.event_type} イベントの送信"
+    return handler
+
+
+for _spec in registry.outbound.values():
+    if not hasattr(GuitarConsumer, _spec.event_type):
+        setattr(GuitarConsumer, _spec.event_type, _event_handler(_spec))
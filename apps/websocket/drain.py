@@ -0,0 +1,99 @@
+"""
+ワーカーのドレイン（段階的な切断）
+
+Daphneのワーカーを入れ替える前にドレインを開始すると、新しい接続を拒否し、
+既存の接続には再開トークン付きの再接続要求（reconnect）を送ってから切断する。
+切断はドレイン期間内に分散させ、クライアントの再接続が集中しないようにする。
+
+ドレインはシグナル（デフォルトは SIGUSR1）で開始する:
+    kill -USR1 <ワーカーのPID>
+"""
+
+import asyncio
+import logging
+import random
+import signal
+import weakref
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# 切断を分散させる期間（秒、デフォルト）
+DEFAULT_DRAIN_WINDOW = 5.0
+
+
+class DrainCoordinator:
+    """
+    プロセス内の接続のドレインを管理する
+
+    コンシューマーは接続確立時に register し、切断時に unregister する。
+    登録されたコンシューマーは drain() を実装する。
+    """
+
+    def __init__(self):
+        self.draining = False
+        self._consumers = weakref.WeakSet()
+        self._loop = None
+
+    def register(self, consumer):
+        """接続中のコンシューマーを登録する"""
+        self._loop = asyncio.get_running_loop()
+        self._consumers.add(consumer)
+
+    def unregister(self, consumer):
+        """コンシューマーの登録を解除する"""
+        self._consumers.discard(consumer)
+
+    def __len__(self):
+        return len(self._consumers)
+
+    async def start(self, window=None):
+        """
+        ドレインを開始する
+
+        Args:
+            window: 切断を分散させる期間（秒、省略時は GUITAR_WS_DRAIN_WINDOW）
+        """
+        if window is None:
+            window = getattr(settings, "GUITAR_WS_DRAIN_WINDOW", DEFAULT_DRAIN_WINDOW)
+
+        self.draining = True
+        consumers = list(self._consumers)
+        logger.info(f"ドレイン開始: connections={len(consumers)}, window={window}")
+
+        await asyncio.gather(
+            *(self._drain_later(c, random.uniform(0, window)) for c in consumers)
+        )
+
+    async def _drain_later(self, consumer, delay):
+        await asyncio.sleep(delay)
+        try:
+            await consumer.drain()
+        except Exception:
+            logger.error("ドレイン中の切断エラー", exc_info=True)
+
+    def reset(self):
+        """ドレインを解除する（テスト用）"""
+        self.draining = False
+
+    def install_signal_handler(self, signum=signal.SIGUSR1):
+        """
+        シグナルでドレインを開始するハンドラーを登録する
+
+        メインスレッド以外から呼ばれた場合は何もしない。
+        """
+
+        def handler(signum, frame):
+            if self._loop is None:
+                self.draining = True
+                return
+            self._loop.call_soon_threadsafe(lambda: asyncio.ensure_future(self.start()))
+
+        try:
+            signal.signal(signum, handler)
+        except ValueError:
+            logger.debug("シグナルハンドラーを登録できませんでした", exc_info=True)
+
+
+drain_coordinator = DrainCoordinator()
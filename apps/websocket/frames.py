@@ -0,0 +1,106 @@
+"""
+バイナリカメラフレームのフォーマット定義
+
+WebSocketのバイナリフレーム（bytes_data）でカメラ画像を転送するための
+固定長ヘッダーを定義する。サーバーはヘッダーのみを検証し、
+画像本体はデコードせずにそのまま転送する。
+
+フレーム構成（ビッグエンディアン）:
+    version (1B) | codec (1B) | seq (4B) | width (2B) | height (2B) | payload
+"""
+
+import struct
+from dataclasses import dataclass
+
+# ヘッダー構造: version, codec, seq, width, height
+HEADER_FORMAT = ">BBIHH"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+# プロトコルバージョン
+FRAME_VERSION = 1
+
+# コーデック識別子
+CODEC_JPEG = 1
+CODEC_WEBP = 2
+
+SUPPORTED_CODECS = {CODEC_JPEG: "image/jpeg", CODEC_WEBP: "image/webp"}
+
+# 1フレームの最大サイズ（バイト）
+MAX_FRAME_SIZE = 512 * 1024
+
+
+class FrameHeaderError(ValueError):
+    """バイナリフレームのヘッダーが不正な場合の例外"""
+
+
+@dataclass(frozen=True)
+class FrameHeader:
+    """バイナリカメラフレームのヘッダー"""
+
+    seq: int
+    width: int
+    height: int
+    codec: int = CODEC_JPEG
+    version: int = FRAME_VERSION
+
+    @property
+    def content_type(self) -> str:
+        """コーデックに対応するMIMEタイプ"""
+        return SUPPORTED_CODECS[self.codec]
+
+
+def pack_frame(header: FrameHeader, payload: bytes) -> bytes:
+    """
+    ヘッダーと画像データからバイナリフレームを生成する
+
+    Args:
+        header: フレームヘッダー
+        payload: エンコード済みの画像データ
+
+    Returns:
+        WebSocketでそのまま送信できるバイト列
+    """
+    return (
+        struct.pack(
+            HEADER_FORMAT,
+            header.version,
+            header.codec,
+            header.seq & 0xFFFFFFFF,
+            header.width,
+            header.height,
+        )
+        + payload
+    )
+
+
+def parse_header(frame: bytes) -> FrameHeader:
+    """
+    バイナリフレームのヘッダーを解析する
+
+    画像本体には触れないため、フレームサイズに関係なく一定コストで検証できる。
+
+    Args:
+        frame: 受信したバイナリフレーム
+
+    Returns:
+        解析されたFrameHeader
+
+    Raises:
+        FrameHeaderError: ヘッダーが短い、バージョンやコーデックが未対応、
+            またはフレームが大きすぎる場合
+    """
+    if len(frame) <= HEADER_SIZE:
+        raise FrameHeaderError("Frame is too short")
+    if len(frame) > MAX_FRAME_SIZE:
+        raise FrameHeaderError("Frame is too large")
+
+    version, codec, seq, width, height = struct.unpack_from(HEADER_FORMAT, frame)
+
+    if version != FRAME_VERSION:
+        raise FrameHeaderError(f"Unsupported frame version: {version}")
+    if codec not in SUPPORTED_CODECS:
+        raise FrameHeaderError(f"Unsupported codec: {codec}")
+
+    return FrameHeader(
+        seq=seq, width=width, height=height, codec=codec, version=version
+    )
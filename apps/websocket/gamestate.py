@@ -0,0 +1,259 @@
+"""
+ルームごとのゲーム状態
+
+game_update はゲーム状態の差分（JSON Merge Patch、RFC 7386 形式）として扱う。
+サーバーはルームごとにゲーム状態の文書とバージョン（単調増加する連番）を保持し、
+受信した差分を適用して、実際に変化した部分だけを他のメンバーに転送する。
+参加時や差分の取りこぼし（バージョンの飛び）を検出したときは、クライアントは
+全体のスナップショット（game_state）を受け取って状態を作り直す。
+
+差分の形式:
+    {"score": 120, "stats": {"perfect": 3}}   # 値を設定（辞書は再帰的に統合）
+    {"combo": null}                            # null はキーの削除
+
+設定例:
+    GUITAR_WS_GAME_STATE = {
+        "BACKEND": "apps.websocket.gamestate.RedisGameStateStore",
+        "OPTIONS": {"ttl": 3600},
+    }
+"""
+
+import asyncio
+import json
+import time
+import weakref
+from dataclasses import dataclass
+from typing import Optional
+
+import redis.asyncio as aioredis
+from django.conf import settings
+from django.utils.module_loading import import_string
+from redis.exceptions import WatchError
+
+DEFAULT_GAME_STATE_STORE = {"BACKEND": "apps.websocket.gamestate.RedisGameStateStore"}
+
+# ゲーム状態の有効期限（秒、最後の更新から）
+DEFAULT_STATE_TTL = 3600
+
+
+class Replace(dict):
+    """
+    既存の値と統合せずに置き換える辞書の値
+
+    compose() が、削除や辞書以外の値の後に辞書を設定する差分をまとめるときに使う。
+    JSON Merge Patch では表せないため、サーバー内で適用する差分にだけ現れる。
+    """
+
+
+def merge_patch(target: dict, patch: dict) -> dict:
+    """
+    差分を適用した新しい辞書を返す（target は変更しない）
+
+    Args:
+        target: 現在の状態
+        patch: 差分（値が None のキーは削除し、Replace の値は置き換える）
+    """
+    result = dict(target)
+    for key, value in patch.items():
+        if value is None:
+            result.pop(key, None)
+        elif isinstance(value, Replace):
+            result[key] = merge_patch({}, value)
+        elif isinstance(value, dict):
+            current = result.get(key)
+            result[key] = merge_patch(
+                current if isinstance(current, dict) else {}, value
+            )
+        else:
+            result[key] = value
+    return result
+
+
+def compose(first: dict, second: dict) -> dict:
+    """
+    2つの差分を1つにまとめる
+
+    compose(a, b) を適用した結果は、a と b を順に適用した結果と同じになる。
+    a で削除または辞書以外を設定したキーに b が辞書を設定する場合は、
+    適用時に既存の値と統合しないよう Replace にする。
+    """
+    result = dict(first)
+    for key, value in second.items():
+        if key not in result or not isinstance(value, dict):
+            result[key] = value
+            continue
+        current = result[key]
+        if isinstance(current, Replace):
+            result[key] = Replace(compose(current, value))
+        elif isinstance(current, dict):
+            result[key] = compose(current, value)
+        else:
+            result[key] = Replace(value)
+    return result
+
+
+def diff(old: dict, new: dict) -> dict:
+    """old を new にする差分を返す（変化がない場合は空の辞書）"""
+    patch = {}
+    for key in old.keys() - new.keys():
+        patch[key] = None
+    for key, value in new.items():
+        current = old.get(key)
+        if isinstance(value, dict) and isinstance(current, dict):
+            nested = diff(current, value)
+            if nested:
+                patch[key] = nested
+        elif key not in old or current != value:
+            patch[key] = value
+    return patch
+
+
+@dataclass(frozen=True)
+class StateUpdate:
+    """
+    差分を適用した結果
+
+    Attributes:
+        version: 適用後のバージョン
+        base: 適用前のバージョン
+        delta: 実際に変化した部分の差分（変化がない場合は空）
+    """
+
+    version: int
+    base: int
+    delta: dict
+
+
+class GameStateStore:
+    """ゲーム状態の保存先の基底クラス"""
+
+    def __init__(self, ttl: float = DEFAULT_STATE_TTL):
+        self.ttl = ttl
+
+    async def apply(self, room: str, patch: dict) -> StateUpdate:
+        """
+        差分を適用する
+
+        変化がない場合はバージョンを進めない。
+        """
+        raise NotImplementedError
+
+    async def snapshot(self, room: str) -> tuple:
+        """
+        現在の状態を返す
+
+        Returns:
+            (バージョン, 状態)。状態がない場合は (0, {})
+        """
+        raise NotImplementedError
+
+    @staticmethod
+    def _update(state, version, patch):
+        new_state = merge_patch(state, patch)
+        delta = diff(state, new_state)
+        if not delta:
+            return new_state, StateUpdate(version, version, {})
+        return new_state, StateUpdate(version + 1, version, delta)
+
+
+class InMemoryGameStateStore(GameStateStore):
+    """プロセス内で保持するゲーム状態（テスト・開発用）"""
+
+    def __init__(self, ttl=DEFAULT_STATE_TTL):
+        super().__init__(ttl)
+        self._rooms = {}
+
+    async def apply(self, room, patch):
+        version, state = await self.snapshot(room)
+        state, update = self._update(state, version, patch)
+        self._rooms[room] = (update.version, state, time.time())
+        return update
+
+    async def snapshot(self, room):
+        entry = self._rooms.get(room)
+        if entry is None or time.time() - entry[2] >= self.ttl:
+            return 0, {}
+        return entry[0], entry[1]
+
+
+class RedisGameStateStore(GameStateStore):
+    """
+    Redisのハッシュで保持するゲーム状態
+
+    ルームごとのハッシュ（gamestate:<ルーム名>）に状態（JSON）とバージョンを置き、
+    WATCH による楽観的ロックで差分を適用する。
+    """
+
+    KEY_PREFIX = "gamestate:"
+
+    def __init__(self, ttl=DEFAULT_STATE_TTL, url=None):
+        super().__init__(ttl)
+        self.url = url or settings.REDIS_URL
+        # 非同期クライアントはイベントループごとに作成する
+        self._clients = weakref.WeakKeyDictionary()
+
+    @property
+    def client(self):
+        """実行中のイベントループ用の非同期Redisクライアント"""
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            client = aioredis.from_url(self.url, decode_responses=True)
+            self._clients[loop] = client
+        return client
+
+    def _key(self, room):
+        return f"{self.KEY_PREFIX}{room}"
+
+    @staticmethod
+    def _parse(values):
+        state, version = values
+        return int(version or 0), json.loads(state) if state else {}
+
+    async def apply(self, room, patch):
+        key = self._key(room)
+        async with self.client.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    await pipe.watch(key)
+                    version, state = self._parse(
+                        await pipe.hmget(key, "state", "version")
+                    )
+                    state, update = self._update(state, version, patch)
+                    if not update.delta:
+                        await pipe.unwatch()
+                        return update
+
+                    pipe.multi()
+                    pipe.hset(
+                        key,
+                        mapping={"state": json.dumps(state), "version": update.version},
+                    )
+                    pipe.expire(key, int(self.ttl))
+                    await pipe.execute()
+                    return update
+                except WatchError:
+                    # 他のワーカーが先に更新した場合はやり直す
+                    continue
+
+    async def snapshot(self, room):
+        return self._parse(await self.client.hmget(self._key(room), "state", "version"))
+
+
+_game_state_store = None
+
+
+def get_game_state_store() -> GameStateStore:
+    """設定（GUITAR_WS_GAME_STATE）に従ってゲーム状態の保存先を返す"""
+    global _game_state_store
+    if _game_state_store is None:
+        config = getattr(settings, "GUITAR_WS_GAME_STATE", DEFAULT_GAME_STATE_STORE)
+        store_class = import_string(config["BACKEND"])
+        _game_state_store = store_class(**config.get("OPTIONS", {}))
+    return _game_state_store
+
+
+def set_game_state_store(store: Optional[GameStateStore]):
+    """ゲーム状態の保存先を差し替える（Noneで設定から再作成）"""
+    global _game_state_store
+    _game_state_store = store
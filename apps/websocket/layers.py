@@ -0,0 +1,335 @@
+"""
+WebSocket用チャネルレイヤー
+
+同じワーカー内に送信先がいる場合はメモリ上で直接配送し、
+それ以外の場合はRedisを経由するハイブリッドなチャネルレイヤーを提供する。
+ShardedChannelLayer は、ルームのグループとチャネルをコンシステントハッシュで
+複数のRedisに振り分ける。
+"""
+
+import asyncio
+import bisect
+import collections
+import copy
+import hashlib
+import logging
+import time
+
+from channels.exceptions import ChannelFull
+from channels_redis.core import RedisChannelLayer
+
+from .metrics import get_exporter
+
+logger = logging.getLogger(__name__)
+
+
+class _LocalChannel:
+    """プロセス内で受信中のチャネルの状態"""
+
+    __slots__ = ("buffer", "event", "redis_task")
+
+    def __init__(self):
+        self.buffer = collections.deque()
+        self.event = asyncio.Event()
+        # Redisからの受信タスク（ローカル配送で中断されないよう保持し続ける）
+        self.redis_task = None
+
+
+class HybridChannelLayer(RedisChannelLayer):
+    """
+    ローカル配送を優先するRedisチャネルレイヤー
+
+    このプロセスで作成されたチャネル宛てのメッセージ（send / group_send）は
+    Redisを経由せずにメモリ上で配送する。PCとスマホが同じDaphneワーカーに
+    接続している場合、コード変更や判定イベントはRedisを一切使わない。
+
+    ルームを1つのワーカーに固定する（スティッキールーティング）と
+    ローカル配送の割合が高くなる。配送の内訳は stats() で取得でき、
+    メトリクス（ws_layer_local_hits_total / ws_layer_remote_sends_total）にも記録する。
+    """
+
+    # Redis上のメンバーへの配送（期限切れメッセージの削除と容量チェックを含む）
+    # channels_redis 4.3.0 の RedisChannelLayer.group_send 内のスクリプト
+    # （公開されていないため複製している）を元に、容量チェックの前に
+    # ZREMRANGEBYSCORE で期限切れのメッセージを削除する処理を追加している。
+    # 元のスクリプトは期限切れのメッセージも容量に数えるため、受信されない
+    # チャネルが容量超過のままになる。requirements.txt でバージョンを固定し、
+    # 更新する場合は元のスクリプトとの差分がこの削除処理だけであることを確認する。
+    GROUP_SEND_LUA = """
+        local current_time = ARGV[#ARGV - 1]
+        local expiry = ARGV[#ARGV]
+        local over_capacity = 0
+        for i=1,#KEYS do
+            redis.call('ZREMRANGEBYSCORE', KEYS[i], 0, current_time - expiry)
+            local capacity = tonumber(ARGV[i + #KEYS])
+            if redis.call('ZCOUNT', KEYS[i], '-inf', '+inf') < capacity then
+                redis.call('ZADD', KEYS[i], current_time, ARGV[i])
+                redis.call('EXPIRE', KEYS[i], expiry)
+            else
+                over_capacity = over_capacity + 1
+            end
+        end
+        return over_capacity
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._local_channels = {}
+
+        # 配送統計
+        self.local_deliveries = 0
+        self.remote_deliveries = 0
+
+    # --- 統計 ---
+
+    @property
+    def local_hit_ratio(self) -> float:
+        """全配送のうちローカル配送の割合（0.0〜1.0）"""
+        total = self.local_deliveries + self.remote_deliveries
+        return self.local_deliveries / total if total else 0.0
+
+    def stats(self) -> dict:
+        """
+        配送統計を取得する
+
+        Returns:
+            {
+                'local_deliveries': 120,
+                'remote_deliveries': 30,
+                'local_hit_ratio': 0.8,
+                'local_channels': 4
+            }
+        """
+        return {
+            "local_deliveries": self.local_deliveries,
+            "remote_deliveries": self.remote_deliveries,
+            "local_hit_ratio": self.local_hit_ratio,
+            "local_channels": len(self._local_channels),
+        }
+
+    # --- チャネルレイヤーAPI ---
+
+    async def new_channel(self, prefix="specific"):
+        """プロセス内のチャネルを作成し、ローカル配送の対象として登録する"""
+        channel = await super().new_channel(prefix)
+        self._local_channels[channel] = _LocalChannel()
+        return channel
+
+    async def send(self, channel, message):
+        """送信先がローカルならメモリ上で配送し、それ以外はRedisで送信する"""
+        local = self._local_channels.get(channel)
+        if local is None:
+            self._count_remote(1)
+            await super().send(channel, message)
+            return
+
+        assert isinstance(message, dict), "message is not a dict"
+        if len(local.buffer) >= self.get_capacity(channel):
+            raise ChannelFull()
+        self._deliver_local(local, message)
+
+    async def receive(self, channel):
+        """
+        メッセージを受信する
+
+        ローカルチャネルでは、メモリ上のバッファとRedisからの受信を並行して待つ。
+        Redisの受信タスクは次の受信に引き継ぎ、キャンセルによるメッセージ
+        消失を避ける。
+        """
+        local = self._local_channels.get(channel)
+        if local is None:
+            return await super().receive(channel)
+
+        try:
+            while True:
+                if local.buffer:
+                    return local.buffer.popleft()
+
+                if local.redis_task is None:
+                    local.redis_task = asyncio.ensure_future(super().receive(channel))
+
+                local.event.clear()
+                waiter = asyncio.ensure_future(local.event.wait())
+                done, _ = await asyncio.wait(
+                    {waiter, local.redis_task}, return_when=asyncio.FIRST_COMPLETED
+                )
+                if local.redis_task in done:
+                    waiter.cancel()
+                    task, local.redis_task = local.redis_task, None
+                    return task.result()
+
+        except asyncio.CancelledError:
+            # コンシューマーの終了時: チャネルの登録を解除する
+            self._discard_local_channel(channel)
+            raise
+
+    async def group_send(self, group, message):
+        """
+        グループにメッセージを送信する
+
+        ローカルのメンバーにはメモリ上で配送し、残りのメンバーにだけ
+        Redisで配送する。
+        """
+        assert self.require_valid_group_name(group), "Group name not valid"
+        key = self._group_key(group)
+        connection = self.connection(self.consistent_hash(group))
+        await connection.zremrangebyscore(
+            key, min=0, max=int(time.time()) - self.group_expiry
+        )
+        channel_names = [x.decode("utf8") for x in await connection.zrange(key, 0, -1)]
+
+        remote_channels = []
+        for channel in channel_names:
+            local = self._local_channels.get(channel)
+            if local is None:
+                remote_channels.append(channel)
+            elif len(local.buffer) < self.get_capacity(channel):
+                self._deliver_local(local, message)
+            else:
+                logger.info(f"ローカルチャネルの容量超過: group={group}")
+
+        if remote_channels:
+            await self._group_send_remote(group, remote_channels, message)
+
+    async def flush(self):
+        """ローカルのバッファもあわせて破棄する"""
+        for channel in list(self._local_channels):
+            self._discard_local_channel(channel)
+        await super().flush()
+
+    # --- 内部処理 ---
+
+    def _deliver_local(self, local, message):
+        """メモリ上でメッセージを配送する"""
+        local.buffer.append(copy.deepcopy(message))
+        local.event.set()
+        self.local_deliveries += 1
+        get_exporter().increment("ws_layer_local_hits_total")
+
+    def _count_remote(self, count):
+        """Redis経由の配送を記録する"""
+        self.remote_deliveries += count
+        get_exporter().increment("ws_layer_remote_sends_total", count)
+
+    def _discard_local_channel(self, channel):
+        """ローカルチャネルを登録解除し、Redisの受信タスクを停止する"""
+        local = self._local_channels.pop(channel, None)
+        if local is not None and local.redis_task is not None:
+            local.redis_task.cancel()
+
+    async def _group_send_remote(self, group, channel_names, message):
+        """Redis上のメンバーにグループメッセージを配送する"""
+        (
+            connection_to_channel_keys,
+            channel_keys_to_message,
+            channel_keys_to_capacity,
+        ) = self._map_channel_keys_to_connection(channel_names, message)
+
+        for connection_index, channel_redis_keys in connection_to_channel_keys.items():
+            connection = self.connection(connection_index)
+            args = [channel_keys_to_message[key] for key in channel_redis_keys]
+            args += [channel_keys_to_capacity[key] for key in channel_redis_keys]
+            args += [time.time(), self.expiry]
+
+            over_capacity = await connection.eval(
+                self.GROUP_SEND_LUA,
+                len(channel_redis_keys),
+                *channel_redis_keys,
+                *args,
+            )
+            if over_capacity > 0:
+                logger.info(
+                    f"{over_capacity}/{len(channel_names)} チャネルが容量超過: "
+                    f"group={group}"
+                )
+
+        self._count_remote(len(channel_names))
+
+
+# ハッシュリング上の1シャードあたりの仮想ノード数（デフォルト）
+DEFAULT_RING_REPLICAS = 160
+
+
+class ConsistentHashRing:
+    """
+    仮想ノードを使ったコンシステントハッシュのリング
+
+    ノードの位置はノード名（RedisのURLなど）だけから決まるため、ノードを
+    追加しても既存ノードの位置は変わらない。N台からN+1台に増やした場合に
+    別のノードへ移るキーは約 1/(N+1) で済む（channels_redis 標準のハッシュでは
+    約半分が移る）。
+    """
+
+    def __init__(self, nodes, replicas: int = DEFAULT_RING_REPLICAS):
+        """
+        Args:
+            nodes: ノード名のリスト（インデックスが get() の戻り値になる）
+            replicas: 1ノードあたりの仮想ノード数
+        """
+        if not nodes:
+            raise ValueError("ConsistentHashRing requires at least one node")
+
+        points = []
+        for index, node in enumerate(nodes):
+            for replica in range(replicas):
+                points.append((self._hash(f"{node}#{replica}"), index))
+        points.sort()
+
+        self._points = [point for point, _ in points]
+        self._indexes = [index for _, index in points]
+        self.size = len(nodes)
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        return int.from_bytes(hashlib.md5(value.encode("utf8")).digest()[:8], "big")
+
+    def get(self, key: str) -> int:
+        """キーを担当するノードのインデックスを返す"""
+        if self.size == 1:
+            return 0
+        position = bisect.bisect(self._points, self._hash(key))
+        return self._indexes[position % len(self._points)]
+
+
+class ShardedChannelLayer(HybridChannelLayer):
+    """
+    ルームを複数のRedisに振り分けるチャネルレイヤー
+
+    グループ（guitar_<session_id>）とプロセス固有チャネルの担当Redisを
+    コンシステントハッシュで決める。hosts にRedisを追加しても、
+    担当が変わるルームは一部に限られる。全ワーカーで同じ hosts を設定すること
+    （順序は問わない）。
+
+    設定例:
+        CHANNEL_LAYERS = {
+            "default": {
+                "BACKEND": "apps.websocket.layers.ShardedChannelLayer",
+                "CONFIG": {
+                    "hosts": ["redis://redis-1:6379/0", "redis://redis-2:6379/0"],
+                    "ring_replicas": 160,
+                },
+            },
+        }
+    """
+
+    def __init__(self, *args, ring_replicas=DEFAULT_RING_REPLICAS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.ring = ConsistentHashRing(
+            [self._node_name(host) for host in self.hosts], ring_replicas
+        )
+
+    @staticmethod
+    def _node_name(host: dict) -> str:
+        """リング上のノード名（接続先のアドレス）"""
+        return str(host.get("address", sorted(host.items())))
+
+    def consistent_hash(self, value):
+        """
+        グループ名またはチャネル名を担当するRedisのインデックスを返す
+
+        プロセス固有チャネル（specific.xxx!yyy）は「!」までで判定し、
+        送信と受信で同じRedisを使うようにする。
+        """
+        if "!" in value:
+            value = self.non_local_name(value)
+        return self.ring.get(value)
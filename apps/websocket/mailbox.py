@@ -0,0 +1,101 @@
+"""
+カメラフレーム用の最新フレーム優先メールボックス
+
+送信が追いつかない接続に対して、未送信のフレームを新しいフレームで
+置き換えることで、遅延とメモリ使用量を一定に保つ。
+"""
+
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class LatestFrameMailbox:
+    """
+    接続ごとの「最新フレームのみ」メールボックス
+
+    未送信のフレームは常に1つまでしか保持せず、新しいフレームが届くと
+    古いフレームは破棄される。送信は専用タスクで行うため、
+    呼び出し側（チャネルレイヤーのハンドラー）はブロックされない。
+    """
+
+    def __init__(self, send, min_interval: float = 0.0):
+        """
+        Args:
+            send: フレームを送信するコルーチン関数（consumer.send）
+            min_interval: フレーム送信間隔の下限（秒）。0の場合は制限なし
+        """
+        self._send = send
+        self.min_interval = min_interval
+        self._pending = None
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+        # 統計情報
+        self.delivered = 0
+        self.dropped = 0
+
+    @property
+    def has_pending(self) -> bool:
+        """未送信のフレームがあるかどうか"""
+        return self._pending is not None
+
+    def put(self, **frame):
+        """
+        フレームを投入する
+
+        未送信のフレームがある場合は置き換え、破棄数をカウントする。
+
+        Args:
+            **frame: consumer.send に渡すキーワード引数
+                （text_data または bytes_data）
+        """
+        if self._pending is not None:
+            self.dropped += 1
+        self._pending = frame
+        self._wakeup.set()
+
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def _run(self):
+        """未送信フレームを順次送信するループ"""
+        loop = asyncio.get_running_loop()
+        last_sent_at = None
+
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+
+            # 送信間隔の制限（待機中に届いたフレームは置き換えられる）
+            if self.min_interval and last_sent_at is not None:
+                wait = self.min_interval - (loop.time() - last_sent_at)
+                if wait > 0:
+                    await asyncio.sleep(wait)
+
+            frame, self._pending = self._pending, None
+            if frame is None:
+                continue
+
+            try:
+                await self._send(**frame)
+                self.delivered += 1
+            except Exception:
+                logger.error("カメラフレーム送信エラー", exc_info=True)
+
+            last_sent_at = loop.time()
+
+    async def close(self):
+        """送信タスクを停止し、未送信フレームを破棄する"""
+        if self._pending is not None:
+            self.dropped += 1
+            self._pending = None
+
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,270 @@
+"""
+WebSocketのメトリクス
+
+GuitarConsumer の処理時間やメッセージ数を記録し、設定で選択した
+エクスポーターに出力する。
+
+- PrometheusExporter: プロセス内で集計し、テキスト形式で公開する（デフォルト）
+- StatsdExporter: statsd（DogStatsDのタグ形式）にUDPで送信する
+- InMemoryExporter: 記録した値をそのまま保持する（テスト用）
+
+設定例:
+    GUITAR_WS_METRICS_EXPORTER = {
+        "BACKEND": "apps.websocket.metrics.StatsdExporter",
+        "OPTIONS": {"host": "127.0.0.1", "port": 8125},
+    }
+"""
+
+import logging
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EXPORTER = {"BACKEND": "apps.websocket.metrics.PrometheusExporter"}
+
+# ヒストグラムのバケット（秒）
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+)
+
+# 処理時間以外のヒストグラムのバケット（メトリクス名ごと）
+METRIC_BUCKETS = {
+    "ws_outbound_queue_depth": (1, 2, 5, 10, 20, 50),
+    "ws_write_batch_size": (1, 2, 5, 10, 20, 50),
+}
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+
+class MetricsExporter:
+    """
+    エクスポーターの基底クラス
+
+    - increment: カウンターを加算する
+    - gauge: 現在値を設定する
+    - observe: 分布（処理時間など）に値を記録する
+    """
+
+    def increment(self, name: str, value: float = 1, **labels):
+        raise NotImplementedError
+
+    def gauge(self, name: str, value: float, **labels):
+        raise NotImplementedError
+
+    def observe(self, name: str, value: float, **labels):
+        raise NotImplementedError
+
+
+class InMemoryExporter(MetricsExporter):
+    """記録した値をメモリ上に保持するエクスポーター（テスト用）"""
+
+    def __init__(self):
+        self.counters = {}
+        self.gauges = {}
+        self.observations = {}
+
+    def increment(self, name, value=1, **labels):
+        key = (name, _label_key(labels))
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def gauge(self, name, value, **labels):
+        self.gauges[(name, _label_key(labels))] = value
+
+    def observe(self, name, value, **labels):
+        self.observations.setdefault((name, _label_key(labels)), []).append(value)
+
+    def counter_value(self, name: str, **labels) -> float:
+        """カウンターの値を返す"""
+        return self.counters.get((name, _label_key(labels)), 0)
+
+    def gauge_value(self, name: str, **labels):
+        """ゲージの値を返す（未設定の場合はNone）"""
+        return self.gauges.get((name, _label_key(labels)))
+
+    def observed(self, name: str, **labels) -> list:
+        """記録された値のリストを返す"""
+        return self.observations.get((name, _label_key(labels)), [])
+
+
+class PrometheusExporter(MetricsExporter):
+    """
+    Prometheusのテキスト形式で公開するエクスポーター
+
+    値はプロセス内で集計される。複数のワーカーで動かす場合は
+    ワーカーごとにスクレイプするか StatsdExporter を使うこと。
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.metric_buckets = dict(METRIC_BUCKETS)
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+
+    def increment(self, name, value=1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def gauge(self, name, value, **labels):
+        with self._lock:
+            self._gauges[(name, _label_key(labels))] = value
+
+    def observe(self, name, value, **labels):
+        key = (name, _label_key(labels))
+        buckets = self._buckets(name)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {
+                    "buckets": [0] * len(buckets),
+                    "sum": 0.0,
+                    "count": 0,
+                }
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram["buckets"][i] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+    def render(self) -> str:
+        """Prometheusのテキスト形式で出力する"""
+        lines = []
+        with self._lock:
+            lines += self._render_simple(self._counters, "counter")
+            lines += self._render_simple(self._gauges, "gauge")
+
+            for name, series in self._group(self._histograms).items():
+                lines.append(f"# TYPE {name} histogram")
+                for labels, histogram in series:
+                    buckets = self._buckets(name)
+                    for bound, count in zip(buckets, histogram["buckets"]):
+                        le = (("le", repr(bound)),)
+                        lines.append(
+                            f"{name}_bucket{_format_labels(labels + le)} {count}"
+                        )
+                    inf = (("le", "+Inf"),)
+                    lines.append(
+                        f"{name}_bucket{_format_labels(labels + inf)} "
+                        f"{histogram['count']}"
+                    )
+                    lines.append(
+                        f"{name}_sum{_format_labels(labels)} {histogram['sum']}"
+                    )
+                    lines.append(
+                        f"{name}_count{_format_labels(labels)} {histogram['count']}"
+                    )
+        return "\n".join(lines) + "\n"
+
+    def _buckets(self, name):
+        return self.metric_buckets.get(name, self.buckets)
+
+    def _render_simple(self, values, metric_type):
+        lines = []
+        for name, series in self._group(values).items():
+            lines.append(f"# TYPE {name} {metric_type}")
+            for labels, value in series:
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+        return lines
+
+    @staticmethod
+    def _group(values):
+        grouped = {}
+        for (name, labels), value in sorted(values.items()):
+            grouped.setdefault(name, []).append((labels, value))
+        return grouped
+
+
+class StatsdExporter(MetricsExporter):
+    """
+    statsdにUDPで送信するエクスポーター
+
+    ラベルはDogStatsDのタグ形式（|#key:value）で送信する。
+    送信に失敗しても例外は送出しない。
+    """
+
+    def __init__(self, host="127.0.0.1", port=8125, prefix="virtutune"):
+        self.address = (host, port)
+        self.prefix = prefix
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.setblocking(False)
+
+    def increment(self, name, value=1, **labels):
+        self._send(name, value, "c", labels)
+
+    def gauge(self, name, value, **labels):
+        self._send(name, value, "g", labels)
+
+    def observe(self, name, value, **labels):
+        if name in METRIC_BUCKETS:
+            self._send(name, value, "h", labels)
+        else:
+            # 処理時間はミリ秒のタイマーとして送信する
+            self._send(name, value * 1000, "ms", labels)
+
+    def _send(self, name, value, metric_type, labels):
+        packet = f"{self.prefix}.{name}:{value}|{metric_type}"
+        if labels:
+            packet += "|#" + ",".join(f"{k}:{v}" for k, v in sorted(labels.items()))
+        try:
+            self._socket.sendto(packet.encode(), self.address)
+        except OSError:
+            logger.debug("statsdへの送信に失敗しました", exc_info=True)
+
+
+def _format_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    body = ",".join(
+        '{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"'))
+        for k, v in labels
+    )
+    return "{" + body + "}"
+
+
+_exporter = None
+
+
+def get_exporter() -> MetricsExporter:
+    """設定（GUITAR_WS_METRICS_EXPORTER）に従ってエクスポーターを返す"""
+    global _exporter
+    if _exporter is None:
+        config = getattr(settings, "GUITAR_WS_METRICS_EXPORTER", DEFAULT_EXPORTER)
+        exporter_class = import_string(config["BACKEND"])
+        _exporter = exporter_class(**config.get("OPTIONS", {}))
+    return _exporter
+
+
+def set_exporter(exporter: MetricsExporter):
+    """エクスポーターを差し替える（Noneで設定から再作成）"""
+    global _exporter
+    _exporter = exporter
+
+
+@contextmanager
+def timed(name: str, **labels):
+    """ブロックの処理時間（秒）を記録する"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        get_exporter().observe(name, time.perf_counter() - started, **labels)
@@ -0,0 +1,88 @@
+"""
+WebSocket経由の練習セッションの記録
+
+practice_start / practice_end を受けた GuitarConsumer が、HTTP API
+（/guitar/api/start/, /guitar/api/end/）を使わずに ProgressService で
+練習セッションを保存する。メソッドは同期処理で、書き込みキューの
+ワーカースレッドで実行する。
+
+送信者が未ログイン（ペアリングしたスマートフォンなど）の場合は、
+ペアリングセッションを作成したユーザーの練習として記録する。
+"""
+
+from typing import Optional
+
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+
+from apps.mobile.services import pairing_manager
+from apps.progress.models import PracticeSession
+from apps.progress.services import ProgressService
+
+
+class PracticeRecorder:
+    """
+    接続ごとの練習セッションの記録
+
+    書き込みキューは投入順に実行するため、開始の直後に終了が届いても
+    終了は作成済みのセッションに対して行われる。
+    """
+
+    def __init__(self, user, pairing_session_id=None):
+        self.user = user
+        self.pairing_session_id = pairing_session_id
+        self.session = None
+
+    def _resolve_user(self):
+        """記録するユーザー（未ログインの場合はペアリングセッションの所有者）"""
+        if self.user is None and self.pairing_session_id is not None:
+            pairing = pairing_manager.get_session(self.pairing_session_id)
+            if pairing and pairing.get("user_id") is not None:
+                self.user = (
+                    get_user_model().objects.filter(id=pairing["user_id"]).first()
+                )
+        return self.user
+
+    def start(self) -> Optional[PracticeSession]:
+        """
+        練習セッションを作成する（開始済みの場合は既存のセッションを返す）
+
+        Returns:
+            作成したセッション。記録するユーザーがいない場合はNone
+        """
+        if self.session is None:
+            user = self._resolve_user()
+            if user is None:
+                return None
+            self.session = ProgressService.start_session(user)
+        return self.session
+
+    def end(self, chords=None, session_id=None):
+        """
+        練習セッションを終了する
+
+        Args:
+            chords: 練習したコードのリスト
+            session_id: 終了するセッションID（別の接続で開始した場合や再接続後）
+
+        Returns:
+            終了したセッション。対象のセッションがない場合はNone
+        """
+        session = self.session
+        if session_id is not None and (session is None or session.id != session_id):
+            user = self._resolve_user()
+            if user is None:
+                return None
+            session = PracticeSession.objects.filter(
+                id=session_id, user=user, ended_at__isnull=True
+            ).first()
+        if session is None:
+            return None
+
+        duration_minutes = ProgressService.calculate_duration(
+            session.started_at, timezone.now()
+        )
+        session = ProgressService.end_session(session, chords or [], duration_minutes)
+        if self.session is not None and self.session.id == session.id:
+            self.session = None
+        return session
@@ -0,0 +1,373 @@
+"""
+ルームのプレゼンス管理
+
+/ws/guitar/ のルームごとに、接続中のメンバー（チャネル名）とデバイスの
+役割（pc / mobile）、最終確認時刻を記録する。メンバーはハートビートで
+更新され、一定時間更新がないものは期限切れとして扱う。
+
+正常に切断されなかった接続（通信が途切れたスマホなど）のメンバーは期限切れ
+まで残るため、同じクライアント・同じユーザーの同じ役割での再接続や、
+しばらく更新のない同じ役割のメンバーは、新しい接続で置き換える。置き換えた
+メンバーのチャネル名は参加結果（JoinResult）で返し、呼び出し側が切断する。
+
+- RedisPresence: Redisのハッシュで管理する（本番用、ワーカー間で共有）
+- InMemoryPresence: プロセス内の辞書で管理する（テスト・開発用）
+
+設定例:
+    GUITAR_WS_PRESENCE = {
+        "BACKEND": "apps.websocket.presence.RedisPresence",
+        "OPTIONS": {"ttl": 60, "stale_after": 45},
+    }
+"""
+
+import asyncio
+import json
+import time
+import weakref
+from dataclasses import dataclass
+from typing import Optional
+
+import redis.asyncio as aioredis
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+DEFAULT_PRESENCE = {"BACKEND": "apps.websocket.presence.RedisPresence"}
+
+# デバイスの役割
+ROLE_PC = "pc"
+ROLE_MOBILE = "mobile"
+ROLE_UNKNOWN = "unknown"
+ROLES = (ROLE_PC, ROLE_MOBILE)
+
+# メンバーの有効期限（秒、ハートビートがない場合）
+DEFAULT_TTL = 60
+
+# 同じ役割の新しい接続で置き換えるまでの、メンバーの更新がない時間（秒）
+DEFAULT_STALE_AFTER = 45
+
+
+@dataclass(frozen=True)
+class JoinResult:
+    """
+    ルームへの参加結果
+
+    Attributes:
+        joined: 定員内で参加できた場合はTrue
+        replaced: この接続で置き換えたメンバーのチャネル名（参加できた場合のみ）
+    """
+
+    joined: bool
+    replaced: tuple = ()
+
+
+class Presence:
+    """
+    プレゼンス管理の基底クラス
+
+    メンバーは {"role": ..., "user_id": ..., "client_id": ..., "last_seen": ...}
+    の辞書で表す。
+    """
+
+    def __init__(
+        self, ttl: float = DEFAULT_TTL, stale_after: float = DEFAULT_STALE_AFTER
+    ):
+        self.ttl = ttl
+        self.stale_after = stale_after
+
+    async def join(
+        self,
+        room: str,
+        channel_name: str,
+        role: str,
+        user_id=None,
+        capacity: Optional[int] = None,
+        client_id: Optional[str] = None,
+    ) -> JoinResult:
+        """
+        ルームに参加する
+
+        期限切れのメンバーと、この接続で置き換えるメンバー（同じ役割で、
+        クライアントIDかユーザーIDが同じもの、または stale_after 秒以上
+        更新のないもの）を除いたうえで、定員に達している場合は参加を拒否する。
+        置き換えるメンバーは参加できた場合にだけ削除する。
+
+        Args:
+            room: ルーム名
+            channel_name: 接続のチャネル名
+            role: デバイスの役割（pc / mobile）
+            user_id: ユーザーID
+            capacity: 定員（Noneで無制限）
+            client_id: クライアントID（タブごとにクライアントが保持する）
+
+        Returns:
+            JoinResult: 参加できたかと、置き換えたメンバーのチャネル名
+        """
+        raise NotImplementedError
+
+    async def heartbeat(self, room: str, channel_name: str):
+        """メンバーの最終確認時刻を更新する"""
+        raise NotImplementedError
+
+    async def leave(self, room: str, channel_name: str):
+        """ルームから退出する"""
+        raise NotImplementedError
+
+    async def members(self, room: str) -> dict:
+        """期限切れでないメンバーを {チャネル名: メンバー} で返す"""
+        raise NotImplementedError
+
+    async def count(self, room: str) -> int:
+        """ルームのメンバー数を返す（期限切れのメンバーを含む場合がある）"""
+        raise NotImplementedError
+
+    def _member(self, role, user_id, now, client_id=None):
+        return {
+            "role": role,
+            "user_id": user_id,
+            "client_id": client_id,
+            "last_seen": now,
+        }
+
+    def _is_alive(self, member: dict, now: float) -> bool:
+        return now - member["last_seen"] < self.ttl
+
+    def _is_replaced_by(self, member: dict, new: dict, now: float) -> bool:
+        """member が新しく参加するメンバー new で置き換えられるかを返す"""
+        if member.get("role") != new["role"]:
+            return False
+        if new["client_id"] is not None and member.get("client_id") == new["client_id"]:
+            return True
+        if new["user_id"] is not None and member.get("user_id") == new["user_id"]:
+            return True
+        return now - member["last_seen"] >= self.stale_after
+
+
+class InMemoryPresence(Presence):
+    """プロセス内の辞書で管理するプレゼンス（テスト・開発用）"""
+
+    def __init__(
+        self, ttl: float = DEFAULT_TTL, stale_after: float = DEFAULT_STALE_AFTER
+    ):
+        super().__init__(ttl, stale_after)
+        self._rooms = {}
+
+    async def join(
+        self, room, channel_name, role, user_id=None, capacity=None, client_id=None
+    ):
+        now = time.time()
+        member = self._member(role, user_id, now, client_id)
+        members = self._prune(room, now)
+        replaced = tuple(
+            k
+            for k, v in members.items()
+            if k != channel_name and self._is_replaced_by(v, member, now)
+        )
+        if (
+            capacity is not None
+            and channel_name not in members
+            and len(members) - len(replaced) >= capacity
+        ):
+            return JoinResult(False)
+
+        for key in replaced:
+            del members[key]
+        self._rooms.setdefault(room, {})[channel_name] = member
+        return JoinResult(True, replaced)
+
+    async def heartbeat(self, room, channel_name):
+        member = self._rooms.get(room, {}).get(channel_name)
+        if member is not None:
+            member["last_seen"] = time.time()
+
+    async def leave(self, room, channel_name):
+        members = self._rooms.get(room)
+        if members is not None:
+            members.pop(channel_name, None)
+            if not members:
+                del self._rooms[room]
+
+    async def members(self, room):
+        return {k: dict(v) for k, v in self._prune(room, time.time()).items()}
+
+    async def count(self, room):
+        return len(self._rooms.get(room, {}))
+
+    def reap(self) -> int:
+        """
+        期限切れのメンバーと空のルームを削除する
+
+        Returns:
+            int: 削除したメンバー数
+        """
+        now = time.time()
+        removed = 0
+        for room in list(self._rooms):
+            before = len(self._rooms[room])
+            removed += before - len(self._prune(room, now))
+        return removed
+
+    def _prune(self, room, now):
+        members = self._rooms.get(room, {})
+        for channel_name in [
+            k for k, member in members.items() if not self._is_alive(member, now)
+        ]:
+            del members[channel_name]
+        if not members:
+            self._rooms.pop(room, None)
+        return members
+
+
+# 期限切れのメンバーを削除し、置き換えるメンバーを除いて定員を確認したうえで
+# 参加する（置き換えの条件は Presence._is_replaced_by と同じ）
+# KEYS[1]: ルームのハッシュ
+# ARGV: チャネル名, メンバー(JSON), 現在時刻, 有効期限(秒), 定員(0で無制限),
+#       置き換えるまでの更新のない時間(秒)
+# 戻り値: {参加できた場合は1, 置き換えて削除したチャネル名...}
+JOIN_LUA = """
+local entries = redis.call('HGETALL', KEYS[1])
+local new = cjson.decode(ARGV[2])
+local now = tonumber(ARGV[3])
+local ttl = tonumber(ARGV[4])
+local stale_after = tonumber(ARGV[6])
+local function replaced(member)
+    if member['role'] ~= new['role'] then
+        return false
+    end
+    if new['client_id'] ~= cjson.null and member['client_id'] == new['client_id'] then
+        return true
+    end
+    if new['user_id'] ~= cjson.null and member['user_id'] == new['user_id'] then
+        return true
+    end
+    return now - member['last_seen'] >= stale_after
+end
+local displaced = {}
+for i = 1, #entries, 2 do
+    local member = cjson.decode(entries[i + 1])
+    if now - member['last_seen'] >= ttl then
+        redis.call('HDEL', KEYS[1], entries[i])
+    elseif entries[i] ~= ARGV[1] and replaced(member) then
+        table.insert(displaced, entries[i])
+    end
+end
+local capacity = tonumber(ARGV[5])
+if capacity > 0 and redis.call('HEXISTS', KEYS[1], ARGV[1]) == 0 then
+    if redis.call('HLEN', KEYS[1]) - #displaced >= capacity then
+        return {0}
+    end
+end
+local result = {1}
+for _, channel_name in ipairs(displaced) do
+    redis.call('HDEL', KEYS[1], channel_name)
+    table.insert(result, channel_name)
+end
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+redis.call('EXPIRE', KEYS[1], math.ceil(ttl))
+return result
+"""
+
+
+class RedisPresence(Presence):
+    """
+    Redisのハッシュで管理するプレゼンス
+
+    ルームごとに1つのハッシュ（presence:<ルーム名>）を使い、フィールドに
+    チャネル名、値にメンバーのJSONを保存する。ハッシュ自体にも有効期限を
+    設定するため、全員のハートビートが途絶えたルームは自動的に削除される。
+    """
+
+    KEY_PREFIX = "presence:"
+
+    def __init__(
+        self,
+        ttl: float = DEFAULT_TTL,
+        url: Optional[str] = None,
+        stale_after: float = DEFAULT_STALE_AFTER,
+    ):
+        super().__init__(ttl, stale_after)
+        self.url = url or settings.REDIS_URL
+        # 非同期クライアントはイベントループごとに作成する
+        self._clients = weakref.WeakKeyDictionary()
+
+    @property
+    def client(self):
+        """実行中のイベントループ用の非同期Redisクライアント"""
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            client = aioredis.from_url(self.url, decode_responses=True)
+            self._clients[loop] = client
+        return client
+
+    def _key(self, room):
+        return f"{self.KEY_PREFIX}{room}"
+
+    async def join(
+        self, room, channel_name, role, user_id=None, capacity=None, client_id=None
+    ):
+        now = time.time()
+        member = json.dumps(self._member(role, user_id, now, client_id))
+        result = await self.client.eval(
+            JOIN_LUA,
+            1,
+            self._key(room),
+            channel_name,
+            member,
+            now,
+            self.ttl,
+            capacity or 0,
+            self.stale_after,
+        )
+        return JoinResult(bool(result[0]), tuple(result[1:]))
+
+    async def heartbeat(self, room, channel_name):
+        key = self._key(room)
+        value = await self.client.hget(key, channel_name)
+        if value is None:
+            return
+        member = json.loads(value)
+        member["last_seen"] = time.time()
+        pipe = self.client.pipeline()
+        pipe.hset(key, channel_name, json.dumps(member))
+        pipe.expire(key, int(self.ttl))
+        await pipe.execute()
+
+    async def leave(self, room, channel_name):
+        await self.client.hdel(self._key(room), channel_name)
+
+    async def members(self, room):
+        now = time.time()
+        entries = await self.client.hgetall(self._key(room))
+        members = {k: json.loads(v) for k, v in entries.items()}
+        return {k: v for k, v in members.items() if self._is_alive(v, now)}
+
+    async def count(self, room):
+        return await self.client.hlen(self._key(room))
+
+
+_presence = None
+
+
+def get_presence() -> Presence:
+    """設定（GUITAR_WS_PRESENCE）に従ってプレゼンス管理を返す"""
+    global _presence
+    if _presence is None:
+        config = getattr(settings, "GUITAR_WS_PRESENCE", DEFAULT_PRESENCE)
+        presence_class = import_string(config["BACKEND"])
+        _presence = presence_class(**config.get("OPTIONS", {}))
+    return _presence
+
+
+def set_presence(presence: Optional[Presence]):
+    """プレゼンス管理を差し替える（Noneで設定から再作成）"""
+    global _presence
+    _presence = presence
+
+
+def summarize(members: dict) -> dict:
+    """メンバーを役割ごとの人数にまとめる"""
+    summary = {role: 0 for role in ROLES}
+    for member in members.values():
+        role = member.get("role")
+        summary[role] = summary.get(role, 0) + 1
+    return summary
@@ -0,0 +1,201 @@
+"""
+/ws/guitar/ プロトコルのメッセージ形式とコーデック
+
+接続時にサブプロトコルまたはクエリパラメータでコーデックを選択する。
+コンシューマーは常に冗長形式（{"type": ..., "data": ...}）の辞書を扱い、
+エンコードとデコードはコーデックが担当する。
+
+- json: 従来の冗長なJSON（デフォルト）
+- compact: 短いタイプコードとキーを使うJSON
+- msgpack: compact と同じスキーマをMessagePackでエンコード
+"""
+
+import json
+import logging
+from urllib.parse import parse_qs
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - msgpackはchannels_redis経由で導入される
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+# サブプロトコル名のプレフィックス（例: "virtutune.compact"）
+SUBPROTOCOL_PREFIX = "virtutune."
+
+# メッセージタイプの短縮コード
+TYPE_CODES = {
+    "chord_change": "cc",
+    "practice_start": "ps",
+    "practice_end": "pe",
+    "practice_update": "pu",
+    "practice_saved": "pv",
+    "connection_update": "cu",
+    "game_mode": "gm",
+    "game_update": "gu",
+    "game_sync": "gy",
+    "game_state": "gs",
+    "judgement": "j",
+    "ping": "pi",
+    "heartbeat": "hb",
+    "idle": "id",
+    "pong": "po",
+    "camera_frame": "cf",
+    "frame_ack": "fa",
+    "batch": "b",
+    "clock_sync": "cs",
+    "clock_probe": "cp",
+    "presence": "pr",
+    "error": "e",
+}
+TYPE_NAMES = {code: name for name, code in TYPE_CODES.items()}
+
+# トップレベルのキーの短縮形
+KEY_CODES = {
+    "type": "t",
+    "data": "d",
+    "mode": "m",
+    "messages": "ms",
+    "seq": "s",
+    "version": "v",
+    "base": "bv",
+}
+KEY_NAMES = {code: name for name, code in KEY_CODES.items()}
+
+
+class MessageDecodeError(ValueError):
+    """受信したメッセージをデコードできない場合の例外"""
+
+
+class JsonCodec:
+    """従来の冗長なJSONコーデック"""
+
+    name = "json"
+    binary = False
+
+    def encode(self, message: dict) -> str:
+        """メッセージをエンコードする"""
+        return json.dumps(message)
+
+    def decode(self, data) -> dict:
+        """
+        メッセージをデコードする
+
+        Raises:
+            MessageDecodeError: JSONとして解析できない場合
+        """
+        try:
+            message = json.loads(data)
+        except (TypeError, ValueError) as e:
+            raise MessageDecodeError(str(e)) from e
+        if not isinstance(message, dict):
+            raise MessageDecodeError("Message must be an object")
+        return message
+
+    def is_message(self, data: bytes) -> bool:
+        """バイナリフレームがメッセージかどうか（JSONでは常にカメラフレーム）"""
+        return False
+
+
+class CompactJsonCodec(JsonCodec):
+    """短いタイプコードとキーを使うJSONコーデック"""
+
+    name = "compact"
+
+    def encode(self, message: dict) -> str:
+        return json.dumps(compact(message), separators=(",", ":"))
+
+    def decode(self, data) -> dict:
+        return expand(super().decode(data))
+
+
+class MsgpackCodec(CompactJsonCodec):
+    """
+    compact スキーマをMessagePackでエンコードするコーデック
+
+    バイナリフレームのうち、先頭バイトがMessagePackのマップであるものを
+    メッセージとして扱い、それ以外はカメラフレームとして扱う。
+    テキストフレームは compact 形式のJSONとして受け付ける。
+    """
+
+    name = "msgpack"
+    binary = True
+
+    def encode(self, message: dict) -> bytes:
+        return msgpack.packb(compact(message), use_bin_type=True)
+
+    def decode(self, data) -> dict:
+        if isinstance(data, str):
+            return super().decode(data)
+        try:
+            message = msgpack.unpackb(data, raw=False)
+        except Exception as e:
+            raise MessageDecodeError(str(e)) from e
+        if not isinstance(message, dict):
+            raise MessageDecodeError("Message must be a map")
+        return expand(message)
+
+    def is_message(self, data: bytes) -> bool:
+        # fixmap (0x80-0x8f), map16 (0xde), map32 (0xdf)
+        return bool(data) and (0x80 <= data[0] <= 0x8F or data[0] in (0xDE, 0xDF))
+
+
+CODECS = {codec.name: codec for codec in (JsonCodec(), CompactJsonCodec())}
+if msgpack is not None:
+    CODECS[MsgpackCodec.name] = MsgpackCodec()
+
+DEFAULT_CODEC = CODECS["json"]
+
+
+def compact(message: dict) -> dict:
+    """冗長形式のメッセージを短縮形式に変換する"""
+    result = {}
+    for key, value in message.items():
+        if key == "type":
+            value = TYPE_CODES.get(value, value)
+        elif key == "messages" and isinstance(value, list):
+            value = [compact(m) if isinstance(m, dict) else m for m in value]
+        result[KEY_CODES.get(key, key)] = value
+    return result
+
+
+def expand(message: dict) -> dict:
+    """短縮形式のメッセージを冗長形式に戻す"""
+    result = {}
+    for key, value in message.items():
+        key = KEY_NAMES.get(key, key)
+        if key == "type":
+            value = TYPE_NAMES.get(value, value)
+        elif key == "messages" and isinstance(value, list):
+            value = [expand(m) if isinstance(m, dict) else m for m in value]
+        result[key] = value
+    return result
+
+
+def negotiate_codec(scope: dict):
+    """
+    接続スコープからコーデックを選択する
+
+    サブプロトコル（"virtutune.<codec>"）を優先し、次にクエリパラメータ
+    （?codec=<codec>）を参照する。どちらもなければ冗長なJSONを使う。
+
+    Args:
+        scope: ASGIスコープ
+
+    Returns:
+        (コーデック, acceptで返すサブプロトコル名またはNone) のタプル
+    """
+    for subprotocol in scope.get("subprotocols") or []:
+        if subprotocol.startswith(SUBPROTOCOL_PREFIX):
+            codec = CODECS.get(subprotocol[len(SUBPROTOCOL_PREFIX) :])
+            if codec is not None:
+                return codec, subprotocol
+
+    query = parse_qs(scope.get("query_string", b"").decode())
+    name = query.get("codec", [DEFAULT_CODEC.name])[0]
+    codec = CODECS.get(name)
+    if codec is None:
+        logger.warning(f"未対応のコーデック: {name}")
+        codec = DEFAULT_CODEC
+    return codec, None
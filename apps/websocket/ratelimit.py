@@ -0,0 +1,138 @@
+"""
+トークンバケットによるレート制限
+
+GuitarConsumer が受信したメッセージを、グループ送信の前に接続ごと・
+ルームごとに制限する。ルームのバケットはプロセス内で共有される
+（同じルームの接続が同じワーカーにある場合に有効）。
+
+設定例:
+    GUITAR_WS_RATE_LIMITS = {
+        "game_update": {
+            "rate": 60,            # 接続あたりの補充数（件/秒）
+            "burst": 120,          # 接続あたりのバケット容量
+            "room_rate": 120,      # ルームあたりの補充数（件/秒）
+            "room_burst": 240,     # ルームあたりのバケット容量
+            "overflow": "coalesce",  # 超過時: drop（破棄） / coalesce（最新のみ後で処理）
+        },
+    }
+"""
+
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from django.conf import settings
+
+OVERFLOW_DROP = "drop"
+OVERFLOW_COALESCE = "coalesce"
+
+# ルームのバケット数がこの数を超えたら、満タンのバケットを削除する
+ROOM_BUCKET_PRUNE_THRESHOLD = 1000
+
+
+class TokenBucket:
+    """
+    トークンバケット
+
+    rate 件/秒でトークンを補充し、最大 burst 個まで溜める。
+    """
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def consume(self, tokens: float = 1) -> bool:
+        """
+        トークンを消費する
+
+        Returns:
+            bool: トークンが足りた場合はTrue
+        """
+        self._refill(time.monotonic())
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return True
+        return False
+
+    def wait_time(self, tokens: float = 1) -> float:
+        """トークンが溜まるまでの秒数"""
+        self._refill(time.monotonic())
+        if self.tokens >= tokens:
+            return 0.0
+        return (tokens - self.tokens) / self.rate
+
+    @property
+    def is_full(self) -> bool:
+        self._refill(time.monotonic())
+        return self.tokens >= self.burst
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    """メッセージタイプごとのレート制限の設定"""
+
+    rate: Optional[float] = None
+    burst: Optional[float] = None
+    room_rate: Optional[float] = None
+    room_burst: Optional[float] = None
+    overflow: str = OVERFLOW_DROP
+
+    def connection_bucket(self) -> Optional[TokenBucket]:
+        """接続ごとのバケット（制限なしの場合はNone）"""
+        if not self.rate:
+            return None
+        return TokenBucket(self.rate, self.burst or 1)
+
+    @property
+    def room_limited(self) -> bool:
+        return bool(self.room_rate)
+
+
+def resolve_rate_limit(spec) -> RateLimit:
+    """
+    メッセージタイプのレート制限を決定する
+
+    GUITAR_WS_RATE_LIMITS の設定を優先し、なければ登録表の rate_limit を
+    接続あたりの上限（バースト1）として使う。
+
+    Args:
+        spec: registry の MessageSpec
+    """
+    limits = getattr(settings, "GUITAR_WS_RATE_LIMITS", {})
+    config = limits.get(spec.limit_key)
+    if config is None:
+        return RateLimit(rate=spec.max_rate(), burst=1)
+    return RateLimit(**config)
+
+
+class RoomBuckets:
+    """ルーム × メッセージタイプごとのバケット（プロセス内で共有）"""
+
+    def __init__(self):
+        self._buckets = {}
+
+    def get(self, room: str, key: str, limit: RateLimit) -> TokenBucket:
+        bucket = self._buckets.get((room, key))
+        if bucket is None:
+            if len(self._buckets) >= ROOM_BUCKET_PRUNE_THRESHOLD:
+                self.prune()
+            bucket = TokenBucket(limit.room_rate, limit.room_burst or limit.room_rate)
+            self._buckets[(room, key)] = bucket
+        return bucket
+
+    def prune(self):
+        """満タン（しばらく使われていない）のバケットを削除する"""
+        for key in [k for k, bucket in self._buckets.items() if bucket.is_full]:
+            del self._buckets[key]
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+room_buckets = RoomBuckets()
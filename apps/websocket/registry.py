@@ -0,0 +1,127 @@
+"""
+/ws/guitar/ プロトコルのメッセージ登録表
+
+メッセージタイプごとに、検証関数、ハンドラー、ルーティング方針、
+配送方法、レート制限を宣言的に登録する。受信時と配送時の振り分けは
+辞書の参照のみで行う。
+
+ルーティング方針:
+- ROUTE_REPLY: 送信者にのみ応答する（例: ping → pong）
+- ROUTE_RELAY: 送信者以外のメンバーに転送する（2人ルームではピアに直接送信）
+- ROUTE_BROADCAST: 送信者を含むルーム全員に送信する
+
+配送方法（受信側のコンシューマーでの送信方法）:
+- DELIVER_DIRECT: エンコード済みのペイロードをそのまま送信する
+- DELIVER_BATCHED: バッチ送信が有効な接続ではまとめて送信する
+- DELIVER_LATEST: 最新フレーム優先のメールボックス経由で送信する
+"""
+
+from dataclasses import dataclass
+from typing import Callable, Optional, Union
+
+ROUTE_REPLY = "reply"
+ROUTE_RELAY = "relay"
+ROUTE_BROADCAST = "broadcast"
+
+DELIVER_DIRECT = "direct"
+DELIVER_BATCHED = "batched"
+DELIVER_LATEST = "latest"
+
+
+@dataclass(frozen=True)
+class MessageSpec:
+    """
+    メッセージタイプの定義
+
+    Attributes:
+        type: クライアントから受信するメッセージタイプ
+        handler: 受信時に呼び出すコンシューマーのメソッド。クライアントに
+            送信するメッセージを返す（Noneの場合は何も送信しない）
+        validator: メッセージを検証する関数。エラー時はエラーメッセージを返す
+        routing: ルーティング方針（ROUTE_*）
+        event: チャネルレイヤーのイベントタイプ（デフォルトは type と同じ）
+        delivery: 受信側での配送方法（DELIVER_*）
+        rate_limit: 接続あたりの最大受信数（件/秒）。呼び出し可能な場合は
+            実行時に評価する。None または 0 で無制限
+        rate_key: レート制限を共有するキー（デフォルトは type と同じ）
+        replay: 再接続したクライアントに再送するため、ルームのリプレイバッファに
+            連番付きで記録する
+        merge: レート制限でまとめる（coalesce）ときに、前のメッセージと新しい
+            メッセージを1つにする関数。省略時は新しいメッセージで置き換える
+    """
+
+    type: str
+    handler: Callable
+    validator: Optional[Callable] = None
+    routing: str = ROUTE_RELAY
+    event: Optional[str] = None
+    delivery: str = DELIVER_DIRECT
+    rate_limit: Union[float, Callable, None] = None
+    rate_key: Optional[str] = None
+    replay: bool = False
+    merge: Optional[Callable] = None
+
+    @property
+    def event_type(self) -> str:
+        return self.event or self.type
+
+    @property
+    def limit_key(self) -> str:
+        return self.rate_key or self.type
+
+    def max_rate(self) -> Optional[float]:
+        """最大受信数（件/秒）を返す"""
+        if callable(self.rate_limit):
+            return self.rate_limit()
+        return self.rate_limit
+
+
+class MessageRegistry:
+    """
+    メッセージタイプの登録表
+
+    inbound: クライアントから受信するメッセージタイプ → MessageSpec
+    outbound: チャネルレイヤーのイベントタイプ → MessageSpec
+    """
+
+    def __init__(self):
+        self.inbound = {}
+        self.outbound = {}
+
+    def message(self, message_type: str, **options):
+        """
+        ハンドラーを登録するデコレーター
+
+        Args:
+            message_type: クライアントから受信するメッセージタイプ
+            **options: MessageSpec のその他の属性
+
+        Raises:
+            ValueError: 同じタイプが登録済み、または同じイベントタイプに
+                異なる配送方法が指定された場合
+        """
+
+        def decorator(handler):
+            self.register(MessageSpec(type=message_type, handler=handler, **options))
+            return handler
+
+        return decorator
+
+    def register(self, spec: MessageSpec):
+        """MessageSpec を登録する"""
+        if spec.type in self.inbound:
+            raise ValueError(f"Message type already registered: {spec.type}")
+
+        if spec.routing != ROUTE_REPLY:
+            existing = self.outbound.get(spec.event_type)
+            if existing is not None and existing.delivery != spec.delivery:
+                raise ValueError(
+                    f"Conflicting delivery for event type: {spec.event_type}"
+                )
+            self.outbound.setdefault(spec.event_type, spec)
+
+        self.inbound[spec.type] = spec
+
+    def get(self, message_type: str) -> Optional[MessageSpec]:
+        """受信したメッセージタイプの定義を返す"""
+        return self.inbound.get(message_type)
@@ -0,0 +1,263 @@
+"""
+再接続時の再送（リプレイバッファと再開トークン）
+
+ワーカーの入れ替え（ドレイン）で切断されたクライアントが、別のワーカーに
+再接続して途中から再開できるようにする。
+
+- リプレイバッファ: ルームごとに直近のイベント（chord_change / game_update /
+  judgement など）を連番（seq）付きで保持する。再接続したクライアントには
+  最後に受信した連番より後のイベントを再送する
+- 再開トークン: ドレイン時にクライアントへ渡す署名付きトークン。再接続時に
+  提示されたトークンが有効であれば、ペアリングセッションの検証（Redis）を省く
+
+設定例:
+    GUITAR_WS_REPLAY = {
+        "BACKEND": "apps.websocket.replay.RedisReplayBuffer",
+        "OPTIONS": {"size": 64, "ttl": 120},
+    }
+"""
+
+import asyncio
+import json
+import time
+import weakref
+from collections import deque
+from typing import Optional
+
+import redis.asyncio as aioredis
+from django.conf import settings
+from django.core import signing
+from django.utils.module_loading import import_string
+
+DEFAULT_REPLAY_BUFFER = {"BACKEND": "apps.websocket.replay.RedisReplayBuffer"}
+
+# ルームごとに保持するイベント数（デフォルト）
+DEFAULT_BUFFER_SIZE = 64
+
+# バッファの有効期限（秒、最後のイベントから）
+DEFAULT_BUFFER_TTL = 120
+
+# 再開トークンの有効期限（秒、デフォルト）
+DEFAULT_RESUME_MAX_AGE = 120
+
+RESUME_TOKEN_SALT = "apps.websocket.resume"
+
+
+class ReplayBuffer:
+    """
+    リプレイバッファの基底クラス
+
+    イベントは (連番, 送信元のクライアントID, メッセージ) で保持する。
+    """
+
+    def __init__(
+        self, size: int = DEFAULT_BUFFER_SIZE, ttl: float = DEFAULT_BUFFER_TTL
+    ):
+        self.size = size
+        self.ttl = ttl
+
+    async def append(self, room: str, origin: str, message: dict) -> int:
+        """
+        イベントを記録する
+
+        Args:
+            room: ルーム名
+            origin: 送信元のクライアントID
+            message: クライアントに送信するメッセージ
+
+        Returns:
+            int: ルーム内で単調増加する連番
+        """
+        return (await self.append_many(room, origin, [message]))[0]
+
+    async def append_many(self, room: str, origin: str, messages: list) -> list:
+        """
+        複数のイベントを順に記録する
+
+        Returns:
+            list: イベントごとの連番（連続した値）
+        """
+        raise NotImplementedError
+
+    async def since(self, room: str, seq: int) -> tuple:
+        """
+        指定した連番より後のイベントを返す
+
+        Args:
+            room: ルーム名
+            seq: クライアントが最後に受信した連番
+
+        Returns:
+            ([(連番, 送信元, メッセージ), ...], complete)。古いイベントが
+            バッファから消えていて欠落がある場合、complete はFalse
+        """
+        raise NotImplementedError
+
+    @staticmethod
+    def _result(entries, latest, seq):
+        entries = [entry for entry in entries if entry[0] > seq]
+        first = entries[0][0] if entries else latest + 1
+        # バッファの連番がクライアントより小さい場合は期限切れで作り直されている
+        return entries, seq <= latest and first <= seq + 1
+
+
+class InMemoryReplayBuffer(ReplayBuffer):
+    """プロセス内で保持するリプレイバッファ（テスト・開発用）"""
+
+    def __init__(self, size=DEFAULT_BUFFER_SIZE, ttl=DEFAULT_BUFFER_TTL):
+        super().__init__(size, ttl)
+        self._rooms = {}
+
+    async def append_many(self, room, origin, messages):
+        buffer = self._room(room)
+        seqs = []
+        for message in messages:
+            buffer["seq"] += 1
+            buffer["entries"].append((buffer["seq"], origin, dict(message)))
+            seqs.append(buffer["seq"])
+        return seqs
+
+    async def since(self, room, seq):
+        buffer = self._room(room)
+        return self._result(list(buffer["entries"]), buffer["seq"], seq)
+
+    def _room(self, room):
+        now = time.time()
+        buffer = self._rooms.get(room)
+        if buffer is None or now - buffer["updated"] >= self.ttl:
+            buffer = self._rooms[room] = {
+                "seq": 0,
+                "entries": deque(maxlen=self.size),
+                "updated": now,
+            }
+        buffer["updated"] = now
+        return buffer
+
+
+# 連番を採番してイベントを追加し、古いイベントを削除する（最後の連番を返す）
+# KEYS[1]: イベントのリスト, KEYS[2]: 連番
+# ARGV: イベント(JSON)..., 保持数, 有効期限(秒)
+APPEND_LUA = """
+local count = #ARGV - 2
+local last = redis.call('INCRBY', KEYS[2], count)
+for i = 1, count do
+    redis.call('RPUSH', KEYS[1], (last - count + i) .. ':' .. ARGV[i])
+end
+redis.call('LTRIM', KEYS[1], -tonumber(ARGV[#ARGV - 1]), -1)
+redis.call('EXPIRE', KEYS[1], ARGV[#ARGV])
+redis.call('EXPIRE', KEYS[2], ARGV[#ARGV])
+return last
+"""
+
+
+class RedisReplayBuffer(ReplayBuffer):
+    """
+    Redisのリストで保持するリプレイバッファ
+
+    ワーカーが入れ替わっても再送できるよう、ルームごとのリスト
+    （replay:<ルーム名>）と連番（replay:<ルーム名>:seq）をRedisに置く。
+    """
+
+    KEY_PREFIX = "replay:"
+
+    def __init__(self, size=DEFAULT_BUFFER_SIZE, ttl=DEFAULT_BUFFER_TTL, url=None):
+        super().__init__(size, ttl)
+        self.url = url or settings.REDIS_URL
+        # 非同期クライアントはイベントループごとに作成する
+        self._clients = weakref.WeakKeyDictionary()
+
+    @property
+    def client(self):
+        """実行中のイベントループ用の非同期Redisクライアント"""
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            client = aioredis.from_url(self.url, decode_responses=True)
+            self._clients[loop] = client
+        return client
+
+    def _keys(self, room):
+        key = f"{self.KEY_PREFIX}{room}"
+        return key, f"{key}:seq"
+
+    async def append_many(self, room, origin, messages):
+        entries = [
+            json.dumps({"origin": origin, "message": message}) for message in messages
+        ]
+        last = int(
+            await self.client.eval(
+                APPEND_LUA, 2, *self._keys(room), *entries, self.size, int(self.ttl)
+            )
+        )
+        return list(range(last - len(entries) + 1, last + 1))
+
+    async def since(self, room, seq):
+        key, seq_key = self._keys(room)
+        pipe = self.client.pipeline()
+        pipe.lrange(key, 0, -1)
+        pipe.get(seq_key)
+        values, latest = await pipe.execute()
+
+        entries = []
+        for value in values:
+            entry_seq, _, body = value.partition(":")
+            entry = json.loads(body)
+            entries.append((int(entry_seq), entry["origin"], entry["message"]))
+        return self._result(entries, int(latest or 0), seq)
+
+
+_replay_buffer = None
+
+
+def get_replay_buffer() -> ReplayBuffer:
+    """設定（GUITAR_WS_REPLAY）に従ってリプレイバッファを返す"""
+    global _replay_buffer
+    if _replay_buffer is None:
+        config = getattr(settings, "GUITAR_WS_REPLAY", DEFAULT_REPLAY_BUFFER)
+        buffer_class = import_string(config["BACKEND"])
+        _replay_buffer = buffer_class(**config.get("OPTIONS", {}))
+    return _replay_buffer
+
+
+def set_replay_buffer(buffer: Optional[ReplayBuffer]):
+    """リプレイバッファを差し替える（Noneで設定から再作成）"""
+    global _replay_buffer
+    _replay_buffer = buffer
+
+
+def issue_resume_token(session_id: str, client_id: str, role: str) -> str:
+    """
+    再開トークンを発行する
+
+    Args:
+        session_id: ペアリングセッションID
+        client_id: 接続をまたいで同じクライアントを識別するID
+        role: デバイスの役割
+    """
+    return signing.dumps(
+        {"session_id": session_id, "client_id": client_id, "role": role},
+        salt=RESUME_TOKEN_SALT,
+        compress=True,
+    )
+
+
+def load_resume_token(token: Optional[str], session_id: str) -> Optional[dict]:
+    """
+    再開トークンを検証する
+
+    Returns:
+        有効な場合はトークンの内容。署名が不正、期限切れ、または別の
+        セッションのトークンの場合はNone
+    """
+    if not token:
+        return None
+
+    max_age = getattr(settings, "GUITAR_WS_RESUME_MAX_AGE", DEFAULT_RESUME_MAX_AGE)
+    try:
+        payload = signing.loads(token, salt=RESUME_TOKEN_SALT, max_age=max_age)
+    except signing.BadSignature:
+        return None
+
+    if payload.get("session_id") != session_id:
+        return None
+    return payload
@@ -0,0 +1,192 @@
+"""
+Message Batching Tests
+
+game_update / judgement のバッチ送信のテスト
+"""
+
+import asyncio
+import json
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from channels.testing import WebsocketCommunicator
+
+from apps.websocket.batching import OutboundBatcher
+from apps.websocket.gamestate import InMemoryGameStateStore, set_game_state_store
+from apps.websocket.replay import InMemoryReplayBuffer, set_replay_buffer
+from config.asgi import application
+
+
+@pytest.mark.asyncio
+class TestOutboundBatcher:
+    """OutboundBatcherのテスト"""
+
+    async def test_messages_within_window_are_sent_together(self):
+        """時間窓内のメッセージが1フレームにまとめられるテスト"""
+        send = AsyncMock()
+        batcher = OutboundBatcher(send, window=0.01)
+
+        for i in range(3):
+            batcher.add({"type": "judgement", "data": {"note": i}})
+        await asyncio.sleep(0.05)
+
+        send.assert_awaited_once()
+        frame = send.await_args.args[0]
+        assert frame["type"] == "batch"
+        assert [m["data"]["note"] for m in frame["messages"]] == [0, 1, 2]
+        assert batcher.batched_messages == 3
+
+    async def test_single_message_is_sent_unwrapped(self):
+        """メッセージが1つだけの場合はそのまま送信されるテスト"""
+        send = AsyncMock()
+        batcher = OutboundBatcher(send, window=0.01)
+
+        batcher.add({"type": "game_update", "data": {"score": 10}})
+        await asyncio.sleep(0.05)
+
+        frame = send.await_args.args[0]
+        assert frame == {"type": "game_update", "data": {"score": 10}}
+
+    async def test_max_size_flushes_immediately(self):
+        """最大数に達すると時間窓を待たずに送信されるテスト"""
+        send = AsyncMock()
+        batcher = OutboundBatcher(send, window=10, max_size=2)
+
+        batcher.add({"type": "judgement"})
+        batcher.add({"type": "judgement"})
+        await asyncio.sleep(0)
+
+        send.assert_awaited_once()
+        await batcher.close()
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+class TestBatchedRelay:
+    """バッチ送信を使った転送のテスト"""
+
+    async def _connect(self, path):
+        communicator = WebsocketCommunicator(application, path)
+        connected, _ = await communicator.connect()
+        assert connected is True
+        return communicator
+
+    async def test_inbound_batch_is_delivered_as_one_frame(self):
+        """受信したバッチがバッチ対応クライアントに1フレームで届くテスト"""
+        with patch(
+            "apps.websocket.consumers.pairing_manager.avalidate_session",
+            return_value=True,
+        ):
+            pc = await self._connect("/ws/guitar/batch-on/")
+            await pc.receive_from()
+            mobile = await self._connect("/ws/guitar/batch-on/?batch=1")
+            await mobile.receive_from()
+            await pc.receive_from()
+
+            await pc.send_to(
+                text_data=json.dumps(
+                    {
+                        "type": "batch",
+                        "messages": [
+                            {"type": "judgement", "data": {"result": "perfect"}},
+                            {"type": "judgement", "data": {"result": "great"}},
+                            {"type": "game_update", "data": {"score": 300}},
+                        ],
+                    }
+                )
+            )
+
+            frame = json.loads(await mobile.receive_from())
+            assert frame["type"] == "batch"
+            assert [m["type"] for m in frame["messages"]] == [
+                "judgement",
+                "judgement",
+                "game_update",
+            ]
+            assert await mobile.receive_nothing() is True
+
+            await pc.disconnect()
+            await mobile.disconnect()
+
+    async def test_inbound_batch_is_stored_once(self):
+        """バッチの game_update が1回で適用され、リプレイバッファに1回で記録されるテスト"""
+        store = InMemoryGameStateStore()
+        buffer = InMemoryReplayBuffer()
+        set_game_state_store(store)
+        set_replay_buffer(buffer)
+        try:
+            with (
+                patch(
+                    "apps.websocket.consumers.pairing_manager.avalidate_session",
+                    return_value=True,
+                ),
+                patch.object(store, "apply", wraps=store.apply) as apply,
+                patch.object(
+                    buffer, "append_many", wraps=buffer.append_many
+                ) as append_many,
+            ):
+                pc = await self._connect("/ws/guitar/batch-store/")
+                await pc.receive_from()
+                mobile = await self._connect("/ws/guitar/batch-store/?batch=1")
+                await mobile.receive_from()
+                await pc.receive_from()
+
+                await pc.send_to(
+                    text_data=json.dumps(
+                        {
+                            "type": "batch",
+                            "messages": [
+                                {
+                                    "type": "game_update",
+                                    "data": {"score": 1, "combo": 2},
+                                },
+                                {"type": "judgement", "data": {"result": "perfect"}},
+                                {"type": "game_update", "data": {"score": 3}},
+                            ],
+                        }
+                    )
+                )
+
+                frame = json.loads(await mobile.receive_from())
+                messages = frame["messages"]
+                assert [m["type"] for m in messages] == ["judgement", "game_update"]
+                assert messages[1]["data"] == {"score": 3, "combo": 2}
+                assert [m["seq"] for m in messages] == [1, 2]
+                assert apply.call_count == 1
+                assert append_many.call_count == 1
+
+                await pc.disconnect()
+                await mobile.disconnect()
+        finally:
+            set_game_state_store(None)
+            set_replay_buffer(None)
+
+    async def test_inbound_batch_is_unpacked_for_legacy_clients(self):
+        """バッチ非対応クライアントには個別のメッセージとして届くテスト"""
+        with patch(
+            "apps.websocket.consumers.pairing_manager.avalidate_session",
+            return_value=True,
+        ):
+            pc = await self._connect("/ws/guitar/batch-off/")
+            await pc.receive_from()
+            mobile = await self._connect("/ws/guitar/batch-off/")
+            await mobile.receive_from()
+            await pc.receive_from()
+
+            await pc.send_to(
+                text_data=json.dumps(
+                    {
+                        "type": "batch",
+                        "messages": [
+                            {"type": "judgement", "data": {"result": "good"}},
+                            {"type": "chord_change", "data": {"chord": "D"}},
+                        ],
+                    }
+                )
+            )
+
+            received = [json.loads(await mobile.receive_from()) for _ in range(2)]
+            assert {m["type"] for m in received} == {"judgement", "chord_change"}
+
+            await pc.disconnect()
+            await mobile.disconnect()
@@ -0,0 +1,167 @@
+"""
+Binary Camera Frame Tests
+
+バイナリカメラフレーム転送のテスト
+"""
+
+import asyncio
+import json
+from unittest.mock import patch
+
+import pytest
+from channels.testing import WebsocketCommunicator
+
+from apps.mobile.state import InMemorySessionStateStore, set_session_state_store
+from apps.websocket.frames import (
+    CODEC_JPEG,
+    HEADER_SIZE,
+    FrameHeader,
+    FrameHeaderError,
+    pack_frame,
+    parse_header,
+)
+from config.asgi import application
+
+
+class TestFrameHeader:
+    """フレームヘッダーのテスト"""
+
+    def test_pack_and_parse_roundtrip(self):
+        """ヘッダーの生成と解析が一致するテスト"""
+        header = FrameHeader(seq=42, width=320, height=240, codec=CODEC_JPEG)
+        frame = pack_frame(header, b"\xff\xd8jpeg")
+
+        assert len(frame) == HEADER_SIZE + 6
+        assert parse_header(frame) == header
+        assert parse_header(frame).content_type == "image/jpeg"
+
+    def test_parse_rejects_short_frame(self):
+        """ヘッダーのみのフレームを拒否するテスト"""
+        with pytest.raises(FrameHeaderError):
+            parse_header(b"\x01\x01")
+
+    def test_parse_rejects_unknown_codec(self):
+        """未対応コーデックを拒否するテスト"""
+        frame = pack_frame(FrameHeader(seq=1, width=1, height=1, codec=99), b"x")
+        with pytest.raises(FrameHeaderError):
+            parse_header(frame)
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+class TestBinaryFrameRelay:
+    """バイナリフレーム転送のテスト"""
+
+    async def _connect_pair(self, session_id):
+        """PCとモバイルの2接続を確立する"""
+        pc = WebsocketCommunicator(application, f"/ws/guitar/{session_id}/")
+        mobile = WebsocketCommunicator(application, f"/ws/guitar/{session_id}/")
+
+        connected, _ = await pc.connect()
+        assert connected is True
+        await pc.receive_from()
+
+        connected, _ = await mobile.connect()
+        assert connected is True
+        await mobile.receive_from()
+        await pc.receive_from()
+
+        return pc, mobile
+
+    async def test_binary_frame_is_forwarded_unchanged(self):
+        """バイナリフレームがそのまま転送されるテスト"""
+        with patch(
+            "apps.websocket.consumers.pairing_manager.avalidate_session",
+            return_value=True,
+        ):
+            pc, mobile = await self._connect_pair("binary-relay")
+
+            frame = pack_frame(FrameHeader(seq=1, width=320, height=240), b"jpeg")
+            await pc.send_to(bytes_data=frame)
+
+            output = await mobile.receive_output()
+            assert output["bytes"] == frame
+            assert await pc.receive_nothing() is True
+
+            await pc.disconnect()
+            await mobile.disconnect()
+
+    async def _store_frames(self, session_id, payloads, viewer=True):
+        """フレームを送り、HTTPポーリング用のストアに保存されたものを返す"""
+        store = InMemorySessionStateStore()
+        set_session_state_store(store)
+        try:
+            with patch(
+                "apps.websocket.consumers.pairing_manager.avalidate_session",
+                return_value=True,
+            ):
+                pc, mobile = await self._connect_pair(session_id)
+                if viewer:
+                    await store.amark_frame_viewer(session_id)
+
+                for seq, payload in enumerate(payloads, 1):
+                    frame = pack_frame(
+                        FrameHeader(seq=seq, width=320, height=240), payload
+                    )
+                    await pc.send_to(bytes_data=frame)
+                    await mobile.receive_output()
+
+                stored = None
+                for _ in range(20):
+                    stored = await store.aget_frame(session_id)
+                    if stored is not None:
+                        break
+                    await asyncio.sleep(0.01)
+
+                state = await store.aget_versioned(session_id)
+
+                await pc.disconnect()
+                await mobile.disconnect()
+        finally:
+            set_session_state_store(None)
+        return stored, state
+
+    async def test_jpeg_frame_is_stored_for_polling_clients(self):
+        """JPEGのフレームがHTTPポーリングのスマートフォン用に保存されるテスト"""
+        stored, state = await self._store_frames("binary-store", [b"\xff\xd8jpeg"])
+
+        # ヘッダーを除いた画像データだけが保存される
+        assert stored[1] == b"\xff\xd8jpeg"
+        # 状態のバージョンは変わらない（ロングポーリングを起こさない）
+        assert state == ({}, 0)
+
+    async def test_frame_is_not_stored_without_viewer(self):
+        """フレームを取得しているスマートフォンがいない場合は保存しないテスト"""
+        stored, _ = await self._store_frames(
+            "binary-no-viewer", [b"\xff\xd8jpeg"], viewer=False
+        )
+
+        assert stored is None
+
+    async def test_stored_frames_are_capped_per_second(self, settings):
+        """保存するフレームが MOBILE_CAMERA_FRAME_MAX_FPS で間引かれるテスト"""
+        settings.GUITAR_WS_CAMERA_MAX_FPS = 0
+        settings.MOBILE_CAMERA_FRAME_MAX_FPS = 1
+
+        stored, _ = await self._store_frames(
+            "binary-capped", [b"\xff\xd8first", b"\xff\xd8second"]
+        )
+
+        assert stored[1] == b"\xff\xd8first"
+
+    async def test_invalid_binary_frame_returns_error(self):
+        """不正なバイナリフレームでエラーが返るテスト"""
+        with patch(
+            "apps.websocket.consumers.pairing_manager.avalidate_session",
+            return_value=True,
+        ):
+            pc, mobile = await self._connect_pair("binary-invalid")
+
+            await pc.send_to(bytes_data=b"\x00")
+
+            response = json.loads(await pc.receive_from())
+            assert response["type"] == "error"
+            assert await mobile.receive_nothing() is True
+
+            await pc.disconnect()
+            await mobile.disconnect()
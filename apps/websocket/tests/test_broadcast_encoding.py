@@ -0,0 +1,103 @@
+"""
+Broadcast Encoding Tests
+
+ブロードキャストのペイロードを送信側で一度だけエンコードするテスト
+"""
+
+import json
+from unittest.mock import patch
+
+import pytest
+
+from apps.websocket.protocol import CompactJsonCodec, JsonCodec
+
+
+@pytest.fixture
+def encoded_types(settings):
+    """コーデックごとにエンコードされたメッセージタイプを記録する"""
+    # 3人ルームで検証するため定員を広げる
+    settings.GUITAR_WS_ROOM_CAPACITY = 3
+    calls = []
+
+    def spy(codec_class):
+        original = codec_class.encode
+
+        def encode(self, message):
+            calls.append((self.name, message["type"]))
+            return original(self, message)
+
+        return patch.object(codec_class, "encode", encode)
+
+    with (
+        spy(JsonCodec),
+        spy(CompactJsonCodec),
+        patch(
+            "apps.websocket.consumers.pairing_manager.avalidate_session",
+            return_value=True,
+        ),
+    ):
+        yield calls
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+class TestBroadcastEncoding:
+    """送信側での一括エンコードのテスト"""
+
+    async def test_group_broadcast_is_encoded_once(self, encoded_types, join_room):
+        """3人ルームへのブロードキャストが1回だけエンコードされるテスト"""
+        pc = await join_room("/ws/guitar/encode-once/")
+        mobile = await join_room("/ws/guitar/encode-once/", pc)
+        viewer = await join_room("/ws/guitar/encode-once/", pc, mobile)
+        encoded_types.clear()
+
+        await pc.send_to(
+            text_data=json.dumps({"type": "judgement", "data": {"result": "good"}})
+        )
+
+        for member in (mobile, viewer):
+            response = json.loads(await member.receive_from())
+            assert response == {
+                "type": "judgement",
+                "data": {"result": "good"},
+                "seq": 1,
+            }
+        assert encoded_types == [("json", "judgement")]
+
+        await pc.disconnect()
+        await mobile.disconnect()
+        await viewer.disconnect()
+
+    async def test_payload_is_encoded_once_per_peer_codec(
+        self, encoded_types, join_room
+    ):
+        """コーデックの異なるピアにはコーデックごとに1回エンコードされるテスト"""
+        pc = await join_room("/ws/guitar/encode-mixed/")
+        mobile = await join_room("/ws/guitar/encode-mixed/", pc)
+        viewer = await join_room(
+            "/ws/guitar/encode-mixed/", pc, mobile, subprotocols=["virtutune.compact"]
+        )
+        encoded_types.clear()
+
+        await pc.send_to(
+            text_data=json.dumps({"type": "chord_change", "data": {"chord": "E"}})
+        )
+
+        assert json.loads(await mobile.receive_from()) == {
+            "type": "chord_change",
+            "data": {"chord": "E"},
+            "seq": 1,
+        }
+        assert json.loads(await viewer.receive_from()) == {
+            "t": "cc",
+            "d": {"chord": "E"},
+            "s": 1,
+        }
+        assert sorted(encoded_types) == [
+            ("compact", "chord_change"),
+            ("json", "chord_change"),
+        ]
+
+        await pc.disconnect()
+        await mobile.disconnect()
+        await viewer.disconnect()
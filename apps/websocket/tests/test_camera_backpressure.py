@@ -0,0 +1,102 @@
+"""
+Camera Frame Backpressure Tests
+
+カメラフレームの最新フレーム優先メールボックスとFPS制限のテスト
+"""
+
+import asyncio
+import json
+from unittest.mock import patch
+
+import pytest
+from channels.testing import WebsocketCommunicator
+
+from apps.websocket.mailbox import LatestFrameMailbox
+from config.asgi import application
+
+
+@pytest.mark.asyncio
+class TestLatestFrameMailbox:
+    """LatestFrameMailboxのテスト"""
+
+    async def test_pending_frame_is_replaced(self):
+        """送信中に届いたフレームは最新のもののみ残るテスト"""
+        sent = []
+        release = asyncio.Event()
+
+        async def slow_send(**frame):
+            await release.wait()
+            sent.append(frame["text_data"])
+
+        mailbox = LatestFrameMailbox(slow_send)
+        mailbox.put(text_data="1")
+        await asyncio.sleep(0)
+
+        # 1フレーム目の送信中に3フレーム投入
+        mailbox.put(text_data="2")
+        mailbox.put(text_data="3")
+        mailbox.put(text_data="4")
+
+        release.set()
+        for _ in range(5):
+            await asyncio.sleep(0)
+
+        assert sent == ["1", "4"]
+        assert mailbox.delivered == 2
+        assert mailbox.dropped == 2
+        assert mailbox.has_pending is False
+
+        await mailbox.close()
+
+    async def test_close_discards_pending_frame(self):
+        """close時に未送信フレームが破棄されるテスト"""
+
+        async def never_send(**frame):
+            await asyncio.Event().wait()
+
+        mailbox = LatestFrameMailbox(never_send)
+        mailbox.put(text_data="1")
+        await asyncio.sleep(0)
+        mailbox.put(text_data="2")
+
+        await mailbox.close()
+
+        assert mailbox.dropped == 1
+        assert mailbox.has_pending is False
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+class TestCameraFrameThrottle:
+    """カメラフレームのFPS制限のテスト"""
+
+    async def test_frames_above_max_fps_are_dropped(self, settings):
+        """最大FPSを超えたフレームが転送されないテスト"""
+        settings.GUITAR_WS_CAMERA_MAX_FPS = 1
+
+        with patch(
+            "apps.websocket.consumers.pairing_manager.avalidate_session",
+            return_value=True,
+        ):
+            pc = WebsocketCommunicator(application, "/ws/guitar/throttle/")
+            mobile = WebsocketCommunicator(application, "/ws/guitar/throttle/")
+
+            assert (await pc.connect())[0] is True
+            await pc.receive_from()
+            assert (await mobile.connect())[0] is True
+            await mobile.receive_from()
+            await pc.receive_from()
+
+            for i in range(3):
+                await pc.send_to(
+                    text_data=json.dumps(
+                        {"type": "camera_frame", "data": {"data": str(i)}}
+                    )
+                )
+
+            response = json.loads(await mobile.receive_from())
+            assert response["data"]["data"] == "0"
+            assert await mobile.receive_nothing() is True
+
+            await pc.disconnect()
+            await mobile.disconnect()
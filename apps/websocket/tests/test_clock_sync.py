@@ -0,0 +1,172 @@
+"""
+Clock Sync Tests
+
+NTP方式の時刻同期とRTT/時計のずれの推定のテスト
+"""
+
+import json
+import time
+from unittest.mock import patch
+
+import pytest
+from channels.testing import WebsocketCommunicator
+
+from apps.websocket import metrics
+from apps.websocket.clock import ClockSync
+from apps.websocket.metrics import InMemoryExporter
+from config.asgi import application
+
+
+class TestClockSync:
+    """ClockSyncのテスト"""
+
+    def test_rtt_and_offset_are_computed(self):
+        """RTTと時計のずれがNTPの式で計算されるテスト"""
+        clock = ClockSync()
+        with patch("apps.websocket.clock.now_ms", return_value=1000.0):
+            probe = clock.create_probe()
+
+        # 片道20ms、クライアントの時計が500ms進んでいる、処理に5ms
+        sample = clock.complete_probe(probe["id"], t1=1520.0, t2=1525.0, t3=1045.0)
+
+        assert sample.rtt == pytest.approx(40.0)
+        assert sample.offset == pytest.approx(500.0)
+
+    def test_estimate_uses_lowest_rtt_sample(self):
+        """推定値にRTTが最小のサンプルが使われるテスト"""
+        clock = ClockSync()
+        for t0, t3, offset in ((0.0, 100.0, 30.0), (200.0, 220.0, 5.0)):
+            with patch("apps.websocket.clock.now_ms", return_value=t0):
+                probe = clock.create_probe()
+            t1 = t0 + (t3 - t0) / 2 + offset
+            clock.complete_probe(probe["id"], t1=t1, t2=t1, t3=t3)
+
+        assert clock.estimate.rtt == pytest.approx(20.0)
+        assert clock.as_dict() == {"rtt": 20.0, "offset": 5.0, "samples": 2}
+
+    def test_unknown_probe_is_ignored(self):
+        """未知のプローブIDへの応答が無視されるテスト"""
+        clock = ClockSync()
+
+        assert clock.complete_probe(99, t1=0, t2=0) is None
+        assert clock.estimate is None
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+class TestClockSyncExchange:
+    """GuitarConsumerでの時刻同期のテスト"""
+
+    async def test_clock_sync_exchange_and_relay(self):
+        """プローブの応答で推定値が返され、転送イベントに付与されるテスト"""
+        exporter = InMemoryExporter()
+        metrics.set_exporter(exporter)
+        try:
+            with patch(
+                "apps.websocket.consumers.pairing_manager.avalidate_session",
+                return_value=True,
+            ):
+                pc = WebsocketCommunicator(application, "/ws/guitar/clock/")
+                assert (await pc.connect())[0] is True
+                await pc.receive_from()
+                mobile = WebsocketCommunicator(application, "/ws/guitar/clock/")
+                assert (await mobile.connect())[0] is True
+                await mobile.receive_from()
+                await pc.receive_from()
+
+                await pc.send_to(
+                    text_data=json.dumps({"type": "clock_sync", "data": {"samples": 2}})
+                )
+                for _ in range(2):
+                    probe = json.loads(await pc.receive_from())
+                    assert probe["type"] == "clock_probe"
+                    client_now = time.time() * 1000 + 250
+                    await pc.send_to(
+                        text_data=json.dumps(
+                            {
+                                "type": "clock_probe",
+                                "data": {
+                                    "id": probe["data"]["id"],
+                                    "t1": client_now,
+                                    "t2": client_now,
+                                },
+                            }
+                        )
+                    )
+                    estimate = json.loads(await pc.receive_from())
+                    assert estimate["type"] == "clock_sync"
+
+                assert estimate["data"]["samples"] == 2
+                assert estimate["data"]["offset"] == pytest.approx(250, abs=50)
+                assert len(exporter.observed("ws_clock_rtt_seconds")) == 2
+
+                await pc.send_to(
+                    text_data=json.dumps(
+                        {"type": "judgement", "data": {"result": "perfect"}}
+                    )
+                )
+                relayed = json.loads(await mobile.receive_from())
+                assert relayed["type"] == "judgement"
+                assert relayed["clock"] == estimate["data"]
+
+                await pc.disconnect()
+                await mobile.disconnect()
+        finally:
+            metrics.set_exporter(None)
+
+    async def test_mobile_chord_change_carries_clock(self):
+        """スマホが時刻同期した後の chord_change にスマホの推定値が付くテスト"""
+        with patch(
+            "apps.websocket.consumers.pairing_manager.avalidate_session",
+            return_value=True,
+        ):
+            pc = WebsocketCommunicator(application, "/ws/guitar/clock-mobile/?role=pc")
+            assert (await pc.connect())[0] is True
+            await pc.receive_from()
+            mobile = WebsocketCommunicator(
+                application, "/ws/guitar/clock-mobile/?role=mobile&client_id=tab"
+            )
+            assert (await mobile.connect())[0] is True
+            await mobile.receive_from()
+            await pc.receive_from()
+
+            # mobile-controller.js が接続時に送るメッセージ
+            await mobile.send_to(
+                text_data=json.dumps({"type": "clock_sync", "data": {"samples": 5}})
+            )
+            for _ in range(5):
+                probe = json.loads(await mobile.receive_from())
+                assert probe["type"] == "clock_probe"
+                received_at = time.time() * 1000
+                await mobile.send_to(
+                    text_data=json.dumps(
+                        {
+                            "type": "clock_probe",
+                            "data": {
+                                "id": probe["data"]["id"],
+                                "t1": received_at,
+                                "t2": time.time() * 1000,
+                            },
+                        }
+                    )
+                )
+                estimate = json.loads(await mobile.receive_from())
+                assert estimate["type"] == "clock_sync"
+
+            await mobile.send_to(
+                text_data=json.dumps(
+                    {
+                        "type": "chord_change",
+                        "data": {"chord": "G"},
+                        "timestamp": int(time.time() * 1000),
+                    }
+                )
+            )
+            relayed = json.loads(await pc.receive_from())
+
+            assert relayed["type"] == "chord_change"
+            assert relayed["clock"] == estimate["data"]
+            assert relayed["clock"]["samples"] == 5
+
+            await pc.disconnect()
+            await mobile.disconnect()
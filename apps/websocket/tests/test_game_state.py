@@ -0,0 +1,167 @@
+"""
+Game State Tests
+
+ゲーム状態の差分同期（バージョン付きの差分とスナップショット）のテスト
+"""
+
+import json
+from unittest.mock import patch
+
+import pytest
+from channels.testing import WebsocketCommunicator
+
+from apps.websocket.consumers import _merge_game_updates
+from apps.websocket.gamestate import (
+    InMemoryGameStateStore,
+    compose,
+    diff,
+    merge_patch,
+    set_game_state_store,
+)
+from config.asgi import application
+
+
+class TestMergePatch:
+    """差分の適用・合成・計算のテスト"""
+
+    def test_merge_patch_sets_and_removes_keys(self):
+        """値の設定、辞書の再帰的な統合、null によるキーの削除のテスト"""
+        state = {"score": 10, "combo": 3, "stats": {"perfect": 1, "good": 2}}
+
+        result = merge_patch(state, {"score": 20, "combo": None, "stats": {"good": 3}})
+
+        assert result == {"score": 20, "stats": {"perfect": 1, "good": 3}}
+        assert state["score"] == 10
+
+    def test_diff_contains_only_changes(self):
+        """diff が変化した部分だけを返すテスト"""
+        old = {"score": 10, "combo": 3, "stats": {"perfect": 1, "good": 2}}
+        new = {"score": 10, "stats": {"perfect": 2, "good": 2}, "maxCombo": 3}
+
+        patch = diff(old, new)
+
+        assert patch == {"combo": None, "stats": {"perfect": 2}, "maxCombo": 3}
+        assert merge_patch(old, patch) == new
+        assert diff(new, new) == {}
+
+    def test_compose_equals_sequential_application(self):
+        """まとめた差分の適用結果が順に適用した結果と同じになるテスト"""
+        state = {"score": 1, "stats": {"perfect": 1}}
+        first = {"score": 2, "combo": 1, "stats": {"good": 1}}
+        second = {"combo": None, "stats": {"perfect": 5}}
+
+        assert merge_patch(state, compose(first, second)) == merge_patch(
+            merge_patch(state, first), second
+        )
+
+    def test_compose_replaces_after_delete_or_scalar(self):
+        """削除や辞書以外の値の後に設定した辞書が既存の値と統合されないテスト"""
+        state = {"a": {"y": 2}, "b": {"z": 3}}
+        first = {"a": None, "b": 1}
+        second = {"a": {"x": 1}, "b": {"w": {"v": None, "u": 4}}}
+        third = {"a": {"t": 5}}
+
+        composed = compose(compose(first, second), third)
+
+        expected = merge_patch(merge_patch(merge_patch(state, first), second), third)
+        assert expected == {"a": {"x": 1, "t": 5}, "b": {"w": {"u": 4}}}
+        assert merge_patch(state, composed) == expected
+
+    def test_coalesced_game_updates_are_merged(self):
+        """レート制限でまとめる game_update の差分が統合されるテスト"""
+        merged = _merge_game_updates(
+            {"type": "game_update", "data": {"score": 1, "combo": 2}},
+            {"type": "game_update", "data": {"score": 3}},
+        )
+
+        assert merged == {"type": "game_update", "data": {"score": 3, "combo": 2}}
+
+
+@pytest.mark.asyncio
+class TestInMemoryGameStateStore:
+    """InMemoryGameStateStoreのテスト"""
+
+    async def test_version_advances_only_on_change(self):
+        """変化がある場合のみバージョンが進むテスト"""
+        store = InMemoryGameStateStore()
+
+        first = await store.apply("room", {"score": 10})
+        same = await store.apply("room", {"score": 10})
+        second = await store.apply("room", {"combo": 1})
+
+        assert (first.base, first.version) == (0, 1)
+        assert same.delta == {} and same.version == 1
+        assert (second.base, second.version, second.delta) == (1, 2, {"combo": 1})
+        assert await store.snapshot("room") == (2, {"score": 10, "combo": 1})
+
+
+@pytest.fixture
+def store():
+    """テストごとに新しいゲーム状態を使う"""
+    store = InMemoryGameStateStore()
+    set_game_state_store(store)
+    with patch(
+        "apps.websocket.consumers.pairing_manager.avalidate_session",
+        return_value=True,
+    ):
+        yield store
+    set_game_state_store(None)
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+class TestConsumerGameState:
+    """GuitarConsumerのゲーム状態の同期のテスト"""
+
+    async def test_only_changes_are_relayed(self, store, join_room):
+        """変化した部分だけがバージョン付きで転送されるテスト"""
+        pc = await join_room("/ws/guitar/state-delta/")
+        mobile = await join_room("/ws/guitar/state-delta/", pc)
+
+        for data in (
+            {"score": 100, "combo": 5},
+            {"score": 100, "combo": 5},
+            {"score": 120, "combo": 6},
+        ):
+            await pc.send_to(
+                text_data=json.dumps({"type": "game_update", "data": data})
+            )
+
+        first = json.loads(await mobile.receive_from())
+        second = json.loads(await mobile.receive_from())
+
+        assert (first["data"], first["base"], first["version"]) == (
+            {"score": 100, "combo": 5},
+            0,
+            1,
+        )
+        assert (second["data"], second["base"], second["version"]) == (
+            {"score": 120, "combo": 6},
+            1,
+            2,
+        )
+        assert await mobile.receive_nothing() is True
+
+        await pc.disconnect()
+        await mobile.disconnect()
+
+    async def test_snapshot_on_join_and_sync(self, store):
+        """参加時と game_sync でゲーム状態の全体が送られるテスト"""
+        await store.apply("guitar_state-join", {"score": 50, "stats": {"perfect": 2}})
+        expected = {
+            "type": "game_state",
+            "data": {"score": 50, "stats": {"perfect": 2}},
+            "version": 1,
+        }
+
+        # 接続通知とスナップショットの順序は決まらないため両方を受信して確認する
+        communicator = WebsocketCommunicator(application, "/ws/guitar/state-join/")
+        connected, _ = await communicator.connect()
+        assert connected is True
+        messages = [json.loads(await communicator.receive_from()) for _ in range(2)]
+        assert expected in messages
+
+        await communicator.send_to(text_data=json.dumps({"type": "game_sync"}))
+        assert json.loads(await communicator.receive_from()) == expected
+
+        await communicator.disconnect()
@@ -0,0 +1,110 @@
+"""
+Heartbeat Tests
+
+サーバーからのハートビート、応答のない接続の切断、idle状態のテスト
+"""
+
+import json
+
+import pytest
+from channels.layers import get_channel_layer
+
+from apps.websocket.consumers import HEARTBEAT_TIMEOUT_CLOSE_CODE
+from apps.websocket.frames import FrameHeader, pack_frame
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+@pytest.mark.usefixtures("valid_session")
+class TestHeartbeat:
+    """ハートビートのテスト"""
+
+    async def test_heartbeat_is_sent_to_silent_connection(
+        self, presence, settings, join_room
+    ):
+        """受信が途絶えた接続にハートビートが送られ、応答で接続が維持されるテスト"""
+        settings.GUITAR_WS_HEARTBEAT_INTERVAL = 0.05
+        settings.GUITAR_WS_HEARTBEAT_TIMEOUT = 0.3
+        mobile = await join_room("/ws/guitar/heartbeat-alive/?role=mobile")
+
+        for _ in range(8):
+            message = json.loads(await mobile.receive_from())
+            assert message["type"] == "heartbeat"
+            await mobile.send_to(text_data=json.dumps({"type": "heartbeat"}))
+
+        assert await presence.count("guitar_heartbeat-alive") == 1
+        await mobile.disconnect()
+
+    async def test_silent_connection_is_reaped(
+        self, presence, settings, exporter, join_room
+    ):
+        """応答のない接続がルームから外されて切断されるテスト"""
+        settings.GUITAR_WS_HEARTBEAT_INTERVAL = 0.05
+        settings.GUITAR_WS_HEARTBEAT_TIMEOUT = 0.2
+        mobile = await join_room("/ws/guitar/heartbeat-reap/?role=mobile")
+
+        while True:
+            output = await mobile.receive_output(timeout=1)
+            if output["type"] == "websocket.close":
+                break
+            assert json.loads(output["text"])["type"] == "heartbeat"
+
+        assert output["code"] == HEARTBEAT_TIMEOUT_CLOSE_CODE
+        assert await presence.count("guitar_heartbeat-reap") == 0
+        assert not get_channel_layer().groups.get("guitar_heartbeat-reap")
+        assert exporter.counter_value("ws_connections_reaped_total") == 1
+
+        # 切断処理は重複して実行されない
+        await mobile.disconnect()
+        assert exporter.counter_value("ws_connections_reaped_total") == 1
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+@pytest.mark.usefixtures("valid_session")
+class TestIdle:
+    """idle状態のテスト"""
+
+    async def test_camera_frames_pause_while_idle(self, presence, exporter, join_room):
+        """idle のメンバーへのカメラフレームの送信が止まるテスト"""
+        pc = await join_room("/ws/guitar/idle-camera/?role=pc")
+        mobile = await join_room("/ws/guitar/idle-camera/?role=mobile")
+        await pc.receive_from()
+
+        await mobile.send_to(
+            text_data=json.dumps({"type": "idle", "data": {"idle": True}})
+        )
+        notice = json.loads(await pc.receive_from())
+        assert notice == {"type": "idle", "data": {"idle": True, "role": "mobile"}}
+
+        frame = pack_frame(FrameHeader(seq=1, width=320, height=240), b"jpeg")
+        await pc.send_to(bytes_data=frame)
+        assert await mobile.receive_nothing() is True
+        assert (
+            exporter.counter_value("ws_camera_frames_dropped_total", reason="idle") == 1
+        )
+
+        await mobile.send_to(
+            text_data=json.dumps({"type": "idle", "data": {"idle": False}})
+        )
+        await pc.receive_from()
+
+        frame = pack_frame(FrameHeader(seq=2, width=320, height=240), b"jpeg")
+        await pc.send_to(bytes_data=frame)
+        output = await mobile.receive_output()
+        assert output["bytes"] == frame
+
+        await pc.disconnect()
+        await mobile.disconnect()
+
+    async def test_invalid_idle_state_is_rejected(self, presence, join_room):
+        """idle が真偽値でない場合にエラーになるテスト"""
+        mobile = await join_room("/ws/guitar/idle-invalid/?role=mobile")
+
+        await mobile.send_to(
+            text_data=json.dumps({"type": "idle", "data": {"idle": "yes"}})
+        )
+        response = json.loads(await mobile.receive_from())
+
+        assert response == {"type": "error", "data": {"message": "Invalid idle state"}}
+        await mobile.disconnect()
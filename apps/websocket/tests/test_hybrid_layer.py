@@ -0,0 +1,167 @@
+"""
+Hybrid Channel Layer Tests
+
+ローカル配送を優先するチャネルレイヤーと、シャーディングのテスト
+"""
+
+import asyncio
+import collections
+from unittest.mock import AsyncMock, Mock, patch
+
+import pytest
+from channels_redis.core import RedisChannelLayer
+
+from apps.websocket.layers import (
+    ConsistentHashRing,
+    HybridChannelLayer,
+    ShardedChannelLayer,
+)
+
+
+async def _wait_forever(self, channel):
+    """Redisからメッセージが届かない状態を再現する"""
+    await asyncio.Event().wait()
+
+
+@pytest.fixture
+def layer():
+    """Redisに接続しないHybridChannelLayer"""
+    with patch.object(RedisChannelLayer, "receive", _wait_forever):
+        yield HybridChannelLayer(hosts=["redis://localhost:6379/0"])
+
+
+@pytest.mark.asyncio
+class TestHybridChannelLayer:
+    """HybridChannelLayerのテスト"""
+
+    async def test_send_to_local_channel_skips_redis(self, layer):
+        """ローカルチャネルへの送信がメモリ上で配送されるテスト"""
+        channel = await layer.new_channel()
+
+        with patch.object(RedisChannelLayer, "send") as redis_send:
+            await layer.send(channel, {"type": "chord_change", "chord": "C"})
+            redis_send.assert_not_called()
+
+        message = await layer.receive(channel)
+
+        assert message == {"type": "chord_change", "chord": "C"}
+        assert layer.stats()["local_deliveries"] == 1
+        assert layer.local_hit_ratio == 1.0
+
+    async def test_pending_receive_is_woken_by_local_send(self, layer):
+        """受信待ちのチャネルにローカル送信が届くテスト"""
+        channel = await layer.new_channel()
+        receiver = asyncio.ensure_future(layer.receive(channel))
+        await asyncio.sleep(0)
+
+        await layer.send(channel, {"type": "judgement"})
+
+        assert await asyncio.wait_for(receiver, 1) == {"type": "judgement"}
+
+    async def test_send_to_remote_channel_uses_redis(self, layer):
+        """他プロセスのチャネルへの送信がRedisを使うテスト"""
+        with patch.object(RedisChannelLayer, "send", AsyncMock()) as redis_send:
+            await layer.send("specific.other!abc", {"type": "chord_change"})
+
+        redis_send.assert_awaited_once()
+        assert layer.stats()["remote_deliveries"] == 1
+        assert layer.local_hit_ratio == 0.0
+
+    async def test_group_send_splits_local_and_remote_members(self, layer):
+        """グループ送信でローカルとRedisのメンバーが振り分けられるテスト"""
+        local_channel = await layer.new_channel()
+        remote_channel = "specific.other!abc"
+
+        connection = Mock()
+        connection.zremrangebyscore = AsyncMock()
+        connection.zrange = AsyncMock(
+            return_value=[local_channel.encode(), remote_channel.encode()]
+        )
+        connection.eval = AsyncMock(return_value=0)
+
+        with patch.object(layer, "connection", return_value=connection):
+            await layer.group_send("guitar_room", {"type": "game_update"})
+
+        assert await layer.receive(local_channel) == {"type": "game_update"}
+        # Redisにはリモートのメンバー分だけ送信される
+        assert connection.eval.await_args.args[1] == 1
+        assert layer.stats()["local_deliveries"] == 1
+        assert layer.stats()["remote_deliveries"] == 1
+
+    async def test_deliveries_are_exported(self, layer, exporter):
+        """ローカル配送とRedis経由の配送がメトリクスに記録されるテスト"""
+        channel = await layer.new_channel()
+        await layer.send(channel, {"type": "chord_change"})
+        with patch.object(RedisChannelLayer, "send", AsyncMock()):
+            await layer.send("specific.other!abc", {"type": "chord_change"})
+            await layer.send("specific.other!def", {"type": "chord_change"})
+
+        assert exporter.counter_value("ws_layer_local_hits_total") == 1
+        assert exporter.counter_value("ws_layer_remote_sends_total") == 2
+
+    async def test_cancelled_receive_unregisters_channel(self, layer):
+        """受信のキャンセルでローカルチャネルが解除されるテスト"""
+        channel = await layer.new_channel()
+        receiver = asyncio.ensure_future(layer.receive(channel))
+        await asyncio.sleep(0)
+
+        receiver.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await receiver
+
+        assert layer.stats()["local_channels"] == 0
+
+
+class TestConsistentHashRing:
+    """ConsistentHashRingのテスト"""
+
+    def test_keys_are_spread_across_nodes(self):
+        """キーがノードにほぼ均等に振り分けられるテスト"""
+        ring = ConsistentHashRing([f"redis://redis-{i}:6379/0" for i in range(4)])
+        counts = collections.Counter(ring.get(f"guitar_room-{i}") for i in range(10000))
+
+        assert set(counts) == {0, 1, 2, 3}
+        assert max(counts.values()) / min(counts.values()) < 1.5
+
+    def test_adding_a_node_moves_few_keys(self):
+        """ノードを追加しても大半のキーの担当が変わらないテスト"""
+        nodes = [f"redis://redis-{i}:6379/0" for i in range(4)]
+        before = ConsistentHashRing(nodes)
+        after = ConsistentHashRing(nodes + ["redis://redis-4:6379/0"])
+        keys = [f"guitar_room-{i}" for i in range(10000)]
+
+        moved = [key for key in keys if before.get(key) != after.get(key)]
+
+        # 移ったキーはすべて新しいノードの担当になる
+        assert all(after.get(key) == 4 for key in moved)
+        assert len(moved) / len(keys) < 0.3
+
+
+class TestShardedChannelLayer:
+    """ShardedChannelLayerのテスト"""
+
+    def test_specific_channel_send_and_receive_use_same_shard(self):
+        """プロセス固有チャネルの送信先と受信元が同じRedisになるテスト"""
+        layer = ShardedChannelLayer(
+            hosts=[f"redis://redis-{i}:6379/0" for i in range(8)]
+        )
+        channels = [f"specific.worker{i}!abc" for i in range(50)]
+
+        assert all(
+            layer.consistent_hash(channel)
+            == layer.consistent_hash(layer.non_local_name(channel))
+            for channel in channels
+        )
+
+    def test_shard_does_not_depend_on_host_order(self):
+        """hosts の順序が異なっても同じRedisに振り分けられるテスト"""
+        hosts = [f"redis://redis-{i}:6379/0" for i in range(3)]
+        layer = ShardedChannelLayer(hosts=hosts)
+        reversed_layer = ShardedChannelLayer(hosts=hosts[::-1])
+
+        for i in range(100):
+            group = f"guitar_room-{i}"
+            assert (
+                layer.hosts[layer.consistent_hash(group)]
+                == reversed_layer.hosts[reversed_layer.consistent_hash(group)]
+            )
@@ -0,0 +1,45 @@
+"""
+Load Test Harness Tests
+
+負荷試験ハーネスのテスト
+"""
+
+from argparse import Namespace
+
+import pytest
+
+from apps.websocket.benchmarks.load_test import DEFAULT_MIX, percentiles, run
+
+
+def test_percentiles():
+    """p50 / p95 / p99 がミリ秒で計算されるテスト"""
+    result = percentiles([i / 1000 for i in range(1, 101)])
+
+    assert result["p50"] == pytest.approx(50.5)
+    assert result["p99"] == pytest.approx(99.01)
+    assert percentiles([]) == {"p50": None, "p95": None, "p99": None}
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+async def test_run_reports_latency_and_throughput():
+    """少数のルームで負荷試験を実行できるテスト"""
+    args = Namespace(
+        rooms=2,
+        duration=0.2,
+        rate=50.0,
+        mix=DEFAULT_MIX,
+        camera_bytes=100,
+        layer="memory",
+        timeout=5.0,
+        seed=0,
+    )
+
+    report = await run(args)
+    results = report["results"]
+
+    assert results["connections"] == 4
+    assert results["received"] > 0
+    assert results["messages_per_sec"] > 0
+    assert results["latency_ms"]["p50"] is not None
+    assert set(report["params"]) >= {"rooms", "duration_s", "rate_per_room", "mix"}
@@ -0,0 +1,185 @@
+"""
+WebSocket Metrics Tests
+
+メトリクスのエクスポーターとGuitarConsumerの計測のテスト
+"""
+
+import json
+import socket
+from unittest.mock import patch
+
+import pytest
+from channels.testing import WebsocketCommunicator
+
+from apps.websocket import metrics
+from apps.websocket.metrics import PrometheusExporter, StatsdExporter
+from config.asgi import application
+
+
+class TestPrometheusExporter:
+    """PrometheusExporterのテスト"""
+
+    def test_render_counters_and_histograms(self):
+        """カウンターとヒストグラムがテキスト形式で出力されるテスト"""
+        exporter = PrometheusExporter(buckets=(0.01, 0.1))
+        exporter.increment("ws_messages_total", type="chord_change")
+        exporter.increment("ws_messages_total", type="chord_change")
+        exporter.observe("ws_handler_duration_seconds", 0.05, type="chord_change")
+
+        text = exporter.render()
+
+        assert "# TYPE ws_messages_total counter" in text
+        assert 'ws_messages_total{type="chord_change"} 2' in text
+        assert "# TYPE ws_handler_duration_seconds histogram" in text
+        assert (
+            'ws_handler_duration_seconds_bucket{type="chord_change",le="0.01"} 0'
+            in text
+        )
+        assert (
+            'ws_handler_duration_seconds_bucket{type="chord_change",le="0.1"} 1' in text
+        )
+        assert 'ws_handler_duration_seconds_count{type="chord_change"} 1' in text
+
+
+class TestStatsdExporter:
+    """StatsdExporterのテスト"""
+
+    def test_sends_tagged_packets(self):
+        """タグ付きのパケットがUDPで送信されるテスト"""
+        server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        server.bind(("127.0.0.1", 0))
+        server.settimeout(1)
+        exporter = StatsdExporter(port=server.getsockname()[1], prefix="test")
+
+        exporter.increment("ws_messages_total", type="judgement")
+        exporter.observe("ws_handler_duration_seconds", 0.002, type="judgement")
+
+        assert server.recv(1024) == b"test.ws_messages_total:1|c|#type:judgement"
+        assert server.recv(1024) == (
+            b"test.ws_handler_duration_seconds:2.0|ms|#type:judgement"
+        )
+        server.close()
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+class TestConsumerMetrics:
+    """GuitarConsumerの計測のテスト"""
+
+    async def test_messages_are_counted_and_timed(self, exporter):
+        """メッセージ数、処理時間、転送時間、接続数が記録されるテスト"""
+        with patch(
+            "apps.websocket.consumers.pairing_manager.avalidate_session",
+            return_value=True,
+        ):
+            pc = WebsocketCommunicator(application, "/ws/guitar/metrics/")
+            assert (await pc.connect())[0] is True
+            await pc.receive_from()
+            mobile = WebsocketCommunicator(application, "/ws/guitar/metrics/")
+            assert (await mobile.connect())[0] is True
+            await mobile.receive_from()
+            await pc.receive_from()
+
+            await pc.send_to(
+                text_data=json.dumps({"type": "chord_change", "data": {"chord": "C"}})
+            )
+            await mobile.receive_from()
+            await pc.send_to(text_data=json.dumps({"type": "bogus"}))
+            await pc.receive_from()
+
+            assert exporter.counter_value("ws_connections_total", codec="json") == 2
+            assert exporter.gauge_value("ws_active_connections") >= 2
+            assert exporter.counter_value("ws_messages_total", type="chord_change") == 1
+            assert exporter.counter_value("ws_messages_total", type="unknown") == 1
+            assert exporter.observed("ws_handler_duration_seconds", type="chord_change")
+            assert exporter.observed("ws_decode_duration_seconds", codec="json")
+            assert exporter.observed(
+                "ws_relay_duration_seconds", type="chord_change", mode="peer"
+            )
+
+            await pc.disconnect()
+            await mobile.disconnect()
+
+        assert exporter.counter_value("ws_disconnections_total", code=1000) == 2
+
+
+@pytest.fixture
+def prometheus_exporter():
+    """PrometheusExporterに差し替える"""
+    exporter = PrometheusExporter()
+    exporter.increment("ws_connections_total", codec="json")
+    metrics.set_exporter(exporter)
+    yield exporter
+    metrics.set_exporter(None)
+
+
+class TestMetricsView:
+    """メトリクスエンドポイントのテスト"""
+
+    def test_metrics_endpoint_renders_prometheus_text(
+        self, client, settings, prometheus_exporter
+    ):
+        """トークンを付けたリクエストにPrometheus形式のメトリクスが返されるテスト"""
+        settings.GUITAR_WS_METRICS_ENABLED = True
+        settings.GUITAR_WS_METRICS_TOKEN = "scrape-token"
+
+        response = client.get(
+            "/websocket/metrics/", headers={"Authorization": "Bearer scrape-token"}
+        )
+
+        assert response.status_code == 200
+        assert response["Content-Type"].startswith("text/plain")
+        assert b'ws_connections_total{codec="json"} 1' in response.content
+
+    def test_metrics_endpoint_is_disabled_by_default(
+        self, client, settings, prometheus_exporter
+    ):
+        """無効な場合はトークンがあっても404になるテスト"""
+        settings.GUITAR_WS_METRICS_ENABLED = False
+        settings.GUITAR_WS_METRICS_TOKEN = "scrape-token"
+
+        response = client.get(
+            "/websocket/metrics/", headers={"Authorization": "Bearer scrape-token"}
+        )
+
+        assert response.status_code == 404
+
+    @pytest.mark.django_db
+    def test_anonymous_access_is_refused(self, client, settings, prometheus_exporter):
+        """匿名のリクエストや不正なトークンが拒否されるテスト"""
+        settings.GUITAR_WS_METRICS_ENABLED = True
+        settings.GUITAR_WS_METRICS_TOKEN = "scrape-token"
+
+        assert client.get("/websocket/metrics/").status_code == 404
+        response = client.get(
+            "/websocket/metrics/", headers={"Authorization": "Bearer wrong"}
+        )
+        assert response.status_code == 404
+
+    @pytest.mark.django_db
+    def test_staff_user_can_read_metrics(
+        self, client, settings, django_user_model, prometheus_exporter
+    ):
+        """トークンが未設定の場合はスタッフユーザーだけが取得できるテスト"""
+        settings.GUITAR_WS_METRICS_ENABLED = True
+        settings.GUITAR_WS_METRICS_TOKEN = ""
+        user = django_user_model.objects.create_user(
+            username="member", email="member@example.com", password="testpass123"
+        )
+        client.force_login(user)
+        assert client.get("/websocket/metrics/").status_code == 404
+
+        user.is_staff = True
+        user.save()
+        assert client.get("/websocket/metrics/").status_code == 200
+
+    def test_metrics_endpoint_requires_text_exporter(self, client, settings, exporter):
+        """テキスト出力に対応しないエクスポーターでは404になるテスト"""
+        settings.GUITAR_WS_METRICS_ENABLED = True
+        settings.GUITAR_WS_METRICS_TOKEN = "scrape-token"
+
+        response = client.get(
+            "/websocket/metrics/", headers={"Authorization": "Bearer scrape-token"}
+        )
+
+        assert response.status_code == 404
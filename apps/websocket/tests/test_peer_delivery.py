@@ -0,0 +1,83 @@
+"""
+Peer Delivery Tests
+
+2人ルームでのピア直接送信のテスト
+"""
+
+import json
+from unittest.mock import patch
+
+import pytest
+from channels.layers import InMemoryChannelLayer
+
+
+@pytest.fixture
+def group_send_calls():
+    """group_sendで送信されたイベントタイプを記録する"""
+    calls = []
+    original = InMemoryChannelLayer.group_send
+
+    async def spy(self, group, message):
+        calls.append(message["type"])
+        return await original(self, group, message)
+
+    with (
+        patch.object(InMemoryChannelLayer, "group_send", spy),
+        patch(
+            "apps.websocket.consumers.pairing_manager.avalidate_session",
+            return_value=True,
+        ),
+    ):
+        yield calls
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+class TestPeerDelivery:
+    """ピア直接送信のテスト"""
+
+    async def test_two_party_room_skips_group_send(self, group_send_calls, join_room):
+        """2人ルームではgroup_sendを使わずに相手へ届くテスト"""
+        pc = await join_room("/ws/guitar/peer-2/")
+        mobile = await join_room("/ws/guitar/peer-2/", pc)
+        group_send_calls.clear()
+
+        await pc.send_to(
+            text_data=json.dumps({"type": "chord_change", "data": {"chord": "G"}})
+        )
+
+        response = json.loads(await mobile.receive_from())
+        assert response == {
+            "type": "chord_change",
+            "data": {"chord": "G"},
+            "seq": 1,
+        }
+        assert await pc.receive_nothing() is True
+        assert "chord_change" not in group_send_calls
+
+        await pc.disconnect()
+        await mobile.disconnect()
+
+    async def test_larger_room_falls_back_to_group_send(
+        self, group_send_calls, settings, join_room
+    ):
+        """3人以上のルームではgroup_sendで全員に届くテスト"""
+        settings.GUITAR_WS_ROOM_CAPACITY = 3
+        pc = await join_room("/ws/guitar/peer-3/")
+        mobile = await join_room("/ws/guitar/peer-3/", pc)
+        viewer = await join_room("/ws/guitar/peer-3/", pc, mobile)
+        group_send_calls.clear()
+
+        await pc.send_to(
+            text_data=json.dumps({"type": "chord_change", "data": {"chord": "Am"}})
+        )
+
+        for member in (mobile, viewer):
+            response = json.loads(await member.receive_from())
+            assert response["data"]["chord"] == "Am"
+        assert await pc.receive_nothing() is True
+        assert group_send_calls == ["chord_change"]
+
+        await pc.disconnect()
+        await mobile.disconnect()
+        await viewer.disconnect()
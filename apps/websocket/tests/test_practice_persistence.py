@@ -0,0 +1,143 @@
+"""
+Practice Persistence Tests
+
+WebSocket経由の練習セッションの保存と書き込みキューのテスト
+"""
+
+import json
+from unittest.mock import patch
+
+import pytest
+from channels.db import database_sync_to_async
+from django.contrib.auth import get_user_model
+
+from apps.progress.models import PracticeSession
+from apps.websocket import metrics
+from apps.websocket.metrics import InMemoryExporter
+from apps.websocket.writes import WriteQueue, WriteQueueFull
+
+User = get_user_model()
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+class TestWriteQueue:
+    """WriteQueueのテスト"""
+
+    async def test_writes_are_batched_in_order(self):
+        """時間窓内の書き込みが投入順に1回でまとめて実行されるテスト"""
+        exporter = InMemoryExporter()
+        metrics.set_exporter(exporter)
+        queue = WriteQueue(window=0.05)
+        calls = []
+
+        futures = [queue.submit(calls.append, i) for i in range(3)]
+        for future in futures:
+            await future
+
+        assert calls == [0, 1, 2]
+        assert exporter.observed("ws_write_batch_size") == [3]
+        metrics.set_exporter(None)
+
+    async def test_errors_are_set_on_the_future(self):
+        """書き込みの例外がFutureに設定され、他の書き込みは実行されるテスト"""
+        queue = WriteQueue()
+
+        def fail():
+            raise ValueError("boom")
+
+        failed = queue.submit(fail)
+        succeeded = queue.submit(lambda: "ok")
+
+        with pytest.raises(ValueError):
+            await failed
+        assert await succeeded == "ok"
+
+    async def test_full_queue_rejects_writes(self):
+        """キューが満杯の場合に WriteQueueFull が送出されるテスト"""
+        queue = WriteQueue(maxsize=1)
+
+        queue.submit(lambda: None)
+        with pytest.raises(WriteQueueFull):
+            queue.submit(lambda: None)
+        await queue.join()
+
+
+async def _receive(communicator, message_type):
+    """指定したタイプのメッセージを受信するまで読み進める"""
+    while True:
+        message = json.loads(await communicator.receive_from())
+        if message["type"] == message_type:
+            return message
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+@pytest.mark.usefixtures("valid_session")
+class TestPracticePersistence:
+    """練習セッションの保存のテスト"""
+
+    async def test_practice_start_and_end_are_persisted(self, join_room):
+        """practice_start / practice_end で練習セッションが保存されるテスト"""
+        user = await database_sync_to_async(User.objects.create_user)(
+            username="wsuser", email="ws@example.com", password="testpass123"
+        )
+        communicator = await join_room("/ws/guitar/practice-save/", user=user)
+
+        await communicator.send_to(text_data=json.dumps({"type": "practice_start"}))
+        started = await _receive(communicator, "practice_saved")
+        assert started["data"]["status"] == "started"
+
+        await communicator.send_to(
+            text_data=json.dumps(
+                {"type": "practice_end", "data": {"chords": ["C", "G"]}}
+            )
+        )
+        ended = await _receive(communicator, "practice_saved")
+        assert ended["data"]["session_id"] == started["data"]["session_id"]
+        assert ended["data"]["duration_minutes"] == 0
+
+        session = await database_sync_to_async(PracticeSession.objects.get)(
+            id=started["data"]["session_id"]
+        )
+        assert session.user_id == user.id
+        assert session.ended_at is not None
+        assert session.chords_practiced == ["C", "G"]
+
+        await communicator.disconnect()
+
+    async def test_anonymous_sender_records_for_pairing_owner(self, join_room):
+        """未ログインの送信者の練習がペアリングセッションの所有者に保存されるテスト"""
+        owner = await database_sync_to_async(User.objects.create_user)(
+            username="owner", email="owner@example.com", password="testpass123"
+        )
+        with patch(
+            "apps.websocket.practice.pairing_manager.get_session",
+            return_value={"user_id": owner.id, "status": "paired"},
+        ):
+            communicator = await join_room("/ws/guitar/practice-anon/")
+
+            await communicator.send_to(text_data=json.dumps({"type": "practice_start"}))
+            started = await _receive(communicator, "practice_saved")
+
+        session = await database_sync_to_async(PracticeSession.objects.get)(
+            id=started["data"]["session_id"]
+        )
+        assert session.user_id == owner.id
+
+        await communicator.disconnect()
+
+    async def test_invalid_chords_are_rejected(self, join_room):
+        """不正な chords の practice_end がエラーになるテスト"""
+        user = await database_sync_to_async(User.objects.create_user)(
+            username="wsuser2", email="ws2@example.com", password="testpass123"
+        )
+        communicator = await join_room("/ws/guitar/practice-invalid/", user=user)
+
+        await communicator.send_to(
+            text_data=json.dumps({"type": "practice_end", "data": {"chords": "C"}})
+        )
+        response = json.loads(await communicator.receive_from())
+
+        assert response == {"type": "error", "data": {"message": "Invalid chords"}}
+        await communicator.disconnect()
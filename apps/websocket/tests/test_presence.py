@@ -0,0 +1,197 @@
+"""
+Presence Tests
+
+ルームのプレゼンス（デバイスの役割・定員・有効期限）のテスト
+"""
+
+import json
+import time
+from unittest.mock import patch
+
+import pytest
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+
+from apps.websocket.consumers import REPLACED_CLOSE_CODE
+from apps.websocket.presence import InMemoryPresence, JoinResult, summarize
+from config.asgi import application
+
+
+@pytest.mark.asyncio
+class TestInMemoryPresence:
+    """InMemoryPresenceのテスト"""
+
+    async def test_join_respects_capacity(self):
+        """定員に達したルームへの参加が拒否されるテスト"""
+        presence = InMemoryPresence()
+
+        assert (await presence.join("room", "a", "pc", capacity=2)).joined is True
+        assert (await presence.join("room", "b", "mobile", capacity=2)).joined is True
+        assert (await presence.join("room", "c", "mobile", capacity=2)).joined is False
+        # 参加済みのチャネルは再参加できる
+        assert (await presence.join("room", "a", "pc", capacity=2)).joined is True
+
+        await presence.leave("room", "b")
+        assert (await presence.join("room", "c", "mobile", capacity=2)).joined is True
+        assert summarize(await presence.members("room")) == {"pc": 1, "mobile": 1}
+
+    async def test_expired_members_are_pruned(self):
+        """ハートビートが途絶えたメンバーが期限切れになるテスト"""
+        presence = InMemoryPresence(ttl=10)
+
+        with patch("apps.websocket.presence.time.time", return_value=0.0):
+            await presence.join("room", "a", "pc", capacity=2)
+            await presence.join("room", "b", "mobile", capacity=2)
+
+        with patch("apps.websocket.presence.time.time", return_value=5.0):
+            await presence.heartbeat("room", "a")
+
+        with patch("apps.websocket.presence.time.time", return_value=12.0):
+            assert set(await presence.members("room")) == {"a"}
+            assert (
+                await presence.join("room", "c", "mobile", capacity=2)
+            ).joined is True
+
+        with patch("apps.websocket.presence.time.time", return_value=30.0):
+            assert presence.reap() == 2
+            assert await presence.count("room") == 0
+
+    async def test_same_client_or_user_replaces_member(self):
+        """同じクライアント・ユーザーの同じ役割での再参加が定員に数えられないテスト"""
+        presence = InMemoryPresence()
+
+        await presence.join("room", "a", "pc", user_id=1, capacity=2)
+        await presence.join("room", "b", "mobile", capacity=2, client_id="phone")
+
+        # 置き換えたメンバーのチャネル名が返る
+        assert await presence.join(
+            "room", "c", "mobile", capacity=2, client_id="phone"
+        ) == JoinResult(True, ("b",))
+        assert await presence.join(
+            "room", "d", "pc", user_id=1, capacity=2
+        ) == JoinResult(True, ("a",))
+        assert set(await presence.members("room")) == {"c", "d"}
+        # 役割が異なる場合は置き換えない
+        assert await presence.join(
+            "room", "e", "pc", capacity=2, client_id="phone"
+        ) == JoinResult(False)
+
+    async def test_stale_member_of_same_role_is_replaced(self):
+        """更新のない同じ役割のメンバーが新しい接続で置き換えられるテスト"""
+        presence = InMemoryPresence(ttl=60, stale_after=30)
+
+        with patch("apps.websocket.presence.time.time", return_value=0.0):
+            await presence.join("room", "a", "pc", capacity=2)
+            await presence.join("room", "b", "mobile", capacity=2)
+
+        with patch("apps.websocket.presence.time.time", return_value=20.0):
+            await presence.heartbeat("room", "a")
+            assert (
+                await presence.join("room", "c", "mobile", capacity=2)
+            ).joined is False
+
+        with patch("apps.websocket.presence.time.time", return_value=35.0):
+            assert (
+                await presence.join("room", "c", "mobile", capacity=2)
+            ).joined is True
+            assert set(await presence.members("room")) == {"a", "c"}
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+class TestConsumerPresence:
+    """GuitarConsumerのプレゼンスのテスト"""
+
+    async def test_third_device_is_rejected(self, presence, valid_session):
+        """定員を超える3台目の接続が4003で拒否されるテスト"""
+        pc = WebsocketCommunicator(application, "/ws/guitar/presence-full/?role=pc")
+        assert (await pc.connect())[0] is True
+        await pc.receive_from()
+
+        mobile = WebsocketCommunicator(
+            application, "/ws/guitar/presence-full/?role=mobile"
+        )
+        assert (await mobile.connect())[0] is True
+        await mobile.receive_from()
+        notice = json.loads(await pc.receive_from())
+        assert notice["data"]["role"] == "mobile"
+
+        extra = WebsocketCommunicator(
+            application, "/ws/guitar/presence-full/?role=mobile"
+        )
+        connected, code = await extra.connect()
+        assert connected is False
+        assert code == 4003
+        # サーバーからの切断イベントを届ける
+        await extra.disconnect(code=4003)
+        # 拒否した接続の切断は通知せず、参加中のメンバーも残る
+        assert await pc.receive_nothing() is True
+        assert await presence.count("guitar_presence-full") == 2
+
+        await pc.disconnect()
+        await mobile.disconnect()
+        assert await presence.count("guitar_presence-full") == 0
+
+    async def test_same_role_rejoins_after_unclean_disconnect(
+        self, presence, valid_session, join_room
+    ):
+        """正常に切断されなかった接続の代わりに同じ役割で再接続できるテスト"""
+        pc = await join_room("/ws/guitar/presence-rejoin/?role=pc")
+        # 通信が途切れたスマホの接続が、切断されないままルームに残っている
+        with patch(
+            "apps.websocket.presence.time.time",
+            return_value=time.time() - presence.stale_after,
+        ):
+            await presence.join(
+                "guitar_presence-rejoin", "specific.gone!abc", "mobile", capacity=2
+            )
+
+        mobile = await join_room("/ws/guitar/presence-rejoin/?role=mobile", pc)
+
+        members = await presence.members("guitar_presence-rejoin")
+        assert "specific.gone!abc" not in members
+        assert summarize(members) == {"pc": 1, "mobile": 1}
+
+        await pc.disconnect()
+        await mobile.disconnect()
+
+    async def test_same_client_reconnect_replaces_half_open_socket(
+        self, presence, valid_session, join_room
+    ):
+        """同じクライアントIDの再接続で、残っていた古い接続が切断されるテスト"""
+        path = "/ws/guitar/presence-replace/?role=mobile&client_id=tab-1"
+        pc = await join_room("/ws/guitar/presence-replace/?role=pc")
+        # Wi-Fi から LTE に切り替わり、古い接続は切断されないまま残っている
+        old = await join_room(path, pc)
+
+        new = await join_room(path, pc)
+
+        output = await old.receive_output(timeout=1)
+        assert output == {"type": "websocket.close", "code": REPLACED_CLOSE_CODE}
+        await old.disconnect(code=REPLACED_CLOSE_CODE)
+        # 古い接続の切断がピアに通知され、チャネルグループからも外れる
+        notice = json.loads(await pc.receive_from())
+        assert notice["data"]["status"] == "disconnected"
+        assert len(get_channel_layer().groups["guitar_presence-replace"]) == 2
+
+        members = await presence.members("guitar_presence-replace")
+        assert summarize(members) == {"pc": 1, "mobile": 1}
+
+        await pc.disconnect()
+        await new.disconnect()
+
+    async def test_presence_query(self, presence, valid_session):
+        """presenceメッセージでルームのメンバーが返るテスト"""
+        pc = WebsocketCommunicator(application, "/ws/guitar/presence-query/?role=pc")
+        await pc.connect()
+        await pc.receive_from()
+
+        await pc.send_to(text_data=json.dumps({"type": "presence", "data": {}}))
+        response = json.loads(await pc.receive_from())
+
+        assert response["type"] == "presence"
+        assert response["data"]["count"] == 1
+        assert response["data"]["roles"] == {"pc": 1, "mobile": 0}
+        assert response["data"]["members"][0]["role"] == "pc"
+
+        await pc.disconnect()
@@ -0,0 +1,124 @@
+"""
+Message Codec Tests
+
+コーデックのネゴシエーションとエンコード/デコードのテスト
+"""
+
+import json
+from unittest.mock import patch
+
+import pytest
+from channels.testing import WebsocketCommunicator
+
+from apps.websocket.protocol import (
+    CODECS,
+    DEFAULT_CODEC,
+    MessageDecodeError,
+    negotiate_codec,
+)
+from config.asgi import application
+
+
+class TestCodecs:
+    """各コーデックのテスト"""
+
+    MESSAGE = {
+        "type": "batch",
+        "messages": [
+            {"type": "judgement", "data": {"result": "perfect"}},
+            {"type": "game_update", "data": {"score": 100}},
+        ],
+    }
+
+    @pytest.mark.parametrize("name", sorted(CODECS))
+    def test_round_trip(self, name):
+        """エンコードしたメッセージが元に戻るテスト"""
+        codec = CODECS[name]
+        assert codec.decode(codec.encode(self.MESSAGE)) == self.MESSAGE
+
+    def test_compact_uses_short_codes(self):
+        """compactが短いタイプコードとキーを使うテスト"""
+        encoded = CODECS["compact"].encode(
+            {"type": "chord_change", "data": {"chord": "C"}}
+        )
+        assert json.loads(encoded) == {"t": "cc", "d": {"chord": "C"}}
+
+    def test_invalid_json_raises_decode_error(self):
+        """不正なJSONでMessageDecodeErrorになるテスト"""
+        with pytest.raises(MessageDecodeError):
+            DEFAULT_CODEC.decode("invalid json{")
+        with pytest.raises(MessageDecodeError):
+            DEFAULT_CODEC.decode("[1, 2]")
+
+    def test_msgpack_detects_message_frames(self):
+        """msgpackコーデックがメッセージとカメラフレームを区別するテスト"""
+        codec = CODECS["msgpack"]
+        assert codec.is_message(codec.encode({"type": "ping"})) is True
+        assert codec.is_message(b"\x01\x01\x00\x00\x00\x01") is False
+        assert DEFAULT_CODEC.is_message(codec.encode({"type": "ping"})) is False
+
+
+class TestNegotiateCodec:
+    """negotiate_codecのテスト"""
+
+    def test_subprotocol_is_preferred(self):
+        """サブプロトコルがクエリパラメータより優先されるテスト"""
+        codec, subprotocol = negotiate_codec(
+            {
+                "subprotocols": ["virtutune.msgpack"],
+                "query_string": b"codec=compact",
+            }
+        )
+        assert codec.name == "msgpack"
+        assert subprotocol == "virtutune.msgpack"
+
+    def test_query_parameter(self):
+        """クエリパラメータでコーデックを選択するテスト"""
+        codec, subprotocol = negotiate_codec({"query_string": b"codec=compact"})
+        assert codec.name == "compact"
+        assert subprotocol is None
+
+    def test_unknown_codec_falls_back_to_json(self):
+        """未対応のコーデックでは冗長なJSONになるテスト"""
+        codec, subprotocol = negotiate_codec(
+            {"subprotocols": ["virtutune.xml"], "query_string": b"codec=xml"}
+        )
+        assert codec is DEFAULT_CODEC
+        assert subprotocol is None
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+class TestCodecRelay:
+    """異なるコーデックのクライアント間の転送テスト"""
+
+    async def test_compact_and_json_clients_interoperate(self):
+        """compactクライアントの送信がJSONクライアントに冗長形式で届くテスト"""
+        with patch(
+            "apps.websocket.consumers.pairing_manager.avalidate_session",
+            return_value=True,
+        ):
+            pc = WebsocketCommunicator(
+                application, "/ws/guitar/codec/", subprotocols=["virtutune.compact"]
+            )
+            connected, subprotocol = await pc.connect()
+            assert connected is True
+            assert subprotocol == "virtutune.compact"
+            assert json.loads(await pc.receive_from())["t"] == "cu"
+
+            mobile = WebsocketCommunicator(application, "/ws/guitar/codec/")
+            assert (await mobile.connect())[0] is True
+            await mobile.receive_from()
+            await pc.receive_from()
+
+            await pc.send_to(text_data=json.dumps({"t": "cc", "d": {"chord": "C"}}))
+
+            response = json.loads(await mobile.receive_from())
+            assert response == {
+                "type": "chord_change",
+                "data": {"chord": "C"},
+                "seq": 1,
+            }
+
+            await pc.disconnect()
+            await mobile.disconnect()
@@ -0,0 +1,202 @@
+"""
+Rate Limit Tests
+
+トークンバケットによる接続ごと・ルームごとのレート制限のテスト
+"""
+
+import json
+from unittest.mock import patch
+
+import pytest
+from channels.testing import WebsocketCommunicator
+
+from apps.websocket.consumers import registry
+from apps.websocket.ratelimit import (
+    RateLimit,
+    RoomBuckets,
+    TokenBucket,
+    resolve_rate_limit,
+)
+from config.asgi import application
+
+
+class TestTokenBucket:
+    """TokenBucketのテスト"""
+
+    def test_burst_then_refill(self):
+        """容量分は連続で通過し、その後は補充された分だけ通過するテスト"""
+        with patch("apps.websocket.ratelimit.time.monotonic", return_value=0.0):
+            bucket = TokenBucket(rate=10, burst=2)
+            assert bucket.consume() is True
+            assert bucket.consume() is True
+            assert bucket.consume() is False
+            assert bucket.wait_time() == pytest.approx(0.1)
+
+        with patch("apps.websocket.ratelimit.time.monotonic", return_value=0.1):
+            assert bucket.consume() is True
+            assert bucket.consume() is False
+
+
+class TestResolveRateLimit:
+    """resolve_rate_limitのテスト"""
+
+    def test_settings_override_registry(self, settings):
+        """設定のレート制限が登録表より優先されるテスト"""
+        settings.GUITAR_WS_RATE_LIMITS = {
+            "judgement": {"rate": 5, "burst": 10, "room_rate": 8}
+        }
+
+        limit = resolve_rate_limit(registry.get("judgement"))
+
+        assert limit == RateLimit(rate=5, burst=10, room_rate=8)
+        assert limit.room_limited is True
+
+    def test_registry_rate_limit_is_default(self, settings):
+        """設定がない場合は登録表の rate_limit をバースト1で使うテスト"""
+        settings.GUITAR_WS_RATE_LIMITS = {}
+        settings.GUITAR_WS_CAMERA_MAX_FPS = 4
+
+        limit = resolve_rate_limit(registry.get("camera_frame_binary"))
+
+        assert limit == RateLimit(rate=4, burst=1)
+
+    def test_room_buckets_prune_full_buckets(self):
+        """満タンのルームバケットが削除されるテスト"""
+        buckets = RoomBuckets()
+        limit = RateLimit(room_rate=1, room_burst=1)
+        buckets.get("idle", "judgement", limit)
+        buckets.get("busy", "judgement", limit).consume()
+
+        buckets.prune()
+
+        assert len(buckets) == 1
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+class TestConsumerRateLimit:
+    """GuitarConsumerのレート制限のテスト"""
+
+    async def _room(self, path):
+        pc = WebsocketCommunicator(application, path)
+        assert (await pc.connect())[0] is True
+        await pc.receive_from()
+        mobile = WebsocketCommunicator(application, path)
+        assert (await mobile.connect())[0] is True
+        await mobile.receive_from()
+        await pc.receive_from()
+        return pc, mobile
+
+    async def test_excess_messages_are_dropped(self, settings):
+        """接続のバケットを超えたメッセージがグループ送信前に破棄されるテスト"""
+        settings.GUITAR_WS_RATE_LIMITS = {"judgement": {"rate": 0.1, "burst": 2}}
+
+        with patch(
+            "apps.websocket.consumers.pairing_manager.avalidate_session",
+            return_value=True,
+        ):
+            pc, mobile = await self._room("/ws/guitar/limit-drop/")
+
+            for i in range(5):
+                await pc.send_to(
+                    text_data=json.dumps({"type": "judgement", "data": {"note": i}})
+                )
+
+            received = [json.loads(await mobile.receive_from()) for _ in range(2)]
+            assert [m["data"]["note"] for m in received] == [0, 1]
+            assert await mobile.receive_nothing() is True
+
+            await pc.disconnect()
+            await mobile.disconnect()
+
+    async def test_excess_game_updates_are_coalesced(self, settings):
+        """超過したgame_updateは最新のものだけが後で転送されるテスト"""
+        settings.GUITAR_WS_RATE_LIMITS = {
+            "game_update": {"rate": 20, "burst": 1, "overflow": "coalesce"}
+        }
+
+        with patch(
+            "apps.websocket.consumers.pairing_manager.avalidate_session",
+            return_value=True,
+        ):
+            pc, mobile = await self._room("/ws/guitar/limit-coalesce/")
+
+            for score in (1, 2, 3):
+                await pc.send_to(
+                    text_data=json.dumps(
+                        {"type": "game_update", "data": {"score": score}}
+                    )
+                )
+
+            first = json.loads(await mobile.receive_from())
+            latest = json.loads(await mobile.receive_from())
+            assert first["data"]["score"] == 1
+            assert latest["data"]["score"] == 3
+            assert await mobile.receive_nothing() is True
+
+            await pc.disconnect()
+            await mobile.disconnect()
+
+    async def test_failed_coalesced_flush_is_logged(self, settings, caplog):
+        """まとめたメッセージの処理で発生した例外がログに記録されるテスト"""
+        settings.GUITAR_WS_RATE_LIMITS = {
+            "game_update": {"rate": 20, "burst": 1, "overflow": "coalesce"}
+        }
+
+        async def fail(consumer, key, delay):
+            raise RuntimeError("flush failed")
+
+        with (
+            patch(
+                "apps.websocket.consumers.pairing_manager.avalidate_session",
+                return_value=True,
+            ),
+            patch("apps.websocket.consumers.GuitarConsumer._flush_coalesced", fail),
+        ):
+            pc, mobile = await self._room("/ws/guitar/limit-coalesce-error/")
+
+            for score in (1, 2):
+                await pc.send_to(
+                    text_data=json.dumps(
+                        {"type": "game_update", "data": {"score": score}}
+                    )
+                )
+            await mobile.receive_from()
+            assert await mobile.receive_nothing() is True
+
+            await pc.disconnect()
+            await mobile.disconnect()
+
+        errors = [
+            r
+            for r in caplog.records
+            if r.name == "apps.websocket.consumers" and r.levelname == "ERROR"
+        ]
+        assert any(
+            isinstance(r.exc_info[1], RuntimeError) for r in errors if r.exc_info
+        )
+
+    async def test_room_bucket_is_shared_between_connections(self, settings):
+        """ルームのバケットが同じルームの接続で共有されるテスト"""
+        settings.GUITAR_WS_RATE_LIMITS = {
+            "chord_change": {"room_rate": 0.1, "room_burst": 1}
+        }
+
+        with patch(
+            "apps.websocket.consumers.pairing_manager.avalidate_session",
+            return_value=True,
+        ):
+            pc, mobile = await self._room("/ws/guitar/limit-room/")
+
+            await pc.send_to(
+                text_data=json.dumps({"type": "chord_change", "data": {"chord": "C"}})
+            )
+            assert json.loads(await mobile.receive_from())["data"]["chord"] == "C"
+
+            await mobile.send_to(
+                text_data=json.dumps({"type": "chord_change", "data": {"chord": "D"}})
+            )
+            assert await pc.receive_nothing() is True
+
+            await pc.disconnect()
+            await mobile.disconnect()
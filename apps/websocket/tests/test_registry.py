@@ -0,0 +1,122 @@
+"""
+Message Registry Tests
+
+メッセージタイプの登録表と登録表による振り分けのテスト
+"""
+
+import json
+from unittest.mock import patch
+
+import pytest
+from channels.testing import WebsocketCommunicator
+
+from apps.websocket.consumers import registry
+from apps.websocket.registry import (
+    DELIVER_BATCHED,
+    DELIVER_DIRECT,
+    ROUTE_BROADCAST,
+    ROUTE_REPLY,
+    MessageRegistry,
+)
+from config.asgi import application
+
+
+async def _handler(consumer, data):
+    return data
+
+
+class TestMessageRegistry:
+    """MessageRegistryのテスト"""
+
+    def test_register_maps_inbound_and_outbound_types(self):
+        """受信タイプとイベントタイプが登録されるテスト"""
+        table = MessageRegistry()
+        table.message("practice_start", routing=ROUTE_BROADCAST, event="update")(
+            _handler
+        )
+        table.message("ping", routing=ROUTE_REPLY)(_handler)
+
+        assert table.get("practice_start").event_type == "update"
+        assert table.outbound["update"].type == "practice_start"
+        # 応答のみのメッセージはチャネルレイヤーのイベントにならない
+        assert "ping" not in table.outbound
+
+    def test_duplicate_type_is_rejected(self):
+        """同じタイプの二重登録がエラーになるテスト"""
+        table = MessageRegistry()
+        table.message("chord_change")(_handler)
+
+        with pytest.raises(ValueError):
+            table.message("chord_change")(_handler)
+
+    def test_conflicting_delivery_is_rejected(self):
+        """同じイベントタイプに異なる配送方法を指定するとエラーになるテスト"""
+        table = MessageRegistry()
+        table.message("a", event="shared", delivery=DELIVER_DIRECT)(_handler)
+
+        with pytest.raises(ValueError):
+            table.message("b", event="shared", delivery=DELIVER_BATCHED)(_handler)
+
+    def test_callable_rate_limit_is_evaluated_lazily(self, settings):
+        """呼び出し可能なレート制限が実行時に評価されるテスト"""
+        settings.GUITAR_WS_CAMERA_MAX_FPS = 3
+
+        assert registry.get("camera_frame").max_rate() == 3
+        assert registry.get("camera_frame_binary").limit_key == "camera_frame"
+
+    def test_guitar_protocol_types_are_registered(self):
+        """GuitarConsumerの全メッセージタイプが登録されているテスト"""
+        assert set(registry.inbound) == {
+            "chord_change",
+            "practice_start",
+            "practice_end",
+            "game_mode",
+            "game_update",
+            "judgement",
+            "ping",
+            "heartbeat",
+            "idle",
+            "frame_ack",
+            "camera_frame",
+            "camera_frame_binary",
+            "batch",
+            "clock_sync",
+            "clock_probe",
+            "presence",
+            "game_sync",
+        }
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+class TestRegistryRouting:
+    """登録表のルーティング方針のテスト"""
+
+    async def test_broadcast_is_echoed_and_reply_is_not_relayed(self):
+        """ブロードキャストは送信者にも届き、応答は相手に届かないテスト"""
+        with patch(
+            "apps.websocket.consumers.pairing_manager.avalidate_session",
+            return_value=True,
+        ):
+            pc = WebsocketCommunicator(application, "/ws/guitar/registry/")
+            assert (await pc.connect())[0] is True
+            await pc.receive_from()
+            mobile = WebsocketCommunicator(application, "/ws/guitar/registry/")
+            assert (await mobile.connect())[0] is True
+            await mobile.receive_from()
+            await pc.receive_from()
+
+            await pc.send_to(
+                text_data=json.dumps({"type": "practice_start", "data": {}})
+            )
+            for member in (pc, mobile):
+                response = json.loads(await member.receive_from())
+                assert response["type"] == "practice_update"
+                assert response["data"]["status"] == "started"
+
+            await pc.send_to(text_data=json.dumps({"type": "ping", "data": {}}))
+            assert json.loads(await pc.receive_from())["type"] == "pong"
+            assert await mobile.receive_nothing() is True
+
+            await pc.disconnect()
+            await mobile.disconnect()
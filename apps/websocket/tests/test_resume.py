@@ -0,0 +1,176 @@
+"""
+Resume Tests
+
+ワーカーのドレインと、再開トークンによる再接続・再送のテスト
+"""
+
+import json
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from channels.testing import WebsocketCommunicator
+
+from apps.websocket.drain import drain_coordinator
+from apps.websocket.replay import (
+    InMemoryReplayBuffer,
+    issue_resume_token,
+    load_resume_token,
+    set_replay_buffer,
+)
+from config.asgi import application
+
+
+@pytest.mark.asyncio
+class TestInMemoryReplayBuffer:
+    """InMemoryReplayBufferのテスト"""
+
+    async def test_since_returns_later_events(self):
+        """指定した連番より後のイベントが返るテスト"""
+        buffer = InMemoryReplayBuffer(size=8)
+        for chord in ("C", "G", "Am"):
+            await buffer.append("room", "pc", {"type": "chord_change", "chord": chord})
+
+        entries, complete = await buffer.since("room", 1)
+
+        assert [(seq, message["chord"]) for seq, _, message in entries] == [
+            (2, "G"),
+            (3, "Am"),
+        ]
+        assert complete is True
+
+    async def test_gap_is_reported_when_events_are_evicted(self):
+        """バッファから消えたイベントがある場合に complete=False になるテスト"""
+        buffer = InMemoryReplayBuffer(size=2)
+        for i in range(5):
+            await buffer.append("room", "pc", {"type": "game_update", "data": i})
+
+        entries, complete = await buffer.since("room", 1)
+        assert [seq for seq, _, _ in entries] == [4, 5]
+        assert complete is False
+
+        # バッファが作り直されてクライアントの連番の方が大きい場合
+        _, complete = await InMemoryReplayBuffer().since("room", 3)
+        assert complete is False
+
+
+class TestResumeToken:
+    """再開トークンのテスト"""
+
+    def test_token_roundtrip(self):
+        """発行したトークンが同じセッションで検証できるテスト"""
+        token = issue_resume_token("abc", "client-1", "mobile")
+
+        assert load_resume_token(token, "abc") == {
+            "session_id": "abc",
+            "client_id": "client-1",
+            "role": "mobile",
+        }
+
+    def test_invalid_tokens_are_rejected(self):
+        """別のセッションや改ざんされたトークンが拒否されるテスト"""
+        token = issue_resume_token("abc", "client-1", "mobile")
+
+        assert load_resume_token(token, "other") is None
+        assert load_resume_token(token[:-2] + "xx", "abc") is None
+        assert load_resume_token(None, "abc") is None
+
+
+async def _resume(path, count):
+    """
+    再開トークンで再接続し、メッセージをタイプごとに返す
+
+    自分の接続通知はチャネルレイヤー経由で届くため、再送より後になることがある。
+    """
+    communicator = WebsocketCommunicator(application, path)
+    connected, _ = await communicator.connect()
+    assert connected is True
+    messages = {}
+    for _ in range(count):
+        message = json.loads(await communicator.receive_from())
+        messages.setdefault(message["type"], []).append(message)
+    return communicator, messages
+
+
+async def _drained(communicator):
+    """再接続要求を受け取り、ドレインによる切断を確認する"""
+    message = json.loads(await communicator.receive_from())
+    assert message["type"] == "reconnect"
+    assert (await communicator.receive_output())["code"] == 1012
+    await communicator.disconnect(code=1012)
+    return message["data"]
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+class TestDrainAndResume:
+    """ドレインと再接続のテスト"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        set_replay_buffer(InMemoryReplayBuffer())
+        validate = AsyncMock(return_value=True)
+        with patch(
+            "apps.websocket.consumers.pairing_manager.avalidate_session", validate
+        ):
+            yield validate
+        drain_coordinator.reset()
+        set_replay_buffer(None)
+
+    async def test_drain_then_resume_replays_missed_events(self, setup, join_room):
+        """ドレイン後に再接続したクライアントに取りこぼしたイベントが再送されるテスト"""
+        pc = await join_room("/ws/guitar/resume/?role=pc")
+        mobile = await join_room("/ws/guitar/resume/?role=mobile")
+        await pc.receive_from()
+
+        await pc.send_to(
+            text_data=json.dumps({"type": "chord_change", "data": {"chord": "C"}})
+        )
+        assert json.loads(await mobile.receive_from())["seq"] == 1
+
+        await drain_coordinator.start(window=0)
+        pc_hint = await _drained(pc)
+        mobile_hint = await _drained(mobile)
+        assert 0 <= mobile_hint["retry_after_ms"] <= 2000
+
+        # ドレイン中は新しい接続を受け付けない
+        rejected = WebsocketCommunicator(application, "/ws/guitar/resume/")
+        assert (await rejected.connect())[0] is False
+
+        # 新しいワーカーに再接続（セッションの検証は省略される）
+        drain_coordinator.reset()
+        validated = setup.await_count
+        pc, messages = await _resume(
+            f"/ws/guitar/resume/?resume={pc_hint['resume_token']}&last_seq=1", 2
+        )
+        assert messages["resumed"][0]["data"] == {"replayed": 0, "complete": True}
+        assert messages["connection_update"][0]["data"]["role"] == "pc"
+        assert setup.await_count == validated
+
+        await pc.send_to(
+            text_data=json.dumps({"type": "chord_change", "data": {"chord": "G"}})
+        )
+        # スマホが再接続する前に処理が終わるのを待つ
+        assert await pc.receive_nothing() is True
+
+        mobile, messages = await _resume(
+            f"/ws/guitar/resume/?resume={mobile_hint['resume_token']}&last_seq=1", 3
+        )
+        assert messages["chord_change"] == [
+            {"type": "chord_change", "data": {"chord": "G"}, "seq": 2}
+        ]
+        assert messages["resumed"][0]["data"] == {"replayed": 1, "complete": True}
+        assert messages["connection_update"][0]["data"]["role"] == "mobile"
+
+        await pc.disconnect()
+        await mobile.disconnect()
+
+    async def test_invalid_resume_token_falls_back_to_validation(
+        self, setup, join_room
+    ):
+        """不正な再開トークンでは通常どおりセッションを検証するテスト"""
+        communicator = await join_room("/ws/guitar/resume-bad/?resume=bogus")
+
+        assert setup.await_count == 1
+        assert await communicator.receive_nothing() is True
+
+        await communicator.disconnect()
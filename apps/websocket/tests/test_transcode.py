@@ -0,0 +1,167 @@
+"""
+Transcode Tests
+
+カメラフレームの縮小・再エンコードと配信品質の選択のテスト
+"""
+
+import io
+import json
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from unittest.mock import patch
+
+import pytest
+from channels.testing import WebsocketCommunicator
+from PIL import Image
+
+from apps.websocket.frames import HEADER_SIZE, FrameHeader, pack_frame, parse_header
+from apps.websocket.transcode import (
+    TIERS,
+    AdaptiveQuality,
+    FrameTranscoder,
+    set_frame_transcoder,
+    transcode_image,
+)
+from config.asgi import application
+
+
+def _jpeg(width=320, height=240):
+    output = io.BytesIO()
+    Image.new("RGB", (width, height), (200, 80, 40)).save(output, "JPEG", quality=90)
+    return output.getvalue()
+
+
+def _frame(seq=1):
+    return pack_frame(FrameHeader(seq=seq, width=320, height=240), _jpeg())
+
+
+class TestTranscodeImage:
+    """transcode_imageのテスト"""
+
+    def test_image_is_downscaled(self):
+        """画像が最大サイズに収まるよう縦横比を保って縮小されるテスト"""
+        payload, width, height = transcode_image(_jpeg(), 1, 160, 160, 40)
+
+        assert (width, height) == (160, 120)
+        with Image.open(io.BytesIO(payload)) as image:
+            assert image.format == "JPEG"
+            assert image.size == (160, 120)
+
+
+@pytest.mark.asyncio
+class TestFrameTranscoder:
+    """FrameTranscoderのテスト"""
+
+    async def test_frame_is_transcoded_in_process_pool(self):
+        """プロセスプールで縮小され、ヘッダーが更新されるテスト"""
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            transcoder = FrameTranscoder(executor=executor)
+            frame = await transcoder.transcode(_frame(seq=7), TIERS[2])
+
+        header = parse_header(frame)
+        assert (header.seq, header.width, header.height) == (7, 160, 120)
+        assert len(frame) < len(_frame())
+
+    async def test_busy_pool_returns_none(self):
+        """実行中の変換が上限に達している場合にNoneが返るテスト"""
+        transcoder = FrameTranscoder(max_pending=0, executor=ThreadPoolExecutor(1))
+
+        assert await transcoder.transcode(_frame(), TIERS[1]) is None
+
+    async def test_small_frame_is_not_transcoded(self):
+        """段階の最大サイズより小さいフレームはそのまま返るテスト"""
+        transcoder = FrameTranscoder(executor=ThreadPoolExecutor(1))
+        frame = pack_frame(FrameHeader(seq=1, width=100, height=75), _jpeg(100, 75))
+
+        assert await transcoder.transcode(frame, TIERS[2]) == frame
+
+
+class TestAdaptiveQuality:
+    """AdaptiveQualityのテスト"""
+
+    def _send(self, quality, seq, size=15000, sent_at=0.0):
+        header = FrameHeader(seq=seq, width=320, height=240)
+        with patch("apps.websocket.transcode.time.monotonic", return_value=sent_at):
+            quality.sent(header, size, quality.tier, original_size=15000)
+
+    def test_slow_receiver_gets_lower_tier(self):
+        """応答が遅い受信側の配信品質が下がるテスト"""
+        quality = AdaptiveQuality(fps=10)
+
+        # 往復の遅延（50ms）のみの応答
+        self._send(quality, 1)
+        quality.acked(1, now=0.05)
+        assert quality.tier.name == "original"
+
+        # 15KBの伝送に0.5秒かかる（30KB/s、10FPSには150KB/s必要）
+        self._send(quality, 2, sent_at=1.0)
+        quality.acked(2, now=1.55)
+
+        assert quality.tier.name != "original"
+        assert quality.expected_size(quality.tier) * 10 <= quality.throughput * 0.8
+
+    def test_quality_recovers_after_cooldown(self):
+        """スループットが回復すると1段階ずつ品質が上がるテスト"""
+        quality = AdaptiveQuality(fps=10, cooldown=2.0)
+        quality.index = 2
+        quality.changed_at = 0.0
+        quality.throughput = 10_000_000
+
+        self._send(quality, 1, size=4000, sent_at=0.5)
+        quality.acked(1, now=0.55)
+        assert quality.tier.name == "low"
+
+        self._send(quality, 2, size=4000, sent_at=3.0)
+        quality.acked(2, now=3.05)
+        assert quality.tier.name == "medium"
+
+
+class _LowQuality(AdaptiveQuality):
+    """最初から low の段階で配信する"""
+
+    def __init__(self, fps):
+        super().__init__(fps)
+        self.index = 2
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+class TestConsumerTranscode:
+    """GuitarConsumerのフレーム縮小のテスト"""
+
+    @pytest.fixture(autouse=True)
+    def transcoder(self, settings):
+        settings.GUITAR_WS_CAMERA_TRANSCODE = {"enabled": True}
+        set_frame_transcoder(FrameTranscoder(executor=ThreadPoolExecutor(1)))
+        with patch(
+            "apps.websocket.consumers.pairing_manager.avalidate_session",
+            return_value=True,
+        ):
+            yield
+        set_frame_transcoder(None)
+
+    async def test_frames_are_downscaled_for_receiver(self):
+        """受信側の配信品質の段階に縮小されたフレームが届くテスト"""
+        with patch("apps.websocket.consumers.AdaptiveQuality", _LowQuality):
+            pc = WebsocketCommunicator(application, "/ws/guitar/transcode/?role=pc")
+            await pc.connect()
+            await pc.receive_from()
+            mobile = WebsocketCommunicator(
+                application, "/ws/guitar/transcode/?role=mobile"
+            )
+            await mobile.connect()
+            await mobile.receive_from()
+            await pc.receive_from()
+
+        await pc.send_to(bytes_data=_frame(seq=3))
+        output = await mobile.receive_output()
+        header = parse_header(output["bytes"])
+        assert (header.seq, header.width, header.height) == (3, 160, 120)
+        assert output["bytes"][HEADER_SIZE : HEADER_SIZE + 2] == b"\xff\xd8"
+
+        await mobile.send_to(
+            text_data=json.dumps({"type": "frame_ack", "data": {"seq": 3}})
+        )
+        assert await mobile.receive_nothing() is True
+
+        await pc.disconnect()
+        await mobile.disconnect()
@@ -0,0 +1,329 @@
+"""
+カメラフレームの縮小・再エンコード
+
+受信側（スマホ）ごとに配信品質の段階（tier）を選び、バイナリカメラフレームを
+Pillowで縮小・再エンコードしてから送信する。通信状況の悪いスマホには
+小さいフレームを送り、配信全体が途切れないようにする。
+
+段階は受信側の実測スループットから選ぶ。クライアントは表示したフレームの
+連番を frame_ack で返し、サーバーは送信から応答までの時間とフレームサイズから
+スループットを推定する。frame_ack を送らないクライアントには元のフレームを
+そのまま送る。
+
+デコードとエンコードはプロセスプールで実行し、イベントループをブロックしない。
+
+設定例:
+    GUITAR_WS_CAMERA_TRANSCODE = {"enabled": True, "workers": 2, "max_pending": 8}
+"""
+
+import asyncio
+import io
+import logging
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from typing import Optional
+
+from django.conf import settings
+from PIL import Image
+
+from .frames import (
+    CODEC_JPEG,
+    CODEC_WEBP,
+    HEADER_SIZE,
+    FrameHeader,
+    pack_frame,
+    parse_header,
+)
+from .metrics import get_exporter, timed
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TRANSCODE = {"enabled": False, "workers": 2, "max_pending": 8}
+
+# コーデック識別子とPillowの保存形式
+PIL_FORMATS = {CODEC_JPEG: "JPEG", CODEC_WEBP: "WEBP"}
+
+
+@dataclass(frozen=True)
+class FrameTier:
+    """
+    配信品質の段階
+
+    Attributes:
+        name: 段階名（メトリクスのラベル）
+        max_width: 最大幅（0の場合は縮小せず元のフレームを送る）
+        max_height: 最大高さ
+        quality: 再エンコードの品質（1〜100）
+    """
+
+    name: str
+    max_width: int = 0
+    max_height: int = 0
+    quality: int = 0
+
+    @property
+    def is_original(self) -> bool:
+        return not self.max_width
+
+    def area(self, width: int, height: int) -> int:
+        """この段階で送られるフレームの画素数（目安）"""
+        if self.is_original:
+            return width * height
+        return min(width, self.max_width) * min(height, self.max_height)
+
+
+# 高品質から順に並べた配信品質の段階
+TIERS = (
+    FrameTier("original"),
+    FrameTier("medium", 240, 180, 50),
+    FrameTier("low", 160, 120, 40),
+    FrameTier("minimal", 112, 84, 30),
+)
+
+
+def transcode_image(
+    payload: bytes, codec: int, max_width: int, max_height: int, quality: int
+) -> tuple:
+    """
+    画像を縮小して再エンコードする（プロセスプールで実行される）
+
+    Returns:
+        (エンコード済みの画像データ, 幅, 高さ)
+    """
+    with Image.open(io.BytesIO(payload)) as image:
+        # JPEGはデコード時に縮小できるため、先に目標サイズを伝える
+        image.draft("RGB", (max_width, max_height))
+        image = image.convert("RGB")
+        image.thumbnail((max_width, max_height))
+
+        output = io.BytesIO()
+        image.save(output, PIL_FORMATS[codec], quality=quality)
+        return output.getvalue(), image.width, image.height
+
+
+class FrameTranscoder:
+    """
+    プロセスプールでカメラフレームを再エンコードする
+
+    プールが処理しきれない場合（実行中の件数が max_pending 以上）は
+    再エンコードせずに None を返し、呼び出し側はそのフレームを破棄する。
+    """
+
+    def __init__(self, workers: int = 2, max_pending: int = 8, executor=None):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = executor
+        self._pending = 0
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    async def transcode(self, frame: bytes, tier: FrameTier) -> Optional[bytes]:
+        """
+        バイナリカメラフレームを指定した段階に縮小する
+
+        Returns:
+            縮小したフレーム。プールが混雑している場合はNone
+
+        Raises:
+            FrameHeaderError: ヘッダーが不正な場合
+        """
+        header = parse_header(frame)
+        if header.codec not in PIL_FORMATS:
+            return frame
+        if header.width <= tier.max_width and header.height <= tier.max_height:
+            return frame
+        if self._pending >= self.max_pending:
+            return None
+
+        loop = asyncio.get_running_loop()
+        self._pending += 1
+        try:
+            with timed("ws_transcode_duration_seconds", tier=tier.name):
+                payload, width, height = await loop.run_in_executor(
+                    self.executor,
+                    transcode_image,
+                    frame[HEADER_SIZE:],
+                    header.codec,
+                    tier.max_width,
+                    tier.max_height,
+                    tier.quality,
+                )
+        except BrokenProcessPool:
+            # ワーカープロセスが異常終了した場合は次回プールを作り直す
+            logger.error("フレーム変換プールが停止しました", exc_info=True)
+            self._executor = None
+            raise
+        finally:
+            self._pending -= 1
+
+        get_exporter().increment("ws_camera_frames_transcoded_total", tier=tier.name)
+        return pack_frame(
+            FrameHeader(
+                seq=header.seq,
+                width=width,
+                height=height,
+                codec=header.codec,
+                version=header.version,
+            ),
+            payload,
+        )
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+class AdaptiveQuality:
+    """
+    受信側の実測スループットから配信品質の段階を選ぶ
+
+    送信したフレームの連番・サイズ・時刻を記録し、frame_ack を受けたら
+    応答までの時間から伝送にかかった時間を推定してスループットを求める。
+    応答時間のうち直近の最小値は往復の遅延とみなして差し引く。
+
+    段階は、その段階のフレームサイズ × フレームレートがスループットの
+    headroom 倍に収まる最も高品質なものにする。品質を上げるのは1段階ずつ、
+    cooldown 秒以上あけて、余裕がある場合のみとする（品質が上下し続けないように）。
+    """
+
+    # 往復の遅延とみなす最小応答時間を取る標本数
+    RTT_WINDOW = 30
+
+    # 応答を待つフレーム数の上限（古いものから破棄する）
+    MAX_INFLIGHT = 16
+
+    def __init__(
+        self,
+        fps: float,
+        tiers=TIERS,
+        alpha: float = 0.3,
+        headroom: float = 0.8,
+        cooldown: float = 2.0,
+    ):
+        self.fps = fps
+        self.tiers = tiers
+        self.alpha = alpha
+        self.headroom = headroom
+        self.cooldown = cooldown
+
+        self.index = 0
+        self.throughput = None
+        self.changed_at = 0.0
+
+        self._inflight = {}
+        self._elapsed = deque(maxlen=self.RTT_WINDOW)
+        self._sizes = {}
+        self._source = None
+
+    @property
+    def tier(self) -> FrameTier:
+        """現在の配信品質の段階"""
+        return self.tiers[self.index]
+
+    def sent(self, header: FrameHeader, size: int, tier: FrameTier, original_size: int):
+        """
+        送信したフレームを記録する
+
+        Args:
+            header: 元のフレームのヘッダー
+            size: 送信したフレームのサイズ
+            tier: 送信した段階
+            original_size: 元のフレームのサイズ
+        """
+        self._source = (header.width, header.height, original_size)
+        previous = self._sizes.get(tier.name)
+        self._sizes[tier.name] = (
+            size if previous is None else previous + self.alpha * (size - previous)
+        )
+
+        self._inflight[header.seq] = (size, time.monotonic())
+        while len(self._inflight) > self.MAX_INFLIGHT:
+            del self._inflight[next(iter(self._inflight))]
+
+    def acked(self, seq: int, now: Optional[float] = None):
+        """frame_ack を受けてスループットを更新し、段階を選び直す"""
+        entry = self._inflight.pop(seq, None)
+        if entry is None:
+            return
+        size, sent_at = entry
+        now = time.monotonic() if now is None else now
+
+        elapsed = max(now - sent_at, 0.0)
+        self._elapsed.append(elapsed)
+        transfer = max(elapsed - min(self._elapsed), 0.001)
+        sample = size / transfer
+        if self.throughput is None or sample < self.throughput:
+            # 低下はすぐに反映し、回復は平滑化して反映する
+            self.throughput = sample
+        else:
+            self.throughput += self.alpha * (sample - self.throughput)
+
+        self._select(now)
+
+    def expected_size(self, tier: FrameTier) -> float:
+        """段階ごとのフレームサイズの見込み（実測がない場合は画素数の比で推定）"""
+        size = self._sizes.get(tier.name)
+        if size is not None or self._source is None:
+            return size or 0.0
+        width, height, original_size = self._source
+        return original_size * tier.area(width, height) / max(width * height, 1)
+
+    def _fits(self, tier, margin=1.0):
+        required = self.expected_size(tier) * self.fps * margin
+        return required <= self.throughput * self.headroom
+
+    def _select(self, now):
+        # 収まる段階まで下げる（最低品質の段階は常に選べる）
+        index = self.index
+        while index < len(self.tiers) - 1 and not self._fits(self.tiers[index]):
+            index += 1
+
+        # 余裕があれば1段階だけ上げる
+        if (
+            index == self.index
+            and index > 0
+            and now - self.changed_at >= self.cooldown
+            and self._fits(self.tiers[index - 1], margin=1.25)
+        ):
+            index -= 1
+
+        if index != self.index:
+            logger.debug(
+                f"配信品質変更: {self.tier.name} -> {self.tiers[index].name}, "
+                f"throughput={self.throughput:.0f}B/s"
+            )
+            self.index = index
+            self.changed_at = now
+
+
+_transcoder = None
+
+
+def get_frame_transcoder() -> Optional[FrameTranscoder]:
+    """設定（GUITAR_WS_CAMERA_TRANSCODE）に従ってフレーム変換を返す（無効の場合はNone）"""
+    global _transcoder
+    config = {
+        **DEFAULT_TRANSCODE,
+        **getattr(settings, "GUITAR_WS_CAMERA_TRANSCODE", {}),
+    }
+    if not config["enabled"]:
+        return None
+    if _transcoder is None:
+        _transcoder = FrameTranscoder(
+            workers=config["workers"], max_pending=config["max_pending"]
+        )
+    return _transcoder
+
+
+def set_frame_transcoder(transcoder: Optional[FrameTranscoder]):
+    """フレーム変換を差し替える（Noneで設定から再作成）"""
+    global _transcoder
+    _transcoder = transcoder
@@ -0,0 +1,16 @@
+"""
+WebSocketアプリのURL設定
+
+WebSocket接続自体は routing.py で定義する
+"""
+
+from django.urls import path
+
+from . import views
+
+app_name = "websocket"
+
+urlpatterns = [
+    # メトリクス（Prometheusのテキスト形式）
+    path("metrics/", views.metrics, name="metrics"),
+]
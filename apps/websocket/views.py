@@ -0,0 +1,53 @@
+"""
+WebSocketアプリのビュー
+
+メトリクスのエンドポイントを提供する
+"""
+
+import hmac
+
+from django.conf import settings
+from django.http import Http404, HttpRequest, HttpResponse
+
+from .metrics import get_exporter
+
+
+def _can_read_metrics(request: HttpRequest) -> bool:
+    """
+    メトリクスの取得が許可されているかを返す
+
+    GUITAR_WS_METRICS_TOKEN が設定されている場合は
+    ``Authorization: Bearer <トークン>`` のリクエストを、それ以外は
+    スタッフユーザーのみを許可する。
+    """
+    token = getattr(settings, "GUITAR_WS_METRICS_TOKEN", "")
+    if token:
+        authorization = request.headers.get("Authorization", "")
+        if hmac.compare_digest(authorization.encode(), f"Bearer {token}".encode()):
+            return True
+    return request.user.is_authenticated and request.user.is_staff
+
+
+def metrics(request: HttpRequest) -> HttpResponse:
+    """
+    WebSocketのメトリクスをPrometheusのテキスト形式で返す
+
+    Returns:
+        HttpResponse: テキスト形式のメトリクス
+
+    Raises:
+        Http404: エンドポイントが無効（GUITAR_WS_METRICS_ENABLED）、取得が
+            許可されていない、またはエクスポーターがテキスト形式の出力に
+            対応していない場合
+    """
+    enabled = getattr(settings, "GUITAR_WS_METRICS_ENABLED", False)
+    if not enabled or not _can_read_metrics(request):
+        raise Http404("Metrics endpoint is not enabled")
+
+    exporter = get_exporter()
+    if not hasattr(exporter, "render"):
+        raise Http404("Metrics endpoint is not enabled")
+
+    return HttpResponse(
+        exporter.render(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
@@ -0,0 +1,161 @@
+"""
+データベース書き込みのキュー
+
+コンシューマーからのデータベース書き込み（練習セッションの保存など）を
+上限付きのキューに入れ、ワーカーが短い時間窓でまとめて1回のスレッド呼び出しで
+実行する。書き込み中もイベントループはブロックされない。
+
+キューが満杯の場合は WriteQueueFull を送出し、呼び出し側でエラーを返す。
+
+設定例:
+    GUITAR_WS_WRITE_QUEUE = {"maxsize": 256, "max_batch": 32, "window": 0.01}
+"""
+
+import asyncio
+import logging
+import weakref
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+
+from .metrics import get_exporter
+
+logger = logging.getLogger(__name__)
+
+# キューに入れられる書き込み数の上限（デフォルト）
+DEFAULT_MAXSIZE = 256
+
+# 1回のスレッド呼び出しで実行する書き込み数の上限（デフォルト）
+DEFAULT_MAX_BATCH = 32
+
+# 後続の書き込みを待つ時間窓（秒、デフォルト）
+DEFAULT_WINDOW = 0.01
+
+
+class WriteQueueFull(Exception):
+    """書き込みキューが満杯の場合の例外"""
+
+
+def _execute(batch):
+    """
+    書き込みを順に実行する（ワーカースレッドで呼ばれる）
+
+    Returns:
+        [(成功した場合はTrue, 戻り値または例外), ...]
+    """
+    results = []
+    for func, args, kwargs, _ in batch:
+        try:
+            results.append((True, func(*args, **kwargs)))
+        except Exception as e:
+            logger.error("書き込みキューの実行エラー", exc_info=True)
+            results.append((False, e))
+    return results
+
+
+class WriteQueue:
+    """
+    上限付きの非同期書き込みキュー
+
+    書き込みは投入された順に実行される。同じ接続からの書き込み（練習の開始と
+    終了など）の順序は保たれる。
+    """
+
+    def __init__(
+        self,
+        maxsize: int = DEFAULT_MAXSIZE,
+        max_batch: int = DEFAULT_MAX_BATCH,
+        window: float = DEFAULT_WINDOW,
+    ):
+        self.max_batch = max_batch
+        self.window = window
+        self._queue = asyncio.Queue(maxsize)
+        self._worker = None
+
+    @property
+    def pending(self) -> int:
+        """未実行の書き込み数"""
+        return self._queue.qsize()
+
+    def submit(self, func, *args, **kwargs) -> asyncio.Future:
+        """
+        書き込みをキューに入れる
+
+        Args:
+            func: ワーカースレッドで実行する同期関数
+            *args, **kwargs: func に渡す引数
+
+        Returns:
+            func の戻り値（または例外）が設定される Future
+
+        Raises:
+            WriteQueueFull: キューが満杯の場合
+        """
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((func, args, kwargs, future))
+        except asyncio.QueueFull:
+            get_exporter().increment("ws_writes_rejected_total")
+            raise WriteQueueFull()
+
+        get_exporter().observe(
+            "ws_outbound_queue_depth", self._queue.qsize(), queue="write"
+        )
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.ensure_future(self._run())
+        return future
+
+    async def join(self):
+        """キューに入っている書き込みがすべて終わるまで待つ"""
+        await self._queue.join()
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            try:
+                results = await database_sync_to_async(_execute)(batch)
+            except Exception as e:
+                results = [(False, e)] * len(batch)
+
+            get_exporter().observe("ws_write_batch_size", len(batch))
+            for (_, _, _, future), (ok, value) in zip(batch, results):
+                if not future.done():
+                    if ok:
+                        future.set_result(value)
+                    else:
+                        future.set_exception(value)
+                self._queue.task_done()
+
+    async def _collect(self):
+        """最初の書き込みから時間窓の間に届いたものをまとめて取り出す"""
+        batch = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.window
+
+        while len(batch) < self.max_batch:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+
+# イベントループごとの書き込みキュー
+_queues = weakref.WeakKeyDictionary()
+
+
+def get_write_queue() -> WriteQueue:
+    """実行中のイベントループ用の書き込みキューを返す（GUITAR_WS_WRITE_QUEUE）"""
+    loop = asyncio.get_running_loop()
+    queue = _queues.get(loop)
+    if queue is None:
+        queue = _queues[loop] = WriteQueue(
+            **getattr(settings, "GUITAR_WS_WRITE_QUEUE", {})
+        )
+    return queue
@@ -16,7 +16,8 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
 django.setup()
 
 # ルーティングをインポート（Django初期化後に）
-from apps.websocket.routing import websocket_urlpatterns
+from apps.websocket.routing import websocket_urlpatterns  # noqa: E402
+from apps.websocket.drain import drain_coordinator  # noqa: E402
 
 django_asgi_app = get_asgi_application()
 
@@ -26,3 +27,6 @@ application = ProtocolTypeRouter(
         "websocket": AuthMiddlewareStack(URLRouter(websocket_urlpatterns)),
     }
 )
+
+# SIGUSR1 でワーカーのドレインを開始する（入れ替え前に送信する）
+drain_coordinator.install_signal_handler()
@@ -160,6 +160,13 @@ else:
 
 REDIS_URL = get_env_var("REDIS_URL", default="redis://localhost:6379/0")
 
+# チャネルレイヤーのRedisシャード（カンマ区切り、未設定の場合は REDIS_URL のみ）
+CHANNEL_LAYER_SHARDS = get_env_var(
+    "CHANNEL_LAYER_SHARDS",
+    default="",
+    cast=lambda value: [url.strip() for url in value.split(",") if url.strip()],
+) or [REDIS_URL]
+
 CACHES = {
     "default": {
         "BACKEND": "django_redis.cache.RedisCache",
@@ -173,6 +180,12 @@ CACHES = {
 }
 
 
+# 検証済みペアリングセッションのキャッシュ有効期限（秒、0で無効）
+PAIRING_SESSION_CACHE_TTL = get_env_var(
+    "PAIRING_SESSION_CACHE_TTL", default=10, cast=int
+)
+
+
 # =====================================================
 # 認証設定
 # =====================================================
@@ -245,15 +258,127 @@ if "pytest" in sys.modules or any(arg in sys.argv for arg in ["test", "pytest"])
             "BACKEND": "channels.layers.InMemoryChannelLayer",
         },
     }
+    GUITAR_WS_PRESENCE = {"BACKEND": "apps.websocket.presence.InMemoryPresence"}
+    GUITAR_WS_REPLAY = {"BACKEND": "apps.websocket.replay.InMemoryReplayBuffer"}
+    GUITAR_WS_GAME_STATE = {
+        "BACKEND": "apps.websocket.gamestate.InMemoryGameStateStore"
+    }
+    MOBILE_STATE_STORE = {"BACKEND": "apps.mobile.state.InMemorySessionStateStore"}
 else:
+    # 同一ワーカー内の送信先にはメモリ上で配送し、それ以外はRedisを経由する
+    # ルームはコンシステントハッシュで CHANNEL_LAYER_SHARDS のRedisに振り分ける
     CHANNEL_LAYERS = {
         "default": {
-            "BACKEND": "channels_redis.core.RedisChannelLayer",
+            "BACKEND": "apps.websocket.layers.ShardedChannelLayer",
             "CONFIG": {
-                "hosts": [REDIS_URL],
+                "hosts": CHANNEL_LAYER_SHARDS,
             },
         },
     }
+    GUITAR_WS_PRESENCE = {
+        "BACKEND": "apps.websocket.presence.RedisPresence",
+        "OPTIONS": {"ttl": 60, "stale_after": 45},
+    }
+    GUITAR_WS_REPLAY = {
+        "BACKEND": "apps.websocket.replay.RedisReplayBuffer",
+        "OPTIONS": {"size": 64, "ttl": 120},
+    }
+    GUITAR_WS_GAME_STATE = {
+        "BACKEND": "apps.websocket.gamestate.RedisGameStateStore",
+        "OPTIONS": {"ttl": 3600},
+    }
+    # HTTPポーリング（mobile_poll / mobile_command）の状態（ワーカー間で共有）
+    MOBILE_STATE_STORE = {"BACKEND": "apps.mobile.state.RedisSessionStateStore"}
+
+
+# mobile_poll のロングポーリングで状態の変更を待つ最大時間（秒）
+# リバースプロキシの読み取りタイムアウトより短くする
+MOBILE_POLL_MAX_WAIT = get_env_var("MOBILE_POLL_MAX_WAIT", default=25.0, cast=float)
+
+# mobile_stream（SSE）で変更がない場合にハートビートのコメントを送る間隔（秒）
+MOBILE_SSE_HEARTBEAT = get_env_var("MOBILE_SSE_HEARTBEAT", default=15.0, cast=float)
+
+# HTTPポーリングのスマートフォン用にカメラフレームを保存する最大FPS（ルーム単位、0で無制限）
+# フレームを取得しているスマートフォンがいるセッションだけ保存する
+MOBILE_CAMERA_FRAME_MAX_FPS = get_env_var(
+    "MOBILE_CAMERA_FRAME_MAX_FPS", default=5, cast=int
+)
+
+# カメラフレーム転送の最大FPS（ルーム単位、0で無制限）
+GUITAR_WS_CAMERA_MAX_FPS = get_env_var("GUITAR_WS_CAMERA_MAX_FPS", default=10, cast=int)
+
+# game_update / judgement のバッチ送信の時間窓（ミリ秒、?batch=1 の接続のみ）
+GUITAR_WS_BATCH_WINDOW_MS = get_env_var(
+    "GUITAR_WS_BATCH_WINDOW_MS", default=15, cast=int
+)
+
+# 1つのルームに接続できるデバイス数（PCとスマホ）
+GUITAR_WS_ROOM_CAPACITY = get_env_var("GUITAR_WS_ROOM_CAPACITY", default=2, cast=int)
+
+# ワーカーのドレイン（切断を分散させる期間（秒）、再接続の待ち時間の上限（ミリ秒））
+GUITAR_WS_DRAIN_WINDOW = get_env_var("GUITAR_WS_DRAIN_WINDOW", default=5.0, cast=float)
+GUITAR_WS_RECONNECT_JITTER_MS = get_env_var(
+    "GUITAR_WS_RECONNECT_JITTER_MS", default=2000, cast=int
+)
+
+# 再開トークンの有効期限（秒）
+GUITAR_WS_RESUME_MAX_AGE = get_env_var(
+    "GUITAR_WS_RESUME_MAX_AGE", default=120, cast=int
+)
+
+# サーバーからのハートビート（送信間隔（秒、0で無効）、応答がない接続を切断するまでの時間（秒））
+GUITAR_WS_HEARTBEAT_INTERVAL = get_env_var(
+    "GUITAR_WS_HEARTBEAT_INTERVAL", default=20.0, cast=float
+)
+GUITAR_WS_HEARTBEAT_TIMEOUT = get_env_var(
+    "GUITAR_WS_HEARTBEAT_TIMEOUT", default=60.0, cast=float
+)
+
+# カメラフレームを受信側のスループットに合わせて縮小する（Pillow、プロセスプールで実行）
+GUITAR_WS_CAMERA_TRANSCODE = {
+    "enabled": get_env_var("GUITAR_WS_CAMERA_TRANSCODE", default=False, cast=bool),
+    "workers": get_env_var("GUITAR_WS_CAMERA_TRANSCODE_WORKERS", default=2, cast=int),
+    "max_pending": 8,
+}
+
+# WebSocketからのデータベース書き込みキュー（上限、1回にまとめる件数、時間窓（秒））
+GUITAR_WS_WRITE_QUEUE = {"maxsize": 256, "max_batch": 32, "window": 0.01}
+
+# WebSocketメッセージのレート制限（トークンバケット、apps/websocket/ratelimit.py）
+# rate / burst: 接続あたり、room_rate / room_burst: ルームあたり（ワーカー内）
+# 未設定のタイプは登録表の rate_limit（camera_frame は GUITAR_WS_CAMERA_MAX_FPS）を使う
+GUITAR_WS_RATE_LIMITS = {
+    "game_update": {
+        "rate": 60,
+        "burst": 120,
+        "room_rate": 120,
+        "room_burst": 240,
+        "overflow": "coalesce",
+    },
+    "judgement": {"rate": 60, "burst": 120, "room_rate": 120, "room_burst": 240},
+    "chord_change": {"rate": 30, "burst": 60, "room_rate": 60, "room_burst": 120},
+    "game_mode": {"rate": 5, "burst": 10},
+    "practice_start": {"rate": 2, "burst": 5},
+    "practice_end": {"rate": 2, "burst": 5},
+}
+
+# WebSocketメトリクスのエクスポーター（apps/websocket/metrics.py）
+# Prometheus形式は /websocket/metrics/ で公開される
+GUITAR_WS_METRICS_EXPORTER = {
+    "BACKEND": get_env_var(
+        "GUITAR_WS_METRICS_BACKEND",
+        default="apps.websocket.metrics.PrometheusExporter",
+    ),
+    "OPTIONS": {},
+}
+
+# Prometheus形式の /websocket/metrics/ を公開するか（無効の場合は404）
+GUITAR_WS_METRICS_ENABLED = get_env_var(
+    "GUITAR_WS_METRICS_ENABLED", default=False, cast=bool
+)
+# スクレイプ用のトークン（Authorization: Bearer <トークン>）。
+# 未設定の場合はスタッフユーザーのみ取得できる
+GUITAR_WS_METRICS_TOKEN = get_env_var("GUITAR_WS_METRICS_TOKEN", default="")
 
 
 # =====================================================
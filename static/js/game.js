@@ -59,6 +59,10 @@ class RhythmGame {
         this.sessionId = null;
         this.currentChord = null;
 
+        // 時刻同期（サーバーとのRTTと時計のずれ、ミリ秒）
+        this.clockSync = null;
+        this.relayLatencyMs = 0;
+
         // カメラジェスチャー連携
         this.cameraEnabled = false;
 
@@ -116,6 +120,7 @@ class RhythmGame {
         this.ws.onopen = () => {
             console.log('WebSocket接続確立 (ゲームモード)');
             this.sendGameMode('game');
+            this.requestClockSync();
         };
 
         this.ws.onmessage = (event) => {
@@ -139,6 +144,7 @@ class RhythmGame {
     handleWebSocketMessage(data) {
         switch (data.type) {
             case 'chord_change':
+                this.relayLatencyMs = this.estimateRelayLatency(data.clock);
                 this.currentChord = data.data.chord;
                 this.showCurrentChord(this.currentChord);
                 break;
@@ -164,11 +170,57 @@ class RhythmGame {
                 this.togglePause();
                 break;
 
+            case 'clock_probe':
+                this.replyClockProbe(data.data);
+                break;
+
+            case 'clock_sync':
+                this.clockSync = data.data;
+                break;
+
             default:
                 console.log('不明なメッセージタイプ:', data.type);
         }
     }
 
+    /**
+     * サーバーに時刻同期を要求する
+     * @param {number} samples - プローブ数
+     */
+    requestClockSync(samples = 5) {
+        if (this.ws && this.ws.readyState === WebSocket.OPEN) {
+            this.ws.send(JSON.stringify({
+                type: 'clock_sync',
+                data: { samples: samples }
+            }));
+        }
+    }
+
+    /**
+     * 時刻同期のプローブに受信時刻と送信時刻を付けて応答する
+     * @param {Object} probe - プローブ（id, t0）
+     */
+    replyClockProbe(probe) {
+        const receivedAt = Date.now();
+        if (this.ws && this.ws.readyState === WebSocket.OPEN) {
+            this.ws.send(JSON.stringify({
+                type: 'clock_probe',
+                data: { id: probe.id, t1: receivedAt, t2: Date.now() }
+            }));
+        }
+    }
+
+    /**
+     * 送信者から自分までの片道の遅延を推定する
+     * @param {Object} senderClock - 送信者の推定値（rtt, offset）
+     * @returns {number} 推定遅延（ミリ秒）
+     */
+    estimateRelayLatency(senderClock) {
+        const senderRtt = senderClock ? senderClock.rtt : 0;
+        const ownRtt = this.clockSync ? this.clockSync.rtt : 0;
+        return (senderRtt + ownRtt) / 2;
+    }
+
     /**
      * ゲームモードを送信する
      * @param {string} mode - ゲームモード
@@ -188,15 +240,28 @@ class RhythmGame {
      */
     sendGameState() {
         if (this.ws && this.ws.readyState === WebSocket.OPEN) {
+            const state = {
+                score: this.score,
+                combo: this.combo,
+                maxCombo: this.maxCombo,
+                stats: Object.assign({}, this.stats)
+            };
+
+            // 前回送信した状態から変化した項目だけを差分として送る
+            const delta = {};
+            Object.keys(state).forEach((key) => {
+                if (JSON.stringify(state[key]) !== JSON.stringify((this.sentGameState || {})[key])) {
+                    delta[key] = state[key];
+                }
+            });
+            if (Object.keys(delta).length === 0) {
+                return;
+            }
+
+            this.sentGameState = state;
             this.ws.send(JSON.stringify({
                 type: 'game_update',
-                data: {
-                    score: this.score,
-                    combo: this.combo,
-                    maxCombo: this.maxCombo,
-                    stats: this.stats,
-                    timestamp: Date.now()
-                }
+                data: delta
             }));
         }
     }
@@ -209,8 +274,9 @@ class RhythmGame {
         if (!this.isPlaying || this.isPaused) return;
 
         // カメラが有効な場合、現在のコードでヒット判定
+        // （コードはスマホから中継されるため、その遅延の分だけ判定時刻を戻す）
         if (this.cameraEnabled && this.currentChord) {
-            this.handleInput(this.currentChord);
+            this.handleInput(this.currentChord, this.relayLatencyMs);
         }
     }
 
@@ -426,11 +492,12 @@ class RhythmGame {
     /**
      * 入力を処理する
      * @param {string} chord - 入力されたコード
+     * @param {number} latencyMs - 入力が届くまでの遅延（ミリ秒、リモート入力の補正用）
      */
-    handleInput(chord) {
+    handleInput(chord, latencyMs = 0) {
         if (!this.isPlaying || this.isPaused) return;
 
-        const gameTime = (Date.now() - this.startTime) / 1000;
+        const gameTime = (Date.now() - latencyMs - this.startTime) / 1000;
 
         // 判定ライン付近のノートを探す
         const targetNote = this.notes.find(note => {
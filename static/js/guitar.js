@@ -1236,6 +1236,38 @@
     `;
     document.head.appendChild(style);
 
+    // タブごとのクライアントIDを保存する sessionStorage のキー
+    const CLIENT_ID_KEY = 'guitarClientId';
+
+    /**
+     * タブごとのクライアントIDを返す（なければ作成して sessionStorage に保存する）
+     *
+     * 接続のたびに送ることで、切断されずに残った同じタブの古い接続を
+     * サーバーが置き換えられるようにする。
+     * @returns {string} クライアントID
+     */
+    function loadClientId() {
+        let clientId = null;
+        try {
+            clientId = window.sessionStorage.getItem(CLIENT_ID_KEY);
+        } catch (error) {
+            // sessionStorage が使えない場合はページ内でのみ保持する
+        }
+        if (clientId) {
+            return clientId;
+        }
+
+        const bytes = new Uint8Array(16);
+        window.crypto.getRandomValues(bytes);
+        clientId = Array.from(bytes, (b) => b.toString(16).padStart(2, '0')).join('');
+        try {
+            window.sessionStorage.setItem(CLIENT_ID_KEY, clientId);
+        } catch (error) {
+            // 保存できない場合も、このページの接続では同じIDを使う
+        }
+        return clientId;
+    }
+
     /**
      * WebSocket通信管理（PC側）
      * モバイルコントローラーとのリアルタイム通信
@@ -1245,6 +1277,12 @@
         sessionId: null,
         isConnected: false,
         cameraFrameInterval: null,
+        cameraFrameSeq: 0,
+        peerIdle: false,
+        lastSeq: 0,
+        resumeToken: null,
+        resumeDelayMs: null,
+        clientId: null,
 
         /**
          * WebSocket接続を初期化
@@ -1260,10 +1298,17 @@
 
             try {
                 const wsProtocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
-                const wsUrl = `${wsProtocol}//${window.location.host}/ws/guitar/${sessionId}/`;
+                let wsUrl = `${wsProtocol}//${window.location.host}/ws/guitar/${sessionId}/?role=pc`;
+                this.clientId = this.clientId || loadClientId();
+                wsUrl += `&client_id=${encodeURIComponent(this.clientId)}`;
+                if (this.resumeToken) {
+                    wsUrl += `&resume=${encodeURIComponent(this.resumeToken)}&last_seq=${this.lastSeq}`;
+                    this.resumeToken = null;
+                }
 
                 console.log('Connecting to WebSocket:', wsUrl);
                 this.ws = new WebSocket(wsUrl);
+                this.ws.binaryType = 'arraybuffer';
 
                 this.ws.onopen = () => {
                     console.log('PC WebSocket接続確立');
@@ -1283,6 +1328,13 @@
                     console.log('WebSocket接続終了');
                     this.isConnected = false;
                     this.stopCameraFrameBroadcast();
+
+                    // サーバーのドレインによる切断は再開トークンで再接続する
+                    if (this.resumeDelayMs !== null) {
+                        const delay = this.resumeDelayMs;
+                        this.resumeDelayMs = null;
+                        setTimeout(() => this.connect(this.sessionId), delay);
+                    }
                 };
 
             } catch (error) {
@@ -1298,9 +1350,31 @@
             try {
                 const message = JSON.parse(data);
 
+                if (typeof message.seq === 'number') {
+                    this.lastSeq = Math.max(this.lastSeq, message.seq);
+                }
+
                 switch (message.type) {
                     case 'connection_update':
                         console.log('接続状態更新:', message.data);
+                        if (message.data && message.data.role === 'mobile') {
+                            this.peerIdle = false;
+                        }
+                        break;
+                    case 'heartbeat':
+                        // 応答しない接続はサーバーに切断される
+                        this.ws.send(JSON.stringify({ type: 'heartbeat' }));
+                        break;
+                    case 'idle':
+                        // モバイルがバックグラウンドの間はカメラフレームを送らない
+                        this.peerIdle = message.data.idle;
+                        break;
+                    case 'reconnect':
+                        this.resumeToken = message.data.resume_token;
+                        this.resumeDelayMs = message.data.retry_after_ms || 0;
+                        break;
+                    case 'resumed':
+                        console.log('再接続完了:', message.data);
                         break;
                     case 'chord_change':
                         // モバイルからのコード変更を受信
@@ -1358,7 +1432,7 @@
          * カメラフレームを送信
          */
         sendCameraFrame() {
-            if (!this.isConnected || !this.ws) return;
+            if (!this.isConnected || !this.ws || this.peerIdle) return;
 
             const videoElement = document.getElementById('camera-video');
             if (!videoElement || !videoElement.srcObject) return;
@@ -1376,7 +1450,18 @@
             // ビデオフレームを描画
             ctx.drawImage(videoElement, 0, 0, width, height);
 
-            // JPEG品質0.6でエンコード
+            // バイナリフレームに対応している場合はbase64を介さずに送信
+            if (canvas.toBlob && window.ArrayBuffer) {
+                canvas.toBlob((blob) => {
+                    if (!blob || !this.ws || this.ws.readyState !== WebSocket.OPEN) return;
+                    blob.arrayBuffer().then((jpeg) => {
+                        this.ws.send(this.buildBinaryFrame(jpeg, width, height));
+                    });
+                }, 'image/jpeg', 0.6);
+                return;
+            }
+
+            // フォールバック: JPEG品質0.6でエンコードしてJSONで送信
             const dataUrl = canvas.toDataURL('image/jpeg', 0.6);
 
             // base64部分を抽出
@@ -1393,6 +1478,28 @@
             }));
         },
 
+        /**
+         * バイナリカメラフレームを組み立てる
+         * ヘッダー: version(1B) codec(1B) seq(4B) width(2B) height(2B)、ビッグエンディアン
+         * @param {ArrayBuffer} jpeg - JPEGデータ
+         * @param {number} width - 幅
+         * @param {number} height - 高さ
+         * @returns {ArrayBuffer} 送信用フレーム
+         */
+        buildBinaryFrame(jpeg, width, height) {
+            const headerSize = 10;
+            const frame = new Uint8Array(headerSize + jpeg.byteLength);
+            const view = new DataView(frame.buffer);
+            view.setUint8(0, 1);  // version
+            view.setUint8(1, 1);  // codec: JPEG
+            view.setUint32(2, this.cameraFrameSeq);
+            view.setUint16(6, width);
+            view.setUint16(8, height);
+            frame.set(new Uint8Array(jpeg), headerSize);
+            this.cameraFrameSeq = (this.cameraFrameSeq + 1) >>> 0;
+            return frame.buffer;
+        },
+
         /**
          * WebSocket接続を切断
          */
@@ -104,9 +104,15 @@
             this.isConnected = false;
             this.sessionId = null;
 
-            // ポーリング
-            this.pollingInterval = null;
-            this.pollingRate = 1000; // 1秒ごとにポーリング
+            // ポーリング（ロングポーリング、状態が変わるまでサーバーが応答を保留する）
+            this.pollingTimeout = null;
+            this.pollingWait = 25; // サーバーで待つ最大秒数
+            this.pollingRetryDelay = 1000; // エラー時に再試行するまでの時間（ミリ秒）
+            this.pollingController = null;
+            this.stateVersion = null;
+
+            // Server-Sent Events（対応ブラウザではポーリングの代わりに使う）
+            this.eventSource = null;
 
             // 練習セッション
             this.isPracticing = false;
@@ -114,8 +120,12 @@
             this.timerInterval = null;
             this.currentChord = null;
 
-            // カメラ
+            // カメラ（一定間隔で最新のフレームを取得する）
             this.cameraContext = null;
+            this.cameraFrameId = null;
+            this.cameraInterval = null;
+            this.cameraRefreshMs = 200;
+            this.cameraLoading = false;
 
             // 初期化
             this.initialize();
@@ -294,62 +304,168 @@
          * ポーリングを開始
          */
         startPolling() {
-            if (this.pollingInterval) {
-                clearInterval(this.pollingInterval);
+            this.stopPolling();
+            this.stateVersion = null;
+            this.cameraInterval = setInterval(() => this.loadCameraFrame(), this.cameraRefreshMs);
+
+            if (window.EventSource) {
+                this.startStream();
+            } else {
+                this.poll();
             }
+        }
+
+        /**
+         * Server-Sent Eventsで状態の変更を受信
+         *
+         * 切断時はブラウザが Last-Event-ID を付けて自動で再接続する。
+         * 接続できない場合（プロキシが対応していないなど）はロングポーリングに切り替える。
+         */
+        startStream() {
+            const url = `/mobile/api/stream/?session_id=${encodeURIComponent(this.sessionId)}`;
+            const source = new EventSource(url);
+            this.eventSource = source;
+
+            source.addEventListener('state', (event) => {
+                this.applyState(JSON.parse(event.data));
+                this.updateActivity(true);
+            });
 
-            // 即座に1回実行
-            this.poll();
+            source.addEventListener('expired', () => {
+                this.stopPolling();
+                this.updateActivity(false);
+                this.showMessage('セッションの有効期限が切れました', 'error');
+            });
 
-            // 定期的にポーリング
-            this.pollingInterval = setInterval(() => {
-                this.poll();
-            }, this.pollingRate);
+            source.onerror = () => {
+                this.updateActivity(false);
+                if (source.readyState === EventSource.CLOSED && this.eventSource === source) {
+                    this.eventSource = null;
+                    this.poll();
+                }
+            };
+        }
+
+        /**
+         * ポーリングを停止
+         */
+        stopPolling() {
+            if (this.cameraInterval) {
+                clearInterval(this.cameraInterval);
+                this.cameraInterval = null;
+            }
+            if (this.eventSource) {
+                this.eventSource.close();
+                this.eventSource = null;
+            }
+            if (this.pollingTimeout) {
+                clearTimeout(this.pollingTimeout);
+                this.pollingTimeout = null;
+            }
+            if (this.pollingController) {
+                this.pollingController.abort();
+                this.pollingController = null;
+            }
         }
 
         /**
          * ポーリング - PCの状態を取得
+         *
+         * 前回のバージョンを送り、状態が変わるまでサーバーに応答を保留させる。
+         * 応答を受けたらすぐに次のリクエストを送る（エラー時は少し待つ）。
          */
         async poll() {
             if (!this.isConnected || !this.sessionId) return;
 
+            const body = { session_id: this.sessionId };
+            if (this.stateVersion !== null) {
+                body.version = this.stateVersion;
+                body.wait = this.pollingWait;
+            }
+
+            const controller = new AbortController();
+            this.pollingController = controller;
+            let delay = 0;
+
             try {
                 const response = await fetch('/mobile/api/poll/', {
                     method: 'POST',
                     headers: {
                         'Content-Type': 'application/json',
                     },
-                    body: JSON.stringify({ session_id: this.sessionId })
+                    body: JSON.stringify(body),
+                    signal: controller.signal
                 });
 
                 if (response.ok) {
-                    const data = await response.json();
-
-                    // カメラフレームを更新
-                    if (data.camera_frame) {
-                        this.displayCameraFrame(data.camera_frame);
-                    }
-
+                    this.applyState(await response.json());
                     this.updateActivity(true);
                 } else {
                     console.error('ポーリングエラー:', response.status);
                     this.updateActivity(false);
+                    delay = this.pollingRetryDelay;
                 }
             } catch (error) {
+                if (error.name === 'AbortError') return;
                 console.error('ポーリングエラー:', error);
                 this.updateActivity(false);
+                delay = this.pollingRetryDelay;
+            } finally {
+                if (this.pollingController === controller) {
+                    this.pollingController = null;
+                }
+            }
+
+            if (this.isConnected && !controller.signal.aborted) {
+                this.pollingTimeout = setTimeout(() => this.poll(), delay);
+            }
+        }
+
+        /**
+         * サーバーから受け取った状態を反映
+         * @param {object} data - mobile_poll / mobile_stream の状態
+         */
+        applyState(data) {
+            this.stateVersion = data.version;
+        }
+
+        /**
+         * カメラフレームを取得
+         *
+         * URLを固定し、ブラウザのキャッシュと If-None-Match で
+         * 変わっていないフレームは304で済ませる（ETagが同じなら描き直さない）。
+         * 前の取得が終わっていない場合は取得しない。
+         */
+        async loadCameraFrame() {
+            if (this.cameraLoading) return;
+            this.cameraLoading = true;
+
+            const url = `/mobile/api/camera/?session_id=${encodeURIComponent(this.sessionId)}`;
+            try {
+                const response = await fetch(url, { cache: 'no-cache' });
+                if (!response.ok) return;
+                const frameId = response.headers.get('ETag');
+                if (frameId && frameId === this.cameraFrameId) return;
+                this.cameraFrameId = frameId;
+                this.displayCameraFrame(await response.blob());
+            } catch (error) {
+                console.error('カメラフレーム取得エラー:', error);
+            } finally {
+                this.cameraLoading = false;
             }
         }
 
         /**
          * カメラフレームを表示
-         * @param {string} base64Data - Base64エンコードされた画像データ
+         * @param {Blob} blob - JPEG画像
          */
-        displayCameraFrame(base64Data) {
+        displayCameraFrame(blob) {
             if (!this.cameraContext) return;
 
             const img = new Image();
+            const objectUrl = URL.createObjectURL(blob);
             img.onload = () => {
+                URL.revokeObjectURL(objectUrl);
                 this.cameraCanvas.width = img.width || this.cameraCanvas.width;
                 this.cameraCanvas.height = img.height || this.cameraCanvas.height;
                 this.cameraContext.drawImage(img, 0, 0);
@@ -358,7 +474,8 @@
                     this.cameraPlaceholder.style.display = 'none';
                 }
             };
-            img.src = `data:image/jpeg;base64,${base64Data}`;
+            img.onerror = () => URL.revokeObjectURL(objectUrl);
+            img.src = objectUrl;
         }
 
         /**
@@ -572,10 +689,7 @@
          * クリーンアップ
          */
         cleanup() {
-            if (this.pollingInterval) {
-                clearInterval(this.pollingInterval);
-                this.pollingInterval = null;
-            }
+            this.stopPolling();
             if (this.timerInterval) {
                 clearInterval(this.timerInterval);
                 this.timerInterval = null;
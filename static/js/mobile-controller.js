@@ -78,6 +78,45 @@
         ],
     };
 
+    // タブごとのクライアントIDを保存する sessionStorage のキー
+    const CLIENT_ID_KEY = 'guitarClientId';
+
+    // 同じタブの新しい接続で置き換えられた接続の切断コード
+    const REPLACED_CLOSE_CODE = 4009;
+
+    // 時刻同期をやり直す間隔（ミリ秒）と1回の同期で送ってもらうプローブ数
+    const CLOCK_SYNC_INTERVAL_MS = 60000;
+    const CLOCK_SYNC_SAMPLES = 5;
+
+    /**
+     * タブごとのクライアントIDを返す（なければ作成して sessionStorage に保存する）
+     *
+     * 接続のたびに送ることで、回線の切り替えなどで切断されずに残った
+     * 同じタブの古い接続をサーバーが置き換えられるようにする。
+     * @returns {string} クライアントID
+     */
+    function loadClientId() {
+        let clientId = null;
+        try {
+            clientId = window.sessionStorage.getItem(CLIENT_ID_KEY);
+        } catch (error) {
+            // sessionStorage が使えない場合はページ内でのみ保持する
+        }
+        if (clientId) {
+            return clientId;
+        }
+
+        const bytes = new Uint8Array(16);
+        window.crypto.getRandomValues(bytes);
+        clientId = Array.from(bytes, (b) => b.toString(16).padStart(2, '0')).join('');
+        try {
+            window.sessionStorage.setItem(CLIENT_ID_KEY, clientId);
+        } catch (error) {
+            // 保存できない場合も、このページの接続では同じIDを使う
+        }
+        return clientId;
+    }
+
     class MobileController {
         constructor() {
             // DOM要素
@@ -106,12 +145,29 @@
             this.isConnected = false;
             this.reconnectAttempts = 0;
             this.maxReconnectAttempts = 3;
+            this.clientId = loadClientId();
+
+            // ドレイン後の再接続（再開トークンと最後に受信した連番）
+            this.lastSeq = 0;
+            this.resumeToken = null;
+            this.resumeDelayMs = null;
+
+            // 時刻同期（サーバーとのRTTと時計のずれ、ミリ秒）。サーバーは
+            // この推定値を chord_change に付けて転送し、PCが遅延の補正に使う
+            this.clockSync = null;
+            this.clockSyncTimer = null;
+
+            // ゲーム状態（サーバーから差分で届く）とバージョン
+            this.gameState = {};
+            this.gameVersion = 0;
 
             // 練習セッション
             this.isPracticing = false;
             this.practiceStartTime = null;
             this.timerInterval = null;
             this.currentChord = null;
+            this.practicedChords = new Set();
+            this.practiceSessionId = null;
 
             // カメラ
             this.cameraContext = null;
@@ -136,6 +192,8 @@
                 if (document.hidden && this.isPracticing) {
                     this.showWarning('練習中に画面を離れました');
                 }
+                // バックグラウンドの間はカメラフレームの配信を止めてもらう
+                this.sendIdleState();
             });
         }
 
@@ -310,10 +368,17 @@
 
             // WebSocket接続
             const wsProtocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
-            const wsUrl = `${wsProtocol}//${window.location.host}/ws/guitar/${sessionId}/`;
+            let wsUrl = `${wsProtocol}//${window.location.host}/ws/guitar/${sessionId}/?role=mobile`;
+            wsUrl += `&client_id=${encodeURIComponent(this.clientId)}`;
+            if (this.resumeToken) {
+                wsUrl += `&resume=${encodeURIComponent(this.resumeToken)}&last_seq=${this.lastSeq}`;
+                this.resumeToken = null;
+            }
 
             try {
                 this.ws = new WebSocket(wsUrl);
+                this.ws.binaryType = 'arraybuffer';
+                const socket = this.ws;
 
                 this.ws.onopen = () => {
                     console.log('WebSocket接続確立');
@@ -329,9 +394,13 @@
                     this.onWebSocketError();
                 };
 
-                this.ws.onclose = () => {
+                this.ws.onclose = (event) => {
                     console.log('WebSocket接続終了');
-                    this.onWebSocketDisconnect();
+                    // 既に新しい接続に切り替えた古い接続の切断は無視する
+                    if (socket !== this.ws) {
+                        return;
+                    }
+                    this.onWebSocketDisconnect(event.code);
                 };
 
             } catch (error) {
@@ -351,6 +420,67 @@
             this.updateActivity(true);
             this.showMessage('接続に成功しました！', 'success');
             this.enableController();
+            this.startClockSync();
+            if (document.hidden) {
+                this.sendIdleState();
+            }
+        }
+
+        /**
+         * 時刻同期を開始し、一定間隔でやり直す
+         */
+        startClockSync() {
+            this.stopClockSync();
+            this.requestClockSync();
+            this.clockSyncTimer = setInterval(() => {
+                this.requestClockSync();
+            }, CLOCK_SYNC_INTERVAL_MS);
+        }
+
+        /**
+         * 時刻同期の定期実行を止める
+         */
+        stopClockSync() {
+            if (this.clockSyncTimer) {
+                clearInterval(this.clockSyncTimer);
+                this.clockSyncTimer = null;
+            }
+        }
+
+        /**
+         * サーバーに時刻同期を要求する
+         * @param {number} samples - プローブ数
+         */
+        requestClockSync(samples = CLOCK_SYNC_SAMPLES) {
+            if (this.ws && this.ws.readyState === WebSocket.OPEN) {
+                this.ws.send(JSON.stringify({
+                    type: 'clock_sync',
+                    data: { samples: samples }
+                }));
+            }
+        }
+
+        /**
+         * 時刻同期のプローブに受信時刻と送信時刻を付けて応答する
+         * @param {Object} probe - プローブ（id, t0）
+         */
+        replyClockProbe(probe) {
+            const receivedAt = Date.now();
+            if (this.ws && this.ws.readyState === WebSocket.OPEN) {
+                this.ws.send(JSON.stringify({
+                    type: 'clock_probe',
+                    data: { id: probe.id, t1: receivedAt, t2: Date.now() }
+                }));
+            }
+        }
+
+        /**
+         * バックグラウンド状態（idle）をサーバーに送信する
+         */
+        sendIdleState() {
+            if (this.isConnected && this.ws && this.ws.readyState === WebSocket.OPEN) {
+                this.ws.send(JSON.stringify({ type: 'idle', data: { idle: document.hidden } }));
+            }
         }
 
         /**
@@ -364,13 +494,33 @@
 
         /**
          * WebSocket切断時の処理
+         * @param {number} code - 切断コード
          */
-        onWebSocketDisconnect() {
+        onWebSocketDisconnect(code) {
             this.isConnected = false;
+            this.stopClockSync();
             this.updateConnectionStatus(false);
             this.updateActivity(false);
             this.disableController();
 
+            // 同じタブの新しい接続に置き換えられた場合は再接続しない
+            if (code === REPLACED_CLOSE_CODE) {
+                this.showMessage('別の画面で接続されたため切断しました', 'info');
+                this.resetConnectButton();
+                return;
+            }
+
+            // サーバーのドレインによる切断は、練習を続けたまま再接続する
+            if (this.resumeDelayMs !== null) {
+                const delay = this.resumeDelayMs;
+                this.resumeDelayMs = null;
+                this.showMessage('サーバーを切り替えています...', 'info');
+                setTimeout(() => {
+                    this.connectWebSocket();
+                }, delay);
+                return;
+            }
+
             if (this.isPracticing) {
                 this.stopPractice();
             }
@@ -395,14 +545,36 @@
          * @param {string} data - 受信したJSONデータ
          */
         handleWebSocketMessage(data) {
+            // バイナリフレームはカメラフレームとして処理
+            if (data instanceof ArrayBuffer) {
+                this.handleBinaryCameraFrame(data);
+                return;
+            }
+
             try {
                 const message = JSON.parse(data);
 
+                if (typeof message.seq === 'number') {
+                    this.lastSeq = Math.max(this.lastSeq, message.seq);
+                }
+
                 switch (message.type) {
                     case 'connection_update':
                         this.handleConnectionUpdate(message);
                         break;
 
+                    case 'reconnect':
+                        // 切断後、指定された時間だけ待って再開トークンで再接続する
+                        this.resumeToken = message.data.resume_token;
+                        this.resumeDelayMs = message.data.retry_after_ms || 0;
+                        break;
+
+                    case 'resumed':
+                        if (!message.data.complete) {
+                            console.warn('再接続中のイベントの一部を再送できませんでした');
+                        }
+                        break;
+
                     case 'chord_change':
                         this.handleChordChange(message);
                         break;
@@ -411,6 +583,15 @@
                         this.handlePracticeUpdate(message);
                         break;
 
+                    case 'practice_saved':
+                        // 保存された練習セッションのID（終了時に指定する）
+                        if (message.data.status === 'started') {
+                            this.practiceSessionId = message.data.session_id;
+                        } else {
+                            this.practiceSessionId = null;
+                        }
+                        break;
+
                     case 'camera_frame':
                         this.handleCameraFrame(message);
                         break;
@@ -423,6 +604,10 @@
                         this.handleGameUpdate(message);
                         break;
 
+                    case 'game_state':
+                        this.handleGameState(message);
+                        break;
+
                     case 'judgement':
                         this.handleJudgement(message);
                         break;
@@ -431,6 +616,19 @@
                         // Pingに対するPong応答 - 無視
                         break;
 
+                    case 'clock_probe':
+                        this.replyClockProbe(message.data);
+                        break;
+
+                    case 'clock_sync':
+                        this.clockSync = message.data;
+                        break;
+
+                    case 'heartbeat':
+                        // 応答しない接続はサーバーに切断される
+                        this.ws.send(JSON.stringify({ type: 'heartbeat' }));
+                        break;
+
                     case 'error':
                         this.showMessage(message.message || 'エラーが発生しました', 'error');
                         break;
@@ -508,6 +706,45 @@
             this.updateActivity(true);
         }
 
+        /**
+         * バイナリカメラフレームを処理する
+         * ヘッダー: version(1B) codec(1B) seq(4B) width(2B) height(2B)
+         * @param {ArrayBuffer} buffer - 受信したフレーム
+         */
+        handleBinaryCameraFrame(buffer) {
+            if (!this.cameraContext || buffer.byteLength <= 10) return;
+
+            const view = new DataView(buffer);
+            const codec = view.getUint8(1);
+            const seq = view.getUint32(2);
+            const width = view.getUint16(6);
+            const height = view.getUint16(8);
+            const mimeType = codec === 2 ? 'image/webp' : 'image/jpeg';
+            const blob = new Blob([buffer.slice(10)], { type: mimeType });
+            const url = URL.createObjectURL(blob);
+
+            const img = new Image();
+            img.onload = () => {
+                URL.revokeObjectURL(url);
+                if (this.cameraCanvas) {
+                    this.cameraCanvas.width = width || this.cameraCanvas.width;
+                    this.cameraCanvas.height = height || this.cameraCanvas.height;
+                    this.cameraContext.drawImage(img, 0, 0, this.cameraCanvas.width, this.cameraCanvas.height);
+
+                    if (this.cameraPlaceholder) {
+                        this.cameraPlaceholder.style.display = 'none';
+                    }
+                }
+                // 表示したフレームを通知する（サーバーは応答時間から配信品質を選ぶ）
+                if (this.ws && this.ws.readyState === WebSocket.OPEN) {
+                    this.ws.send(JSON.stringify({ type: 'frame_ack', data: { seq } }));
+                }
+            };
+            img.src = url;
+
+            this.updateActivity(true);
+        }
+
         /**
          * ゲームモード変更を処理する
          * @param {Object} message - ゲームモードメッセージ
@@ -525,11 +762,70 @@
         }
 
         /**
-         * ゲーム状態更新を処理する
-         * @param {Object} message - ゲーム更新メッセージ
+         * ゲーム状態の差分を処理する
+         * 適用前のバージョンが手元のバージョンと異なる場合は取りこぼしがあるため、
+         * 差分は使わずに全体（game_state）を要求する
+         * @param {Object} message - ゲーム更新メッセージ（data は差分）
          */
         handleGameUpdate(message) {
-            const data = message.data;
+            if (message.version !== undefined) {
+                if (message.base !== this.gameVersion) {
+                    this.requestGameSync();
+                    return;
+                }
+                this.gameVersion = message.version;
+            }
+
+            this.gameState = this.mergePatch(this.gameState, message.data);
+            this.renderGameState(this.gameState);
+        }
+
+        /**
+         * ゲーム状態の全体（スナップショット）を処理する
+         * @param {Object} message - ゲーム状態メッセージ
+         */
+        handleGameState(message) {
+            this.gameState = message.data || {};
+            this.gameVersion = message.version || 0;
+            this.renderGameState(this.gameState);
+        }
+
+        /**
+         * ゲーム状態の全体を要求する
+         */
+        requestGameSync() {
+            if (this.ws && this.ws.readyState === WebSocket.OPEN) {
+                this.ws.send(JSON.stringify({ type: 'game_sync' }));
+            }
+        }
+
+        /**
+         * 差分（JSON Merge Patch）を適用した新しいオブジェクトを返す
+         * @param {Object} target - 現在の状態
+         * @param {Object} patch - 差分（null はキーの削除）
+         * @returns {Object} 適用後の状態
+         */
+        mergePatch(target, patch) {
+            const result = Object.assign({}, target);
+            Object.entries(patch || {}).forEach(([key, value]) => {
+                if (value === null) {
+                    delete result[key];
+                } else if (typeof value === 'object' && !Array.isArray(value)) {
+                    const current = result[key];
+                    const base = current && typeof current === 'object' && !Array.isArray(current) ? current : {};
+                    result[key] = this.mergePatch(base, value);
+                } else {
+                    result[key] = value;
+                }
+            });
+            return result;
+        }
+
+        /**
+         * ゲーム状態を表示に反映する
+         * @param {Object} data - ゲーム状態
+         */
+        renderGameState(data) {
 
             // スコア表示を更新
             const scoreElement = document.getElementById('game-score');
@@ -686,6 +982,9 @@
          */
         updateCurrentChord(chordName) {
             this.currentChord = chordName;
+            if (this.isPracticing) {
+                this.practicedChords.add(chordName);
+            }
 
             // コード表示を更新
             if (this.currentChordDisplay) {
@@ -712,6 +1011,8 @@
 
             this.isPracticing = true;
             this.practiceStartTime = new Date();
+            this.practicedChords = new Set();
+            this.practiceSessionId = null;
 
             // メッセージを送信
             const message = {
@@ -741,10 +1042,14 @@
 
             this.isPracticing = false;
 
-            // メッセージを送信
+            // メッセージを送信（練習セッションはサーバー側で保存される）
             const message = {
                 type: 'practice_end',
-                data: { timestamp: Date.now() }
+                data: {
+                    timestamp: Date.now(),
+                    chords: Array.from(this.practicedChords),
+                    session_id: this.practiceSessionId
+                }
             };
 
             this.ws.send(JSON.stringify(message));
@@ -877,6 +1182,7 @@
          */
         cleanup() {
             this.stopTimer();
+            this.stopClockSync();
 
             if (this.ws) {
                 this.ws.close();
@@ -884,6 +1190,9 @@
         }
     }
 
+    // テストから利用できるよう公開する
+    window.MobileController = MobileController;
+
     // ページ読み込み時に初期化
     document.addEventListener('DOMContentLoaded', function() {
         window.mobileController = new MobileController();
@@ -270,6 +270,28 @@ describe('RhythmGame', () => {
         });
     });
 
+    describe('handleStrum()', () => {
+        it('中継されたコードの遅延で判定時刻が補正されること', () => {
+            game.isPlaying = true;
+            game.isPaused = false;
+            game.cameraEnabled = true;
+            game.clockSync = { rtt: 20, offset: 0 };
+            spyOn(game, 'showCurrentChord');
+            spyOn(game, 'handleInput');
+
+            // 送信者（スマホ）の推定値が clock で届く
+            game.handleWebSocketMessage({
+                type: 'chord_change',
+                data: { chord: 'G' },
+                clock: { rtt: 40, offset: 0 }
+            });
+            game.handleStrum(1.0);
+
+            // (40 + 20) / 2 = 30ms
+            expect(game.handleInput).toHaveBeenCalledWith('G', 30);
+        });
+    });
+
     describe('getStats()', () => {
         it('統計情報が正しく取得されること', () => {
             game.stats = {
@@ -0,0 +1,107 @@
+/**
+ * テスト: モバイルコントローラー (mobile-controller.js)
+ *
+ * 時刻同期と、PC側での中継遅延の補正に使われる推定値をテストする
+ */
+
+describe('MobileController', () => {
+    let controller;
+    let sent;
+
+    beforeEach(() => {
+        // DOMに依存する初期化は行わず、WebSocketだけをモックにする
+        controller = Object.create(window.MobileController.prototype);
+        controller.clockSync = null;
+        controller.clockSyncTimer = null;
+        controller.isConnected = true;
+        controller.currentChord = null;
+        controller.lastSeq = 0;
+        sent = [];
+        controller.ws = {
+            readyState: WebSocket.OPEN,
+            send: (data) => sent.push(JSON.parse(data))
+        };
+    });
+
+    afterEach(() => {
+        controller.stopClockSync();
+    });
+
+    describe('時刻同期', () => {
+        it('clock_probe に受信時刻と送信時刻を付けて応答すること', () => {
+            controller.handleWebSocketMessage(JSON.stringify({
+                type: 'clock_probe',
+                data: { id: 3, t0: 1000 }
+            }));
+
+            expect(sent.length).toBe(1);
+            expect(sent[0].type).toBe('clock_probe');
+            expect(sent[0].data.id).toBe(3);
+            expect(typeof sent[0].data.t1).toBe('number');
+            expect(sent[0].data.t2).not.toBeLessThan(sent[0].data.t1);
+        });
+
+        it('clock_sync の推定値を保持すること', () => {
+            controller.handleWebSocketMessage(JSON.stringify({
+                type: 'clock_sync',
+                data: { rtt: 40, offset: 3, samples: 5 }
+            }));
+
+            expect(controller.clockSync).toEqual({ rtt: 40, offset: 3, samples: 5 });
+        });
+
+        it('同期を開始すると要求を送り、一定間隔でやり直すこと', () => {
+            jasmine.clock().install();
+            try {
+                controller.startClockSync();
+                expect(sent).toEqual([{ type: 'clock_sync', data: { samples: 5 } }]);
+
+                jasmine.clock().tick(60000);
+                expect(sent.length).toBe(2);
+
+                controller.stopClockSync();
+                jasmine.clock().tick(60000);
+                expect(sent.length).toBe(2);
+            } finally {
+                jasmine.clock().uninstall();
+            }
+        });
+    });
+
+    describe('中継遅延の補正', () => {
+        it('スマホの推定値が付いた chord_change でPCの判定時刻が補正されること', () => {
+            spyOn(controller, 'updateCurrentChord');
+            spyOn(controller, 'renderFretboardDiagram');
+
+            // スマホが時刻同期を終え、コードを送信する
+            controller.handleWebSocketMessage(JSON.stringify({
+                type: 'clock_sync',
+                data: { rtt: 40, offset: 3, samples: 5 }
+            }));
+            controller.selectChord('G');
+            const chordChange = sent.find((message) => message.type === 'chord_change');
+
+            // サーバーは送信者の推定値（clock_sync と同じ形式）と連番を付けて転送する
+            const relayed = Object.assign({}, chordChange, {
+                clock: controller.clockSync,
+                seq: 1
+            });
+
+            const mockCanvas = document.createElement('canvas');
+            mockCanvas.getContext = () => ({});
+            const game = new RhythmGame(mockCanvas);
+            game.isPlaying = true;
+            game.isPaused = false;
+            game.cameraEnabled = true;
+            game.clockSync = { rtt: 20, offset: 0, samples: 5 };
+            spyOn(game, 'showCurrentChord');
+            spyOn(game, 'handleInput');
+
+            game.handleWebSocketMessage(relayed);
+            game.handleStrum(1.0);
+
+            // (40 + 20) / 2 = 30ms
+            expect(game.handleInput).toHaveBeenCalledWith('G', 30);
+        });
+    });
+});